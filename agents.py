@@ -0,0 +1,234 @@
+"""Module with the single-call expense extraction agents of vaani_functions.ipynb, async over the shared chat providers"""
+import json
+import re
+import time
+import traceback
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+from constants.talk2bill.vyapar.prompts import (
+    AGENT_BASIC_EXTRACTOR_PROMPT,
+    AGENT_SMART_CATEGORIZER_PROMPT,
+    AGENT_SMART_CATEGORIZER_CONTEXT,
+    AGENT_MULTI_ITEM_PROMPT
+)
+from crons.talk2bill.vyapar.env import env_str
+from crons.talk2bill.vyapar.providers import ChatProvider, get_provider_for_model
+from logger.logger import Logger
+
+# The model of agent calls that do not name one (the notebook registry's default_model)
+DEFAULT_AGENT_MODEL = env_str("VYAPAR_T2B_AGENT_MODEL", "gpt-4o-mini")
+AGENT_TEMPERATURE = 0.3
+AGENT_MAX_TOKENS = 500
+MULTI_ITEM_MAX_TOKENS = 800
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class Agent(str, Enum):
+    """
+    The extraction agents
+    """
+    BASIC_EXTRACTOR = "basic_extractor"
+    SMART_CATEGORIZER = "smart_categorizer"
+    MULTI_ITEM_HANDLER = "multi_item_handler"
+
+
+def build_agent_prompt(agent: Agent, voice_input: str, excel_db_context: Optional[str] = None) -> str:
+    """
+    Build the prompt of an agent
+
+    Args:
+        agent: The agent
+        voice_input: The voice transcription
+        Optional[excel_db_context]: The categories of similar businesses, for the smart categorizer
+
+    Returns:
+        The prompt
+    """
+    if agent == Agent.MULTI_ITEM_HANDLER:
+        return AGENT_MULTI_ITEM_PROMPT.format(voice_input=voice_input)
+    if agent == Agent.SMART_CATEGORIZER:
+        context_section = ""
+        if excel_db_context:
+            context_section = AGENT_SMART_CATEGORIZER_CONTEXT.format(excel_db_context=excel_db_context)
+        return AGENT_SMART_CATEGORIZER_PROMPT.format(voice_input=voice_input, context_section=context_section)
+    return AGENT_BASIC_EXTRACTOR_PROMPT.format(voice_input=voice_input)
+
+
+def choose_agent(voice_input: str) -> Agent:
+    """
+    Route an input: several items (a comma, "and"/"aur", more than six digits) go to the
+    multi-item handler, anything else to the basic extractor
+    """
+    voice_lower = voice_input.lower()
+    has_comma = "," in voice_input
+    has_and = " and " in voice_lower or " aur " in voice_lower
+    number_count = sum(character.isdigit() for character in voice_input)
+    if has_comma or has_and or number_count > 6:
+        return Agent.MULTI_ITEM_HANDLER
+    return Agent.BASIC_EXTRACTOR
+
+
+def parse_json_reply(text: str) -> Dict[str, Any]:
+    """
+    Parse the JSON object of a model reply, ignoring markdown fences and surrounding prose
+
+    Raises:
+        ValueError: The reply holds no JSON object
+    """
+    match = JSON_OBJECT_PATTERN.search(text)
+    if match is None:
+        raise ValueError(f"No JSON object in the reply: {text[:200]!r}")
+    return json.loads(match.group(0))
+
+
+async def run_agent(
+    agent: Agent,
+    voice_input: str,
+    model: Optional[str] = None,
+    provider: Optional[ChatProvider] = None,
+    excel_db_context: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Call an agent
+
+    Args:
+        agent: The agent
+        voice_input: The voice transcription
+        Optional[model]: The model, else VYAPAR_T2B_AGENT_MODEL
+        Optional[provider]: The provider to call, else the shared one serving the model
+        Optional[excel_db_context]: The categories of similar businesses, for the smart categorizer
+
+    Returns:
+        The extracted fields with `raw_response`, `model_used` and `time_taken`, or `error`,
+        `model_used` and `time_taken` when the call or its JSON failed
+    """
+    model = model or DEFAULT_AGENT_MODEL
+    prompt = build_agent_prompt(agent, voice_input, excel_db_context)
+    max_tokens = MULTI_ITEM_MAX_TOKENS if agent == Agent.MULTI_ITEM_HANDLER else AGENT_MAX_TOKENS
+    start_time = time.time()
+    try:
+        provider = provider or get_provider_for_model(model)
+        raw_response = await provider.complete(prompt, model, AGENT_TEMPERATURE, max_tokens)
+        time_taken = time.time() - start_time
+        extracted = parse_json_reply(raw_response)
+    except Exception as e:  # pylint: disable=broad-except
+        Logger.warn({
+            "message": "Agent call failed",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "agent": agent.value,
+                "model": model,
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            }
+        })
+        return {
+            "error": str(e),
+            "model_used": model,
+            "time_taken": round(time.time() - start_time, 2)
+        }
+
+    if agent == Agent.MULTI_ITEM_HANDLER:
+        extracted["item_count"] = len(extracted.get("items", []))
+    if agent == Agent.SMART_CATEGORIZER:
+        extracted["used_context"] = excel_db_context is not None
+    extracted["raw_response"] = raw_response
+    extracted["model_used"] = model
+    extracted["time_taken"] = round(time_taken, 2)
+    return extracted
+
+
+async def agent_basic_extractor(
+    voice_input: str,
+    model: Optional[str] = None,
+    provider: Optional[ChatProvider] = None
+) -> Dict[str, Any]:
+    """
+    Extract the amount, item and category of a simple input ("chai samosa 140 rupees")
+
+    Returns:
+        {"amount": 140, "item": "Chai Samosa", "category": "Food", "raw_response": ...,
+        "model_used": "gpt-4o-mini", "time_taken": 1.2}
+    """
+    return await run_agent(Agent.BASIC_EXTRACTOR, voice_input, model, provider)
+
+
+async def agent_smart_categorizer(
+    voice_input: str,
+    excel_db_context: Optional[str] = None,
+    model: Optional[str] = None,
+    provider: Optional[ChatProvider] = None
+) -> Dict[str, Any]:
+    """
+    Extract like agent_basic_extractor, choosing among the categories of similar businesses
+
+    Returns:
+        The fields of agent_basic_extractor and `used_context`
+    """
+    return await run_agent(Agent.SMART_CATEGORIZER, voice_input, model, provider, excel_db_context)
+
+
+async def agent_multi_item_handler(
+    voice_input: str,
+    model: Optional[str] = None,
+    provider: Optional[ChatProvider] = None
+) -> Dict[str, Any]:
+    """
+    Extract every item of an input ("chai 60 rupees, samosa 80 rupees")
+
+    Returns:
+        {"items": [{"amount": 60, "item": "Chai", "category": "Food"}, ...], "total_amount": 140,
+        "item_count": 2, "raw_response": ..., "model_used": "gpt-4o-mini", "time_taken": 1.5}
+    """
+    return await run_agent(Agent.MULTI_ITEM_HANDLER, voice_input, model, provider)
+
+
+async def route_to_agent(
+    voice_input: str,
+    model: Optional[str] = None,
+    provider: Optional[ChatProvider] = None
+) -> Dict[str, Any]:
+    """
+    Call the agent choose_agent picks for the input
+
+    Returns:
+        The result of the agent with `agent_used`
+    """
+    agent = choose_agent(voice_input)
+    result = await run_agent(agent, voice_input, model, provider)
+    result["agent_used"] = agent.value
+    return result
+
+
+def format_amount(amount: Any) -> Optional[float]:
+    """
+    Convert an amount ("₹1,500", 1500) to a float, None when it is not a number
+    """
+    try:
+        if isinstance(amount, str):
+            amount = amount.replace("₹", "").replace(",", "").strip()
+        return float(amount)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_extraction(result: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    """
+    Validate the result of a single-item agent
+
+    Returns:
+        Whether it is valid, and its errors
+    """
+    errors = []
+    if "error" in result:
+        errors.append(f"API Error: {result['error']}")
+        return False, errors
+    if "amount" not in result:
+        errors.append("Missing amount")
+    elif not isinstance(result["amount"], (int, float)):
+        errors.append("Amount is not a number")
+    if "item" not in result:
+        errors.append("Missing item name")
+    elif not result["item"]:
+        errors.append("Item name is empty")
+    return len(errors) == 0, errors
@@ -0,0 +1 @@
+"""Offline benchmarks for the talk2bill pipeline"""
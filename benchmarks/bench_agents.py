@@ -0,0 +1,107 @@
+"""
+Benchmark: the extraction agents of agents.py called sequentially (one awaited call after the
+other, as the notebook does) vs concurrently on the same shared provider, with the wall time,
+throughput, per-call latency and the clients the provider built
+
+The inputs are the cases of eval_cases.json, repeated to --calls, through route_to_agent.
+Offline by default, on a FakeChatProvider with log-normal latency; --live calls the shared
+provider serving --model instead.
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_agents --calls 200 --concurrency 10,50
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Optional
+from crons.talk2bill.vyapar.agents import route_to_agent
+from crons.talk2bill.vyapar.fake_llm import FakeChatProvider, LatencyDistribution
+from crons.talk2bill.vyapar.providers import ChatProvider, close_providers, get_provider_for_model
+from crons.talk2bill.vyapar.benchmarks.eval_runner import FakeAgentResponder, load_cases
+
+
+async def run_calls(inputs: List[str], model: str, provider: ChatProvider, concurrency: Optional[int]) -> dict:
+    """
+    Route every input to its agent, sequentially when `concurrency` is None, else with at most
+    `concurrency` calls in flight
+
+    Returns:
+        The wall time, the per-call latencies and the failed calls
+    """
+    latencies = []
+    failures = 0
+
+    async def call(voice_input: str):
+        nonlocal failures
+        start = time.perf_counter()
+        result = await route_to_agent(voice_input, model, provider)
+        latencies.append(time.perf_counter() - start)
+        failures += "error" in result
+
+    start = time.perf_counter()
+    if concurrency is None:
+        for voice_input in inputs:
+            await call(voice_input)
+    else:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(voice_input: str):
+            async with semaphore:
+                await call(voice_input)
+
+        await asyncio.gather(*(bounded(voice_input) for voice_input in inputs))
+    return {"wall": time.perf_counter() - start, "latencies": sorted(latencies), "failures": failures}
+
+
+async def run(args: argparse.Namespace):
+    """
+    Print one row for the sequential run and one per concurrency level
+    """
+    cases = load_cases()
+    inputs = [cases[index % len(cases)].input for index in range(args.calls)]
+    if args.live:
+        provider = get_provider_for_model(args.model)
+    else:
+        provider = FakeChatProvider(
+            responder=FakeAgentResponder(),
+            model=args.model,
+            latency=LatencyDistribution(args.latency_median, args.latency_sigma, seed=args.seed),
+            error_rate=args.error_rate,
+            seed=args.seed
+        )
+
+    print(f"{len(inputs)} route_to_agent calls on {args.model} ({'live ' + provider.name if args.live else 'fake'})")
+    print(f"{'mode':>14} {'wall s':>8} {'calls/s':>9} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} {'failed':>7}")
+    sequential_wall = None
+    for concurrency in [None] + args.concurrency:
+        result = await run_calls(inputs, args.model, provider, concurrency)
+        latencies = result["latencies"]
+        sequential_wall = sequential_wall or result["wall"]
+        mode = "sequential" if concurrency is None else f"concurrent {concurrency}"
+        print(
+            f"{mode:>14} {result['wall']:8.2f} {len(inputs) / result['wall']:9.1f} "
+            f"{sequential_wall / result['wall']:7.1f}x {latencies[len(latencies) // 2] * 1000:8.1f} "
+            f"{latencies[int(len(latencies) * 0.95)] * 1000:8.1f} {result['failures']:7d}"
+        )
+    print(f"provider: {provider.stats()}")
+    await close_providers()
+
+
+def main():
+    """
+    Compare sequential and concurrent agent calls
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[10, 50])
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--latency-median", type=float, default=0.05)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark: accuracy and latency of the local category index on the playground's CELL 2D
+category cases (registry taxonomy), on the lexicon examples of the extraction prompt and
+across the turns of a session (category aggregation), with the prompt tokens saved by
+leaving category inference out of the extraction prompt
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_categorizer --calls 2000
+"""
+import argparse
+import time
+from typing import Callable, List, Optional, Tuple
+from constants.talk2bill.vyapar.models import ExpenseModel
+from crons.talk2bill.vyapar.categorizer import CategoryIndex, LocalCategorizer
+from crons.talk2bill.vyapar.prompt_builder import Talk2BillPromptBuilder
+from crons.talk2bill.vyapar.tokens import estimate_tokens
+
+# vaani_playground.ipynb, CELL 2D: input → expected registry category
+CELL_2D_CASES: List[Tuple[str, str]] = [
+    ("chai 50 rupees", "Tea Coffee"),
+    ("Diesel fuel 500", "Petrol"),
+    ("taxi ke liye 200 diye", "Transport"),
+    ("electricity bill 2500 rupees", "Electricity"),
+    ("internet ka bill 1000", "Internet"),
+    ("courier charges 150", "Freight Courier"),
+    ("office stationery 300", "Stationery"),
+    ("printing 500 rupees", "Printing"),
+    ("mobile recharge 200", "Phone Mobile"),
+    ("GST payment 5000", "GST"),
+]
+# Hinglish item names → expected registry category
+REGISTRY_ITEM_CASES: List[Tuple[List[str], Optional[str]]] = [
+    (["doodh"], "Food Meals"),
+    (["sabzi"], "Food Meals"),
+    (["doodh", "sabzi"], "Food Meals"),
+    (["chai"], "Tea Coffee"),
+]
+# Item names → the category EXPENSE_EXTRACTION_PROMPT_V1 infers with its lexicon
+LEXICON_CASES: List[Tuple[List[str], Optional[str]]] = [
+    (["chai"], "food"),
+    (["coffee", "chai"], "food"),
+    (["apples", "bananas"], "food"),
+    (["doodh", "sabzi"], "food"),
+    (["milk", "petrol"], "daily expense"),
+    (["diesel"], "petrol"),
+    (["bijli"], "utilities"),
+    (["dawai"], "medical"),
+    (["auto"], "transport"),
+    (["office supplies"], "shopping"),
+    (["car"], None),
+]
+# Sessions of (user query, item names after the turn, category the user states): the
+# CATEGORY AGGREGATION rules across turns, with the lexicon categories
+SESSION_CASES: List[Tuple[List[Tuple[str, List[str], Optional[str]]], Optional[str]]] = [
+    ([("chai 40", ["chai"], None), ("add petrol 500", ["chai", "petrol"], None)], "daily expense"),
+    (
+        [
+            ("coffee 50", ["coffee"], None),
+            ("add petrol 500", ["coffee", "petrol"], None),
+            ("remove petrol", ["coffee"], None)
+        ],
+        "food"
+    ),
+    (
+        [("chai 40 under office", ["chai"], "office"), ("add petrol 500", ["chai", "petrol"], None)],
+        "office"
+    ),
+    ([("doodh 30", ["doodh"], None), ("sabzi 60", ["doodh", "sabzi"], None)], "food"),
+]
+HISTORY = [
+    {"user": "Add petrol", "model": "How much did you spend on petrol?"},
+    {"user": "500", "model": "Would you like to add another item?"}
+]
+INVOICE = {
+    "expense_category": "petrol",
+    "items": [{"item_name": "petrol", "item_amount": 500, "item_qty": 1}],
+    "payment_type": "cash"
+}
+
+
+def run_cases(
+    name: str,
+    index: CategoryIndex,
+    cases: List[Tuple[object, Optional[str]]],
+    categorize: Callable[[CategoryIndex, object], object],
+    calls: int
+):
+    """
+    Print the category, confidence and mean latency of each case, then the accuracy
+    """
+    print(f"\n{name}")
+    print(f"{'input':32} {'expected':16} {'got':16} {'conf':>5} {'us':>7}")
+    correct = 0
+    for case, expected in cases:
+        match = categorize(index, case)
+        start = time.perf_counter()
+        for _ in range(calls):
+            categorize(index, case)
+        elapsed_us = (time.perf_counter() - start) / calls * 1e6
+        correct += match.category == expected
+        print(
+            f"{str(case):32} {str(expected):16} {str(match.category):16} "
+            f"{match.confidence:5.2f} {elapsed_us:7.1f}"
+        )
+    print(f"accuracy: {correct}/{len(cases)} ({correct / len(cases):.0%})")
+
+
+def run_sessions(categorizer: LocalCategorizer, cases, calls: int):
+    """
+    Print the category of the last turn of each session, assigned turn by turn, then the accuracy
+    """
+    def replay(turns) -> Optional[str]:
+        invoice = None
+        for user_query, item_names, stated in turns:
+            extracted = ExpenseModel.model_validate({
+                "expense_category": stated,
+                "items": [{"item_name": name, "item_amount": 10, "item_qty": 1} for name in item_names],
+                "payment_type": "cash"
+            })
+            invoice = categorizer.assign(extracted, user_query, invoice)
+        return invoice.expense_category
+
+    print("\nSessions (lexicon)")
+    print(f"{'last turn':32} {'expected':16} {'got':16} {'us':>7}")
+    correct = 0
+    for turns, expected in cases:
+        category = replay(turns)
+        start = time.perf_counter()
+        for _ in range(calls):
+            replay(turns)
+        elapsed_us = (time.perf_counter() - start) / calls * 1e6
+        correct += category == expected
+        print(f"{turns[-1][0]:32} {str(expected):16} {str(category):16} {elapsed_us:7.1f}")
+    print(f"accuracy: {correct}/{len(cases)} ({correct / len(cases):.0%})")
+
+
+def main():
+    """
+    Print the index build time, the per-case accuracy and latency, and the prompt token savings
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry = CategoryIndex.from_registry()
+    registry_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    lexicon = CategoryIndex.from_lexicon()
+    lexicon_ms = (time.perf_counter() - start) * 1000
+    print(f"index build: registry {registry_ms:.2f} ms ({len(registry.phrases)} phrases), "
+          f"lexicon {lexicon_ms:.2f} ms ({len(lexicon.phrases)} phrases)")
+
+    # The inputs are whole utterances, classified as the query fallback of an invoice without items
+    run_cases("CELL 2D (registry)", registry, CELL_2D_CASES, lambda index, text: index.categorize([], text), args.calls)
+    run_cases("Registry items", registry, REGISTRY_ITEM_CASES, lambda index, names: index.categorize(names), args.calls)
+    run_cases("Extraction lexicon", lexicon, LEXICON_CASES, lambda index, names: index.categorize(names), args.calls)
+    run_sessions(LocalCategorizer(lexicon), SESSION_CASES, args.calls)
+
+    llm_tokens = estimate_tokens(
+        Talk2BillPromptBuilder.build_expense_extraction_prompt("add chai 50 also", INVOICE, HISTORY)
+    )
+    local_tokens = estimate_tokens(
+        Talk2BillPromptBuilder.build_expense_extraction_prompt("add chai 50 also", INVOICE, HISTORY, local_category=True)
+    )
+    print(f"\nextraction prompt tokens: LLM category {llm_tokens}, local category {local_tokens} "
+          f"(-{llm_tokens - local_tokens}, {1 - local_tokens / llm_tokens:.1%})")
+
+
+if __name__ == "__main__":
+    main()
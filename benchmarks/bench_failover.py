@@ -0,0 +1,160 @@
+"""
+Benchmark: availability of LLMService through a scripted outage of its primary provider, with
+and without a provider chain, fully offline
+
+The intent calls of talk2bill_sessions.json are replayed in four phases against a FakeChatModel
+primary (the Gemini stand-in): healthy, outage (every call fails with a 503), slow (latency
+above the failover threshold) and recovered. The chain's fallback is a FakeChatProvider behind
+the structured-output adapter (the OpenAI/Anthropic path). Each phase reports the calls that
+succeeded, the provider that served them and the latency percentiles; with the chain, traffic
+should leave the primary during the outage and the slow phase and come back once it recovers.
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_failover --phase-calls 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional
+from crons.talk2bill.vyapar.fake_llm import FakeChatModel, FakeChatProvider, LatencyDistribution
+from crons.talk2bill.vyapar.hedging import Hedger
+from crons.talk2bill.vyapar.llm_service import LLMService
+from crons.talk2bill.vyapar.provider_chain import ChainMember, ProviderChain, StructuredOutputAdapter
+from crons.talk2bill.vyapar.retry_policy import CircuitBreaker
+from crons.talk2bill.vyapar.benchmarks.corpus import CorpusResponder, load_sessions
+
+# phase -> (primary error rate, primary median latency multiplier)
+PHASES = [("healthy", 0.0, 1.0), ("outage", 1.0, 1.0), ("slow", 0.0, 8.0), ("recovered", 0.0, 1.0)]
+
+
+def build_service(args: argparse.Namespace, sessions: List[Dict], chained: bool) -> LLMService:
+    """
+    Build an LLMService on a fake primary, with a fake fallback provider when `chained`
+    """
+    responder = CorpusResponder(sessions)
+    primary = FakeChatModel(
+        responder=responder,
+        model="fake-gemini",
+        latency=LatencyDistribution(args.latency_median, seed=args.seed),
+        seed=args.seed,
+        record_calls=False
+    )
+    provider_chain = None
+    if chained:
+        fallback = FakeChatProvider(
+            structured_responder=responder,
+            name="fake-openai",
+            model="fake-gpt",
+            latency=LatencyDistribution(args.latency_median * 1.5, seed=args.seed),
+            seed=args.seed
+        )
+        provider_chain = ProviderChain(
+            [
+                ChainMember(name="fake-gemini", llm=primary, model=primary.model),
+                ChainMember(name="fake-openai", llm=StructuredOutputAdapter(fallback), model=fallback.model)
+            ],
+            error_rate_threshold=args.error_rate_threshold,
+            latency_threshold=args.latency_threshold,
+            min_calls=args.min_calls,
+            window_seconds=args.window,
+            recovery_after=args.recovery_after
+        )
+    llm_service = LLMService(
+        llm=primary,
+        hedger=Hedger(call_timeout=args.call_timeout, hedge_percentile=None),
+        provider_chain=provider_chain
+    )
+    # A breaker of its own, so one run does not inherit the other's open circuit
+    llm_service.circuit_breaker = CircuitBreaker(open_duration=args.recovery_after)
+    return llm_service
+
+
+async def run_phase(llm_service: LLMService, queries: List[str], concurrency: int) -> Dict:
+    """
+    Classify the intent of every query, at most `concurrency` at a time
+
+    Returns:
+        The successful and failed calls, latency percentiles in ms and the wall time
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def call(query: str):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await llm_service.identify_intent(query, [])
+                latencies.append(time.perf_counter() - start)
+            except Exception:  # pylint: disable=broad-except
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(query) for query in queries))
+    latencies.sort()
+    return {
+        "ok": len(latencies),
+        "failed": failures,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        "wall": time.perf_counter() - start
+    }
+
+
+def served_by(llm_service: LLMService) -> Optional[Dict[str, int]]:
+    chain = llm_service.provider_chain
+    if chain is None:
+        return None
+    return {name: member.calls - member.failures for name, member in chain.members.items()}
+
+
+async def run(args: argparse.Namespace):
+    """
+    Print the phases of the outage without and with the provider chain
+    """
+    sessions = load_sessions()
+    queries = [turn["user_query"] for session in sessions for turn in session["turns"]]
+    queries = [queries[index % len(queries)] for index in range(args.phase_calls)]
+
+    for chained in (False, True):
+        llm_service = build_service(args, sessions, chained)
+        primary = llm_service.llm
+        print(f"\n{'with' if chained else 'without'} provider chain")
+        print(f"{'phase':>10} {'ok':>5} {'failed':>6} {'p50 ms':>8} {'p95 ms':>8} {'wall s':>7}  served by")
+        for phase, error_rate, latency_factor in PHASES:
+            primary.error_rate = error_rate
+            primary.latency.median = args.latency_median * latency_factor
+            before = served_by(llm_service)
+            result = await run_phase(llm_service, queries, args.concurrency)
+            after = served_by(llm_service)
+            served = {name: after[name] - before[name] for name in after} if after is not None else "primary"
+            print(f"{phase:>10} {result['ok']:5d} {result['failed']:6d} {result['p50_ms']:8.1f} "
+                  f"{result['p95_ms']:8.1f} {result['wall']:7.2f}  {served}")
+            if phase != PHASES[-1][0]:
+                # Past the recovery delay, so the next phase starts with a probe of the primary
+                await asyncio.sleep(args.recovery_after)
+        if chained:
+            print(f"chain: {llm_service.provider_chain.stats()}")
+
+
+def main():
+    """
+    Replay the outage phases and print the availability of each setup
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phase-calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-median", type=float, default=0.05)
+    parser.add_argument("--call-timeout", type=float, default=5.0)
+    parser.add_argument("--error-rate-threshold", type=float, default=0.5)
+    parser.add_argument("--latency-threshold", type=float, default=0.25)
+    parser.add_argument("--min-calls", type=int, default=10)
+    parser.add_argument("--window", type=float, default=5.0)
+    parser.add_argument("--recovery-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: throughput of the deterministic hint pre-parser over a large transcript corpus,
+the share of inputs it is sure enough to extract without the LLM, and how often those
+direct parses match the expected items and payment method
+
+The corpus is the user queries of talk2bill_sessions.json plus generated Hinglish/English
+expense utterances (amount, quantity and payment phrasings of the extraction prompt) with
+known answers.
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_hint_parser --utterances 100000
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from crons.talk2bill.vyapar.benchmarks.corpus import load_sessions
+from crons.talk2bill.vyapar.hint_parser import HintParser
+
+ITEMS = ["chai", "coffee", "milk", "doodh", "sabzi", "petrol", "diesel", "taxi", "rice", "bread",
+         "electricity bill", "internet bill", "courier charges", "mobile recharge", "samosa", "apples"]
+# Phrasings of one item, from the AMOUNT EXTRACTION and quantity rules of the extraction prompt
+AMOUNT_FORMATS = ["{item} {amount}", "{item} {amount} rupees", "{item} rs {amount}", "{item} {amount}/-",
+                  "{item} ₹{amount}", "{item} ke liye {amount} diye", "{amount} rupees {item}",
+                  "add {item} {amount}", "{qty} {item} for {amount}", "{qty} {item} {amount} rupees"]
+PAYMENTS = [("", None), (" by card", "card"), (" via phonepe", "phonepe"), (" upi se", "upi"),
+            (" paid through sbi bank", "sbi bank"), (" cash mein", "cash"), (" using paytm", "paytm")]
+QTY_WORDS = {1: "one", 2: "two", 3: "teen", 4: "char", 5: "paanch"}
+# Inputs the parser must leave to the LLM
+HARD_UTTERANCES = ["apples and bananas 50 each", "remove petrol, make milk 25", "put it under office supplies",
+                   "I want to add apple 5000 total and i took 3 kgs", "salary for Ram, Rs 40000",
+                   "2 chai", "chai 20 aur 2 samosa", "tea 20 yesterday 2 times", "chai 20 from 3 shops",
+                   "bus 20 on 5th"]
+
+
+def generate_utterances(count: int, seed: int) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    Generate expense utterances with their expected parse
+
+    Returns:
+        (utterance, {"items": [(name, amount, qty)], "payment_type": ...}) pairs; None for
+        the inputs the parser should not extract alone
+    """
+    rng = random.Random(seed)
+    utterances = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            utterances.append((rng.choice(HARD_UTTERANCES), None))
+            continue
+        items = []
+        parts = []
+        for _ in range(rng.choice([1, 1, 1, 2])):
+            item, amount = rng.choice(ITEMS), rng.choice([20, 40, 50, 140, 200, 450, 1000, 2500])
+            template = rng.choice(AMOUNT_FORMATS)
+            qty = rng.randint(1, 5)
+            qty_text = QTY_WORDS[qty] if rng.random() < 0.5 else str(qty)
+            parts.append(template.format(item=item, amount=amount, qty=qty_text))
+            items.append((item, amount, qty if "{qty}" in template else None))
+        payment_text, payment_type = rng.choice(PAYMENTS)
+        utterances.append((" and ".join(parts) + payment_text, {"items": items, "payment_type": payment_type}))
+    return utterances
+
+
+def matches(hints, expected: Dict[str, Any]) -> bool:
+    """
+    Whether a parse found exactly the expected items and payment method
+    """
+    parsed = [(item.item_name, item.item_amount, item.item_qty) for item in hints.items]
+    return parsed == expected["items"] and hints.payment_type == expected["payment_type"]
+
+
+def main():
+    """
+    Print the parse throughput and latency percentiles, the direct-parse rate and its precision
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--utterances", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = [(turn["user_query"], None) for session in load_sessions() for turn in session["turns"]]
+    utterances = corpus + generate_utterances(args.utterances, args.seed)
+    hint_parser = HintParser()
+
+    latencies = []
+    start = time.perf_counter()
+    results = []
+    for text, expected in utterances:
+        parse_start = time.perf_counter()
+        hints = hint_parser.parse(text)
+        latencies.append(time.perf_counter() - parse_start)
+        results.append((text, expected, hints))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"utterances: {len(utterances)} ({len(corpus)} from the session corpus)")
+    print(f"throughput: {len(utterances) / elapsed:,.0f} parses/s")
+    print(f"latency us: mean {statistics.mean(latencies) * 1e6:.1f}, "
+          f"p50 {latencies[len(latencies) // 2] * 1e6:.1f}, p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f}")
+
+    direct = [(text, expected, hints) for text, expected, hints in results if hint_parser.is_direct(hints)]
+    generated_direct = [(text, expected, hints) for text, expected, hints in direct if expected is not None]
+    hard_direct = [text for text, expected, hints in direct if expected is None and text in HARD_UTTERANCES]
+    correct = sum(matches(hints, expected) for _, expected, hints in generated_direct)
+    print(f"hinted: {hint_parser.stats()['hinted'] / len(utterances):.1%}, "
+          f"direct: {len(direct) / len(utterances):.1%}")
+    print(f"direct parses matching the expected items and payment: "
+          f"{correct}/{len(generated_direct)} ({correct / max(1, len(generated_direct)):.1%})")
+    print(f"inputs needing the LLM parsed directly: {len(hard_direct)}")
+    mismatches = [(text, hints.to_dict()) for text, expected, hints in generated_direct if not matches(hints, expected)]
+    for text, parsed in mismatches[:5]:
+        print(f"  mismatch: {text!r} → {parsed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmark: end-to-end throughput of the talk2bill pipeline, fully offline
+
+Replays the multi-turn sessions of talk2bill_sessions.json against FakeChatModel (log-normal
+latency, injected 503s) and an in-memory Talk2BillRepository, through `Talk2BillPipeline.pipeline`
+directly and through `scheduler.main` batches. Reports jobs/sec, per-turn latency percentiles
+and peak traced memory per concurrency level. Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_pipeline --concurrency 1,10,100,1000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Dict, List
+from crons.talk2bill.vyapar import scheduler
+from crons.talk2bill.vyapar.fake_llm import FakeChatModel, LatencyDistribution
+from crons.talk2bill.vyapar.llm_service import LLMService
+from crons.talk2bill.vyapar.intent_batcher import IntentBatcher
+from crons.talk2bill.vyapar.hedging import Hedger
+from crons.talk2bill.vyapar.talk2bill_pipeline import Talk2BillPipeline
+from crons.talk2bill.vyapar.benchmarks.corpus import CorpusResponder, load_sessions
+from crons.talk2bill.vyapar.benchmarks.fake_repository import (
+    FakeTalk2BillRepository,
+    install_fake_repository
+)
+
+
+class TimedPipeline(Talk2BillPipeline):
+    """
+    Talk2BillPipeline that records the latency of every turn
+    """
+    def __init__(self, mode: str):
+        super().__init__(mode=mode)
+        self.latencies: List[float] = []
+        self.failures = 0
+
+    async def pipeline(self, talk2bill_job):
+        start = time.perf_counter()
+        try:
+            return await super().pipeline(talk2bill_job)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def build_pipeline(args: argparse.Namespace, sessions: List[Dict]) -> TimedPipeline:
+    """
+    Build a pipeline whose LLM service talks to the fake model
+    """
+    pipeline = TimedPipeline(mode=args.mode)
+    llm_service = LLMService(llm=FakeChatModel(
+        responder=CorpusResponder(sessions),
+        latency=LatencyDistribution(args.latency_median, args.latency_sigma, seed=args.seed),
+        error_rate=args.error_rate,
+        seed=args.seed,
+        record_calls=False
+    ), hedger=Hedger(call_timeout=args.call_timeout, hedge_percentile=args.hedge_percentile or None))
+    if args.intent_batch_window_ms > 0:
+        llm_service.intent_batcher = IntentBatcher(
+            llm_service._classify_intent_batch,  # pylint: disable=protected-access
+            llm_service._classify_intent,  # pylint: disable=protected-access
+            window=args.intent_batch_window_ms / 1000,
+            max_batch=args.intent_batch_max_size
+        )
+    pipeline.llm_service = llm_service
+    pipeline._initialized = True  # pylint: disable=protected-access
+    return pipeline
+
+
+async def drive_pipeline(pipeline: TimedPipeline, repository: FakeTalk2BillRepository, concurrency: int):
+    """
+    Call `pipeline` directly: sessions run in parallel, the turns of a session one after the other
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(session_id: str):
+        while True:
+            job = repository.claim_next(session_id)
+            if job is None:
+                return
+            async with semaphore:
+                try:
+                    await pipeline.pipeline(job)
+                except Exception:  # pylint: disable=broad-except
+                    pass
+            if pipeline.job_writer is not None:
+                # The next turn needs this one written back
+                await pipeline.job_writer.flush()
+
+    await asyncio.gather(*(run_session(session_id) for session_id in repository.session_ids()))
+
+
+async def drive_scheduler(pipeline: TimedPipeline, repository: FakeTalk2BillRepository, concurrency: int):
+    """
+    Run `scheduler.main` batches, as the cron does, until every turn is processed
+    """
+    scheduler.TALK2BILL_PIPELINE = pipeline
+    scheduler.WORKER_CONCURRENCY = concurrency
+    repository.batch_size = concurrency
+    while not repository.done:
+        await scheduler.main()
+
+
+async def run_level(args: argparse.Namespace, sessions: List[Dict], driver: str, concurrency: int) -> Dict:
+    """
+    Replay the corpus once at a concurrency level
+
+    Returns:
+        Jobs/sec, latency percentiles in ms, failures and peak memory in MiB
+    """
+    replayed = sessions * args.repeat
+    repository = FakeTalk2BillRepository(replayed, session_prefix=f"bench-{driver}-{concurrency}")
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with install_fake_repository(repository):
+        # Built with the fake installed, so the job write buffer sees its bulk write
+        pipeline = build_pipeline(args, sessions)
+        if driver == "scheduler":
+            await drive_scheduler(pipeline, repository, concurrency)
+        else:
+            await drive_pipeline(pipeline, repository, concurrency)
+    elapsed = time.perf_counter() - start
+    peak_memory = 0
+    if args.trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencies = pipeline.latencies
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "driver": driver,
+        "concurrency": concurrency,
+        "jobs": len(latencies),
+        "jobs_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "failures": pipeline.failures,
+        "peak_mib": peak_memory / 2 ** 20
+    }
+
+
+async def main():
+    """
+    Print a throughput table per driver and concurrency level
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,10,100,1000", help="Comma separated levels")
+    parser.add_argument("--driver", choices=["pipeline", "scheduler", "both"], default="both")
+    parser.add_argument("--repeat", type=int, default=100, help="Copies of each corpus session")
+    parser.add_argument("--mode", default="chain", help="Pipeline mode: chain, speculative or unified")
+    parser.add_argument("--latency-median", type=float, default=0.8, help="Median LLM latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of LLM calls failing with 503")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--intent-batch-window-ms", type=float, default=0,
+                        help="Batch the intent calls over this window, 0 to disable")
+    parser.add_argument("--intent-batch-max-size", type=int, default=16)
+    parser.add_argument("--call-timeout", type=float, default=30.0, help="Deadline of each LLM call in seconds")
+    parser.add_argument("--hedge-percentile", type=float, default=0,
+                        help="Hedge calls slower than this percentile of recent latency, 0 to disable")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="Skip tracemalloc, which slows the run down")
+    args = parser.parse_args()
+
+    sessions = load_sessions()
+    drivers = ["pipeline", "scheduler"] if args.driver == "both" else [args.driver]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(
+        f"{'driver':10} {'conc':>5} {'jobs':>6} {'jobs/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'failed':>6} {'peak MiB':>9}"
+    )
+    for driver in drivers:
+        for concurrency in levels:
+            row = await run_level(args, sessions, driver, concurrency)
+            print(
+                f"{row['driver']:10} {row['concurrency']:5} {row['jobs']:6} {row['jobs_per_sec']:8.1f} "
+                f"{row['p50_ms']:8.0f} {row['p95_ms']:8.0f} {row['p99_ms']:8.0f} "
+                f"{row['failures']:6} {row['peak_mib']:9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
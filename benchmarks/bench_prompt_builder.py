@@ -0,0 +1,165 @@
+"""
+Benchmark: build time and allocations per prompt, `str.format` on the full template vs the
+pre-rendered CompiledPrompt templates used by Talk2BillPromptBuilder
+
+Both builders splice in the same per-turn fields, the history trimmed by PromptBudget and
+the invoice as compact JSON, so their prompts must be identical; the "fields us" column is
+the cost of rendering those fields alone, paid by both.
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_prompt_builder --calls 5000
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, Dict, Tuple
+from constants.talk2bill.vyapar.generic import SUPPORTED_INVOICE_CATEGORIES
+from constants.talk2bill.vyapar.prompts import (
+    EXPENSE_MISSING_FIELDS_PROMPT_VYP,
+    EXPENSE_RULES,
+    OTHER_RULES,
+    EXPENSE_EXAMPLES,
+    OTHER_EXAMPLES,
+    INTENT_CLASSIFICATION_PROMPT_VYP,
+    EXPENSE_EXTRACTION_PROMPT_V1,
+    GENERIC_QUESTION_ASK_PROMPT
+)
+from crons.talk2bill.vyapar.prompt_builder import Talk2BillPromptBuilder
+from crons.talk2bill.vyapar.prompt_budget import get_prompt_budget
+
+HISTORY = [
+    {"user": "Add petrol", "model": "How much did you spend on petrol?"},
+    {"user": "500", "model": "Would you like to add another item?"}
+]
+INVOICE = {
+    "expense_category": "petrol",
+    "items": [{"item_name": "petrol", "item_amount": 500, "item_qty": 1}],
+    "payment_type": "cash"
+}
+USER_QUERY = "add chai 50 also"
+
+
+def legacy_intent() -> str:
+    """
+    The builder before templates were compiled: join the rules and format the whole template
+    """
+    all_rules = "\n".join([EXPENSE_RULES, OTHER_RULES])
+    all_examples = "\n".join([EXPENSE_EXAMPLES, OTHER_EXAMPLES])
+    return INTENT_CLASSIFICATION_PROMPT_VYP.format(
+        all_rules=all_rules,
+        all_examples=all_examples,
+        history=get_prompt_budget().render_history(HISTORY),
+        user_query=USER_QUERY
+    )
+
+
+def legacy_extraction() -> str:
+    prompt_budget = get_prompt_budget()
+    return EXPENSE_EXTRACTION_PROMPT_V1.format(
+        user_input=USER_QUERY,
+        current_invoice=prompt_budget.render_invoice(INVOICE),
+        history=prompt_budget.render_history(HISTORY)
+    )
+
+
+def legacy_missing_fields() -> str:
+    prompt_budget = get_prompt_budget()
+    return EXPENSE_MISSING_FIELDS_PROMPT_VYP.format(
+        extracted_data=prompt_budget.render_invoice(INVOICE),
+        user_input=USER_QUERY,
+        history=prompt_budget.render_history(HISTORY)
+    )
+
+
+def legacy_generic() -> str:
+    return GENERIC_QUESTION_ASK_PROMPT.format(
+        user_input=USER_QUERY,
+        conversation_history=get_prompt_budget().render_history(HISTORY),
+        supported_categories=SUPPORTED_INVOICE_CATEGORIES
+    )
+
+
+def render_history() -> str:
+    return get_prompt_budget().render_history(HISTORY)
+
+
+def render_history_and_invoice() -> str:
+    prompt_budget = get_prompt_budget()
+    return prompt_budget.render_invoice(INVOICE) + prompt_budget.render_history(HISTORY)
+
+
+# prompt -> (legacy builder, compiled builder, rendering of its per-turn fields)
+CASES: Dict[str, Tuple[Callable[[], str], Callable[[], str], Callable[[], str]]] = {
+    "intent": (
+        legacy_intent,
+        lambda: Talk2BillPromptBuilder.build_intent_classification_prompt(HISTORY, USER_QUERY),
+        render_history
+    ),
+    "extraction": (
+        legacy_extraction,
+        lambda: Talk2BillPromptBuilder.build_expense_extraction_prompt(USER_QUERY, INVOICE, HISTORY),
+        render_history_and_invoice
+    ),
+    "missing_fields": (
+        legacy_missing_fields,
+        lambda: Talk2BillPromptBuilder.build_expense_missing_fields_prompt(INVOICE, USER_QUERY, HISTORY),
+        render_history_and_invoice
+    ),
+    "generic": (
+        legacy_generic,
+        lambda: Talk2BillPromptBuilder.build_generic_question_ask_prompt(USER_QUERY, HISTORY),
+        render_history
+    ),
+}
+
+
+def measure(fn: Callable[[], str], calls: int) -> Tuple[float, float]:
+    """
+    Measure `fn`
+
+    Returns:
+        Mean microseconds per call and mean peak bytes allocated during a call (the
+        intermediate strings and the prompt, freed or not afterwards)
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed_us = (time.perf_counter() - start) / calls * 1e6
+
+    alloc_calls = max(1, calls // 10)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(alloc_calls):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn()
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return elapsed_us, allocated / alloc_calls
+
+
+def main():
+    """
+    Print build time and allocations per prompt for both builders
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(
+        f"{'prompt':16} {'fields us':>10} {'format us':>10} {'compiled us':>12} "
+        f"{'format B':>10} {'compiled B':>11} {'same':>5}"
+    )
+    for name, (legacy, compiled, fields) in CASES.items():
+        fields_us, _ = measure(fields, args.calls)
+        legacy_us, legacy_bytes = measure(legacy, args.calls)
+        compiled_us, compiled_bytes = measure(compiled, args.calls)
+        same = legacy() == str(compiled())
+        print(
+            f"{name:16} {fields_us:10.1f} {legacy_us:10.1f} {compiled_us:12.1f} "
+            f"{legacy_bytes:10.0f} {compiled_bytes:11.0f} {str(same):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark: cost of building structured-output runnables per call vs the cached registry
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_structured_output_cache --calls 2000
+"""
+import argparse
+import os
+import time
+from typing import Callable
+
+# No request is sent to Gemini, the key only has to be present to build the client
+os.environ.setdefault("VYAPAR_T2B_API_KEY", "benchmark-key")
+
+# pylint: disable=wrong-import-position
+from crons.talk2bill.vyapar.llm_service import LLMService
+from constants.talk2bill.vyapar.models import (
+    IntentClassificationResponse,
+    ExpenseModel,
+    ExpenseMissingFieldsResponse,
+    GenericQuestionAskResponse
+)
+
+RESPONSE_MODELS = [
+    IntentClassificationResponse,
+    ExpenseModel,
+    ExpenseMissingFieldsResponse,
+    GenericQuestionAskResponse
+]
+
+
+def time_per_call(fn: Callable, calls: int) -> float:
+    """
+    Time `fn` over `calls` invocations
+
+    Returns:
+        The mean time per call in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    """
+    Compare rebuilding the runnable on every call (the old `_invoke`) with the registry lookup
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--rate", type=int, default=100, help="LLM calls per second to project")
+    args = parser.parse_args()
+
+    service = LLMService()
+    print(f"{'response model':32} {'rebuild (us)':>14} {'cached (us)':>12} {'saved (us)':>12}")
+    for response_format in RESPONSE_MODELS:
+        rebuild = time_per_call(
+            lambda rf=response_format: service.llm.with_structured_output(rf, method="json_schema"),
+            args.calls
+        )
+        cached = time_per_call(
+            lambda rf=response_format: service._get_structured_llm(rf),  # pylint: disable=protected-access
+            args.calls
+        )
+        saved = rebuild - cached
+        print(f"{response_format.__name__:32} {rebuild:14.1f} {cached:12.2f} {saved:12.1f}")
+        print(f"{'':32} at {args.rate} calls/s: {saved * args.rate / 1e4:.2f}% of one core saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: chain mode (intent -> extract -> ask) vs unified mode (one call) on the same turns
+
+Sends real requests to Gemini with VYAPAR_T2B_API_KEY. Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.bench_unified_vs_chain --repeat 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+from crons.talk2bill.vyapar.llm_service import LLMService
+from crons.talk2bill.vyapar.talk2bill_pipeline import PipelineMode, Talk2BillPipeline
+from crons.talk2bill.vyapar.tokens import estimate_tokens, estimate_json_tokens
+
+# Single turns from the playground batch tests plus follow-ups that depend on history
+TURNS: List[Dict] = [
+    {"user_query": "chai samosa 140 rupees", "history": [], "invoice": {}},
+    {"user_query": "petrol 500 rupees", "history": [], "invoice": {}},
+    {"user_query": "taxi ke liye 200 diye", "history": [], "invoice": {}},
+    {"user_query": "delivery charges 50", "history": [], "invoice": {}},
+    {"user_query": "Add 100 rupees and 200 rupees.", "history": [], "invoice": {}},
+    {
+        "user_query": "500",
+        "history": [{"user": "Add petrol", "model": "How much did you spend on petrol?"}],
+        "invoice": {
+            "expense_category": "petrol",
+            "items": [{"item_name": "petrol", "item_amount": None, "item_qty": 1}],
+            "payment_type": "cash"
+        }
+    },
+    {
+        "user_query": "no",
+        "history": [{"user": "Add biryani 100", "model": "Would you like to add another item?"}],
+        "invoice": {
+            "expense_category": "food",
+            "items": [{"item_name": "biryani", "item_amount": 100, "item_qty": 1}],
+            "payment_type": "cash"
+        }
+    },
+    {"user_query": "what's the weather today?", "history": [], "invoice": {}},
+    {"user_query": "hello how are you", "history": [], "invoice": {}},
+]
+
+
+class CountingLLMService(LLMService):
+    """
+    LLMService that counts the calls and estimated tokens sent through `_invoke`
+    """
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def _invoke(self, prompt, response_format=None, **kwargs):
+        self.calls += 1
+        self.input_tokens += estimate_tokens(prompt)
+        response = await super()._invoke(prompt, response_format, **kwargs)
+        self.output_tokens += estimate_json_tokens(response)
+        return response
+
+
+async def run_mode(mode: PipelineMode, repeat: int) -> Dict:
+    """
+    Run every turn `repeat` times in the given mode
+
+    Returns:
+        Latency percentiles, calls and estimated tokens per turn
+    """
+    pipeline = Talk2BillPipeline(mode=mode.value)
+    pipeline.llm_service = CountingLLMService()
+    latencies = []
+    for _ in range(repeat):
+        for turn in TURNS:
+            start = time.perf_counter()
+            await pipeline.run_turn("benchmark", turn["user_query"], turn["history"], turn["invoice"])
+            latencies.append(time.perf_counter() - start)
+
+    turns = len(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if turns > 1 else latencies * 99
+    return {
+        "mode": mode.value,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "calls_per_turn": pipeline.llm_service.calls / turns,
+        "input_tokens_per_turn": pipeline.llm_service.input_tokens / turns,
+        "output_tokens_per_turn": pipeline.llm_service.output_tokens / turns
+    }
+
+
+async def main():
+    """
+    Print a comparison table of the two modes
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':10} {'p50 ms':>9} {'p95 ms':>9} {'calls':>7} {'in tok':>8} {'out tok':>8}")
+    for mode in (PipelineMode.CHAIN, PipelineMode.UNIFIED):
+        row = await run_mode(mode, args.repeat)
+        print(
+            f"{row['mode']:10} {row['p50_ms']:9.0f} {row['p95_ms']:9.0f} "
+            f"{row['calls_per_turn']:7.2f} {row['input_tokens_per_turn']:8.0f} "
+            f"{row['output_tokens_per_turn']:8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
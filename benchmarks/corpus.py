@@ -0,0 +1,134 @@
+"""Module to load the replayable talk2bill session corpus and answer LLM calls from it"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel
+from crons.talk2bill.vyapar.fake_llm import default_responder
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "talk2bill_sessions.json")
+
+# The user input slot of each prompt template: next to its history line, or the
+# <<USER_QUERY>> block of the intent prompt, or the request blocks of the batched intent
+# prompt. Example inputs in the prompts never match.
+USER_INPUT_PATTERN = re.compile(
+    r'^(?:Recent )?[Hh]istory: .*\n(?:- )?User Input: "(?P<after_history>.*)"$'
+    r'|^(?:- )?User(?: Input)?: "(?P<before_history>.*)"\n- History:'
+    r'|<<USER_QUERY>>\n(?P<block>.*)\n<<USER_QUERY>>'
+    r'|^User Query: "(?P<batch_request>.*)"$',
+    re.MULTILINE
+)
+BATCH_REQUEST_PATTERN = re.compile(r"<<REQUEST (?P<id>\d+)>>\n(?P<request>.*?)\n<<REQUEST (?P=id)>>", re.DOTALL)
+
+
+def load_sessions(path: str = CORPUS_PATH) -> List[Dict[str, Any]]:
+    """
+    Load the sessions of the corpus
+
+    Args:
+        path: The corpus JSON file
+
+    Returns:
+        The sessions, each with a name and its turns in order
+    """
+    with open(path, "r", encoding="utf-8") as corpus_file:
+        return json.load(corpus_file)["sessions"]
+
+
+def get_user_input(prompt: str) -> Optional[str]:
+    """
+    Get the user input a rendered talk2bill prompt was built for
+    """
+    match = USER_INPUT_PATTERN.search(prompt)
+    if match is None:
+        return None
+    return next(group for group in match.groups() if group is not None)
+
+
+class CorpusResponder:
+    """
+    FakeChatModel responder that answers with the scripted outcome of the corpus turn a
+    prompt was built for
+
+    Turns are found by their user input; when several sessions share it ("cash", "no"), the
+    one whose previous user input appears in the prompt's history wins.
+    """
+    def __init__(self, sessions: List[Dict[str, Any]]):
+        # user input -> [(previous user input, turn)]
+        self._turns: Dict[str, List] = {}
+        # id of a turn -> the invoice of the session before it
+        self._previous_invoices: Dict[int, Dict[str, Any]] = {}
+        for session in sessions:
+            previous, previous_invoice = None, {}
+            for turn in session["turns"]:
+                self._turns.setdefault(turn["user_query"], []).append((previous, turn))
+                self._previous_invoices[id(turn)] = previous_invoice
+                previous = turn["user_query"]
+                previous_invoice = turn["invoice"] or previous_invoice
+        self.unmatched = 0
+
+    def find_turn(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the corpus turn of a prompt
+        """
+        candidates = self._turns.get(get_user_input(prompt) or "")
+        if not candidates:
+            return None
+        for previous, turn in candidates:
+            if previous is not None and previous in prompt:
+                return turn
+        for previous, turn in candidates:
+            if previous is None:
+                return turn
+        return candidates[0][1]
+
+    def __call__(self, prompt: str, response_format: Type[BaseModel]) -> Any:
+        fields = response_format.model_fields
+        if "results" in fields:
+            # Batched intent classification: answer each request block on its own
+            return {"results": [
+                {"id": int(match.group("id")), "intent": self._batch_intent(match.group("request"))}
+                for match in BATCH_REQUEST_PATTERN.finditer(prompt)
+            ]}
+
+        turn = self.find_turn(prompt)
+        if turn is None:
+            self.unmatched += 1
+            return default_responder(prompt, response_format)
+
+        if "category_explicit" in fields:
+            return self.get_delta(turn)
+        if not {"intent", "question"} & set(fields):
+            # The extraction response is the invoice itself
+            return turn["invoice"] or {}
+        return {
+            key: value for key, value in turn.items()
+            if key in fields and not (key == "invoice" and not value)
+        }
+
+    def get_delta(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the delta extraction answer turning the session's previous invoice into the
+        scripted one: the new items when the old ones are kept, else remove all and re-add
+        """
+        invoice = turn["invoice"] or {}
+        old_items = self._previous_invoices.get(id(turn), {}).get("items") or []
+        new_items = invoice.get("items") or []
+        if new_items[:len(old_items)] == old_items:
+            changes = [{"op": "add", **item} for item in new_items[len(old_items):]]
+        else:
+            changes = [{"op": "remove", "index": index} for index in range(len(old_items))]
+            changes += [{"op": "add", **item} for item in new_items]
+        return {
+            "items": changes,
+            "expense_category": invoice.get("expense_category"),
+            "category_explicit": True,
+            "payment_type": invoice.get("payment_type")
+        }
+
+    def _batch_intent(self, request: str) -> str:
+        turn = self.find_turn(request)
+        if turn is None:
+            self.unmatched += 1
+            return "other"
+        return turn["intent"]
@@ -0,0 +1,523 @@
+"""
+Evaluation runner: runs a test corpus through a talk2bill extractor against several models at
+once, with bounded async concurrency and an on-disk cache of the predictions, and prints the
+accuracy and latency of each model
+
+Extractors:
+    agent_basic_extractor, agent_smart_categorizer, agent_multi_item_handler, route_to_agent:
+        the agents of agents.py (ported from vaani_functions.ipynb)
+    llm_service: the production LLMService (identify_intent, then extract_expense)
+
+Backends:
+    fake: offline and deterministic, for CI. Answers come from the hint pre-parser and the
+        local category index, after a log-normal latency per model (--fake-latency)
+    live: the agents call the shared provider of each model (gpt-* OpenAI, claude-* Anthropic,
+        gemini-* Gemini); LLMService calls Gemini with VYAPAR_T2B_API_KEY
+
+Predictions are cached in SQLite keyed by the rendered prompt, the extractor, the model and
+--version, so a rerun only calls the models for new or changed cases; bump --version after a
+change the prompt does not show (parsing, LLMService logic). Cached rows keep the latency of
+the call that produced them.
+
+Run with:
+    python -m crons.talk2bill.vyapar.benchmarks.eval_runner --extractor route_to_agent \
+        --models gemini-2.0-flash,gemini-2.5-flash --backend live --concurrency 16
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from crons.talk2bill.vyapar.agents import (
+    Agent,
+    agent_basic_extractor,
+    agent_multi_item_handler,
+    agent_smart_categorizer,
+    build_agent_prompt,
+    choose_agent,
+    route_to_agent
+)
+from crons.talk2bill.vyapar.categorizer import CategoryIndex
+from crons.talk2bill.vyapar.fake_llm import FakeChatProvider, LatencyDistribution
+from crons.talk2bill.vyapar.hint_parser import HintParser
+from crons.talk2bill.vyapar.providers import ChatProvider
+from crons.talk2bill.vyapar.response_cache import SqliteResponseStore
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "eval_cases.json")
+DEFAULT_CACHE_PATH = "talk2bill_eval_cache.sqlite"
+FIELDS = ["intent", "category", "amount", "item_count"]
+
+VOICE_INPUT_PATTERN = re.compile(r'^Voice Input: "(.*)"$', re.MULTILINE)
+# Inputs the fake intent classifier reads as sales or payments received, not expenses
+NON_EXPENSE_WORDS = {"sold", "bought", "received", "chukaya", "udhar", "weather", "hello"}
+
+
+@dataclass
+class EvalCase:
+    """
+    A single-turn case: the user input and the expected intent, category (accepted names),
+    total amount and item count; fields left out are not scored
+    """
+    id: str
+    input: str
+    expected: Dict[str, Any]
+
+
+@dataclass
+class EvalResult:
+    """
+    The outcome of a case on a model
+    """
+    case_id: str
+    model: str
+    prediction: Dict[str, Any] = field(default_factory=dict)
+    checks: Dict[str, bool] = field(default_factory=dict)
+    latency: float = 0.0
+    cached: bool = False
+    error: Optional[str] = None
+
+    @property
+    def correct(self) -> bool:
+        return self.error is None and all(self.checks.values())
+
+
+def load_cases(path: str = CASES_PATH) -> List[EvalCase]:
+    """
+    Load the evaluation cases of a JSON file ({"cases": [{"id", "input", "expected"}]})
+    """
+    with open(path, "r", encoding="utf-8") as cases_file:
+        return [EvalCase(**case) for case in json.load(cases_file)["cases"]]
+
+
+def total_amount(amounts: List[Any]) -> Optional[float]:
+    """
+    Sum the numeric amounts, None when there is none
+    """
+    numbers = [float(amount) for amount in amounts if isinstance(amount, (int, float))]
+    return sum(numbers) if numbers else None
+
+
+def score(expected: Dict[str, Any], prediction: Dict[str, Any], fields: List[str]) -> Dict[str, bool]:
+    """
+    Check each expected field the extractor predicts
+
+    A case expected to be "other" is only scored on its intent: its amounts are meaningless.
+    """
+    checks = {}
+    for name in fields:
+        if name not in expected or (name != "intent" and expected.get("intent") == "other"):
+            continue
+        value, want = prediction.get(name), expected[name]
+        if name == "category":
+            accepted = want if isinstance(want, list) else [want]
+            checks[name] = str(value).strip().lower() in {str(category).lower() for category in accepted}
+        elif name == "amount":
+            checks[name] = value is not None and abs(float(value) - float(want)) < 0.01
+        else:
+            checks[name] = value == want
+    return checks
+
+
+class FakeAgentResponder:
+    """
+    FakeChatProvider responder answering the agent prompts with the JSON they ask for, from
+    the hint pre-parser and the local category index (the registry when the prompt lists the
+    categories of similar businesses)
+    """
+    def __init__(self):
+        self.hint_parser = HintParser()
+        self.lexicon = CategoryIndex.from_lexicon()
+        self.registry = CategoryIndex.from_registry()
+
+    def __call__(self, prompt: str, model: str) -> str:
+        match = VOICE_INPUT_PATTERN.search(prompt)
+        voice_input = match.group(1) if match else ""
+        hints = self.hint_parser.parse(voice_input)
+        index = self.registry if "Common categories" in prompt else self.lexicon
+        items = [
+            {
+                "amount": item.item_amount,
+                "item": item.item_name or "",
+                "category": index.categorize([item.item_name], voice_input).category or "Other"
+            }
+            for item in hints.items if item.item_amount is not None
+        ]
+        if '"items"' in prompt:
+            return json.dumps({"items": items, "total_amount": total_amount([item["amount"] for item in items])})
+        names = [item["item"] for item in items]
+        return json.dumps({
+            "amount": total_amount([item["amount"] for item in items]),
+            "item": " ".join(names),
+            "category": index.categorize(names, voice_input).category or "Other"
+        })
+
+
+class AgentExtractor:
+    """
+    An agent of agents.py, or route_to_agent, on the given provider of each model (the
+    shared provider serving the model when there is none)
+    """
+    fields = ["category", "amount", "item_count"]
+    agents = {
+        "agent_basic_extractor": Agent.BASIC_EXTRACTOR,
+        "agent_smart_categorizer": Agent.SMART_CATEGORIZER,
+        "agent_multi_item_handler": Agent.MULTI_ITEM_HANDLER
+    }
+
+    def __init__(
+        self,
+        name: str,
+        providers: Optional[Dict[str, ChatProvider]] = None,
+        excel_db_context: Optional[str] = None
+    ):
+        self.name = name
+        self.providers = providers or {}
+        self.excel_db_context = excel_db_context
+
+    def agent_for(self, case: EvalCase) -> Agent:
+        if self.name == "route_to_agent":
+            return choose_agent(case.input)
+        return self.agents[self.name]
+
+    def prompt(self, case: EvalCase) -> str:
+        """
+        Render the agent prompt of a case
+        """
+        return build_agent_prompt(self.agent_for(case), case.input, self.excel_db_context)
+
+    async def predict(self, case: EvalCase, model: str, prompt: str) -> Dict[str, Any]:
+        """
+        Call the agent and normalize its result to the scored fields
+        """
+        provider = self.providers.get(model)
+        if self.name == "route_to_agent":
+            result = await route_to_agent(case.input, model, provider)
+        elif self.name == "agent_smart_categorizer":
+            result = await agent_smart_categorizer(case.input, self.excel_db_context, model, provider)
+        elif self.name == "agent_multi_item_handler":
+            result = await agent_multi_item_handler(case.input, model, provider)
+        else:
+            result = await agent_basic_extractor(case.input, model, provider)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+
+        if "items" in result:
+            items = result.get("items") or []
+            categories = {str(item.get("category")) for item in items}
+            return {
+                "agent": self.agent_for(case).value,
+                "category": categories.pop() if len(categories) == 1 else None,
+                "amount": total_amount([item.get("amount") for item in items]),
+                "item_count": len(items)
+            }
+        return {
+            "agent": self.agent_for(case).value,
+            "category": result.get("category"),
+            "amount": total_amount([result.get("amount")]),
+            "item_count": 1 if result.get("item") or result.get("amount") is not None else 0
+        }
+
+
+class FakeExtractionResponder:
+    """
+    FakeChatModel responder answering the production prompts like FakeAgentResponder: intents
+    from the pre-parse, invoices from the pre-parse and the extraction lexicon
+    """
+    def __init__(self):
+        self.hint_parser = HintParser()
+        self.lexicon = CategoryIndex.from_lexicon()
+
+    def intent(self, text: str) -> str:
+        words = set(re.findall(r"[a-z']+", text.lower()))
+        if words & NON_EXPENSE_WORDS or not self.hint_parser.parse(text).amounts:
+            return "other"
+        return "expense"
+
+    def __call__(self, prompt: str, response_format: Any) -> Any:
+        from crons.talk2bill.vyapar.benchmarks.corpus import BATCH_REQUEST_PATTERN, get_user_input
+        from crons.talk2bill.vyapar.fake_llm import default_responder
+        fields = response_format.model_fields
+        if "results" in fields:
+            return {"results": [
+                {"id": int(match.group("id")), "intent": self.intent(get_user_input(match.group("request")) or "")}
+                for match in BATCH_REQUEST_PATTERN.finditer(prompt)
+            ]}
+        user_input = get_user_input(prompt)
+        if user_input is None:
+            return default_responder(prompt, response_format)
+        if "intent" in fields and "invoice" not in fields:
+            return {"intent": self.intent(user_input)}
+        hints = self.hint_parser.parse(user_input)
+        items = [
+            {"item_name": item.item_name, "item_amount": item.item_amount, "item_qty": item.item_qty or 1}
+            for item in hints.items if item.item_amount is not None
+        ]
+        category = self.lexicon.categorize([item["item_name"] for item in items], user_input).category
+        if "category_explicit" in fields:
+            return {
+                "items": [{"op": "add", **item} for item in items],
+                "expense_category": category,
+                "payment_type": hints.payment_type
+            }
+        if "items" in fields:
+            return {"expense_category": category, "items": items, "payment_type": hints.payment_type}
+        return default_responder(prompt, response_format)
+
+
+class LLMServiceExtractor:
+    """
+    The production LLMService, one instance per model: identify_intent, then extract_expense
+    for expense inputs
+    """
+    name = "llm_service"
+    fields = FIELDS
+
+    def __init__(self, backend: str, models: List[str], args: argparse.Namespace):
+        from crons.talk2bill.vyapar.llm_service import LLMService
+        self.services: Dict[str, Any] = {}
+        for model in models:
+            if backend == "fake":
+                from crons.talk2bill.vyapar.fake_llm import FakeChatModel
+                llm = FakeChatModel(
+                    responder=FakeExtractionResponder(),
+                    model=model,
+                    latency=LatencyDistribution(args.fake_latency.get(model, args.fake_default_latency), seed=args.seed),
+                    error_rate=args.fake_error_rate,
+                    seed=args.seed,
+                    record_calls=False
+                )
+            else:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                from config.settings import fetch_env
+                llm = ChatGoogleGenerativeAI(model=model, temperature=0.0, api_key=fetch_env("VYAPAR_T2B_API_KEY"))
+            self.services[model] = LLMService(llm=llm)
+
+    def prompt(self, case: EvalCase) -> str:
+        """
+        Render the intent and extraction prompts of a case, the cache key of its prediction
+        """
+        from crons.talk2bill.vyapar.prompt_builder import Talk2BillPromptBuilder
+        return "\n".join([
+            str(Talk2BillPromptBuilder.build_intent_classification_prompt([], case.input)),
+            str(Talk2BillPromptBuilder.build_expense_extraction_prompt(case.input, {}, []))
+        ])
+
+    async def predict(self, case: EvalCase, model: str, prompt: str) -> Dict[str, Any]:
+        """
+        Run the service on the case and normalize the invoice to the scored fields
+        """
+        service = self.services[model]
+        intent = (await service.identify_intent(case.input, [])).intent
+        if intent != "expense":
+            return {"intent": intent}
+        invoice = (await service.extract_expense(case.input, {}, [])).model_dump(mode="json")
+        items = invoice.get("items") or []
+        return {
+            "intent": intent,
+            "category": invoice.get("expense_category"),
+            "amount": total_amount([item.get("item_amount") for item in items]),
+            "item_count": len(items)
+        }
+
+
+class EvalCache:
+    """
+    On-disk cache of predictions keyed by the prompt, the extractor, the model and the version
+    """
+    def __init__(self, path: str, ttl_seconds: float):
+        self.store = SqliteResponseStore(path)
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(version: str, extractor: str, model: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (version, extractor, model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        payload = await asyncio.to_thread(self.store.get, key)
+        return json.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, prediction: Dict[str, Any], latency: float):
+        payload = json.dumps({"prediction": prediction, "latency": latency})
+        await asyncio.to_thread(self.store.set, key, payload, time.time() + self.ttl_seconds)
+
+
+async def evaluate(
+    extractor: Any,
+    cases: List[EvalCase],
+    models: List[str],
+    concurrency: int,
+    cache: Optional[EvalCache],
+    version: str
+) -> List[EvalResult]:
+    """
+    Run every case on every model, at most `concurrency` calls in flight across all models
+
+    Args:
+        extractor: The extractor (its `prompt`, `predict` and scored `fields`)
+        cases: The cases
+        models: The models to compare
+        concurrency: The bound on the calls in flight
+        Optional[cache]: The prediction cache; failed calls are not cached
+        version: The version of the extractor code, part of the cache key
+
+    Returns:
+        The result of each case on each model
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_case(case: EvalCase, model: str) -> EvalResult:
+        result = EvalResult(case_id=case.id, model=model)
+        prompt = extractor.prompt(case)
+        key = EvalCache.make_key(version, extractor.name, model, prompt)
+        cached = await cache.get(key) if cache is not None else None
+        if cached is not None:
+            result.prediction, result.latency, result.cached = cached["prediction"], cached["latency"], True
+        else:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result.prediction = await extractor.predict(case, model, prompt)
+                except Exception as e:  # pylint: disable=broad-except
+                    result.error = f"{type(e).__name__}: {e}"
+                result.latency = time.perf_counter() - start
+            if cache is not None and result.error is None:
+                await cache.set(key, result.prediction, result.latency)
+        if result.error is None:
+            result.checks = score(case.expected, result.prediction, extractor.fields)
+        return result
+
+    return await asyncio.gather(*(run_case(case, model) for model in models for case in cases))
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+def print_tables(results: List[EvalResult], models: List[str], fields: List[str]):
+    """
+    Print the accuracy table (overall and per field) and the latency table of each model
+    """
+    width = max(len(model) for model in models) + 2
+    print(f"\n{'model':{width}} {'scored':>6} {'correct':>7} {'acc':>6} " +
+          " ".join(f"{name:>10}" for name in fields) + f" {'errors':>6}")
+    for model in models:
+        scored = [result for result in results if result.model == model and (result.checks or result.error)]
+        correct = sum(result.correct for result in scored)
+        per_field = []
+        for name in fields:
+            checked = [result.checks[name] for result in scored if name in result.checks]
+            per_field.append(f"{sum(checked) / len(checked):10.1%}" if checked else f"{'-':>10}")
+        errors = sum(result.error is not None for result in scored)
+        print(f"{model:{width}} {len(scored):6d} {correct:7d} {correct / max(1, len(scored)):6.1%} " +
+              " ".join(per_field) + f" {errors:6d}")
+
+    print(f"\n{'model':{width}} {'calls':>6} {'cached':>6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for model in models:
+        model_results = [result for result in results if result.model == model]
+        latencies = [result.latency * 1000 for result in model_results]
+        cached = sum(result.cached for result in model_results)
+        print(f"{model:{width}} {len(model_results):6d} {cached:6d} "
+              f"{statistics.mean(latencies) if latencies else 0:8.1f} {percentile(latencies, 0.5):8.1f} "
+              f"{percentile(latencies, 0.95):8.1f} {max(latencies, default=0):8.1f}")
+
+
+def parse_latencies(spec: str) -> Dict[str, float]:
+    """
+    Parse "model=seconds,model=seconds" into the median latency of each fake model
+    """
+    latencies = {}
+    for part in filter(None, spec.split(",")):
+        model, seconds = part.split("=")
+        latencies[model.strip()] = float(seconds)
+    return latencies
+
+
+def build_extractor(args: argparse.Namespace, models: List[str]) -> Any:
+    """
+    Build the extractor named by --extractor on the --backend
+    """
+    if args.extractor == "llm_service":
+        return LLMServiceExtractor(args.backend, models, args)
+    providers = {}
+    if args.backend == "fake":
+        responder = FakeAgentResponder()
+        providers = {
+            model: FakeChatProvider(
+                responder=responder,
+                model=model,
+                latency=LatencyDistribution(args.fake_latency.get(model, args.fake_default_latency), seed=args.seed),
+                error_rate=args.fake_error_rate,
+                seed=args.seed
+            )
+            for model in models
+        }
+    excel_db_context = None
+    if args.extractor == "agent_smart_categorizer":
+        excel_db_context = ", ".join(CategoryIndex.from_registry().categories)
+    return AgentExtractor(args.extractor, providers, excel_db_context)
+
+
+def main():
+    """
+    Evaluate the corpus on the models and print the accuracy and latency tables
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extractor", default="route_to_agent", choices=[
+        "agent_basic_extractor", "agent_smart_categorizer", "agent_multi_item_handler", "route_to_agent", "llm_service"
+    ])
+    parser.add_argument("--models", default="gemini-2.0-flash,gemini-2.5-flash")
+    parser.add_argument("--backend", default="fake", choices=["fake", "live"])
+    parser.add_argument("--cases", default=CASES_PATH)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--version", default="1")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--cache-ttl-days", type=float, default=30)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--fake-latency", type=parse_latencies, default={},
+                        help="median seconds per fake model, e.g. gemini-2.0-flash=0.4,gemini-2.5-flash=0.9")
+    parser.add_argument("--fake-default-latency", type=float, default=0.05)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write one JSON line per case and model")
+    parser.add_argument("--show-failures", type=int, default=5)
+    args = parser.parse_args()
+
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    cases = load_cases(args.cases)
+    extractor = build_extractor(args, models)
+    cache = None if args.no_cache else EvalCache(args.cache_path, args.cache_ttl_days * 86400)
+
+    start = time.perf_counter()
+    results = asyncio.run(evaluate(extractor, cases, models, args.concurrency, cache, args.version))
+    elapsed = time.perf_counter() - start
+    cached = sum(result.cached for result in results)
+    print(f"{args.extractor} on {len(cases)} cases x {len(models)} models ({args.backend} backend): "
+          f"{elapsed:.2f} s wall, {len(results) - cached} calls, {cached} from the cache")
+    print_tables(results, models, extractor.fields)
+
+    inputs = {case.id: case for case in cases}
+    failures = [result for result in results if (result.checks or result.error) and not result.correct]
+    for result in failures[:args.show_failures]:
+        case = inputs[result.case_id]
+        print(f"  {result.model} {case.id} {case.input!r}: "
+              f"{result.error or {name: result.prediction.get(name) for name, ok in result.checks.items() if not ok}}"
+              f" expected {case.expected}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            for result in results:
+                row = {"input": inputs[result.case_id].input, **result.__dict__, "correct": result.correct}
+                output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""In-memory stand-in for Talk2BillRepository that replays the corpus sessions as jobs"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from constants.talk2bill.vyapar.status import Talk2BillStatus
+from models.talk2bill.vyapar import Talk2BillModel
+from crons.talk2bill.vyapar import job_writer, talk2bill_pipeline, worker_pool
+
+# Modules that reference Talk2BillRepository by name
+REPOSITORY_MODULES = (talk2bill_pipeline, worker_pool, job_writer)
+
+
+class FakeTalk2BillRepository:
+    """
+    Serves the turns of each session as jobs, one at a time per session: the next turn of a
+    session is only claimable once the update of the previous one has been written, as when
+    a user waits for the answer before speaking again
+    """
+    def __init__(self, sessions: List[Dict[str, Any]], batch_size: int = 100, session_prefix: str = "bench"):
+        self.batch_size = batch_size
+        self._sessions: Dict[str, List[Dict[str, Any]]] = {
+            f"{session_prefix}-{index}": session["turns"] for index, session in enumerate(sessions)
+        }
+        self._next_turn: Dict[str, int] = {session_id: 0 for session_id in self._sessions}
+        self._in_flight: Dict[str, Talk2BillModel] = {}
+        self._processed: Dict[str, List[Dict[str, Any]]] = {session_id: [] for session_id in self._sessions}
+        self.jobs_claimed = 0
+        self.updates = 0
+        self.bulk_writes = 0
+
+    @property
+    def total_turns(self) -> int:
+        """
+        The number of turns in the replayed sessions
+        """
+        return sum(len(turns) for turns in self._sessions.values())
+
+    @property
+    def done(self) -> bool:
+        """
+        Whether every turn has been claimed and written back
+        """
+        return not self._in_flight and all(
+            self._next_turn[session_id] >= len(turns) for session_id, turns in self._sessions.items()
+        )
+
+    def session_ids(self) -> List[str]:
+        """
+        Get the ids of the replayed sessions
+        """
+        return list(self._sessions)
+
+    def claim_next(self, session_id: str) -> Optional[Talk2BillModel]:
+        """
+        Claim the next turn of a session, None when it is finished or its last turn is in flight
+        """
+        turn_index = self._next_turn[session_id]
+        if session_id in self._in_flight or turn_index >= len(self._sessions[session_id]):
+            return None
+        job = Talk2BillModel.model_construct(
+            sessionId=session_id,
+            fileRefId=f"{session_id}-{turn_index}",
+            transcription=self._sessions[session_id][turn_index]["user_query"]
+        )
+        self._in_flight[session_id] = job
+        self.jobs_claimed += 1
+        return job
+
+    async def get_batch_of_jobs(self) -> List[Talk2BillModel]:
+        jobs = []
+        for session_id in self._sessions:
+            if len(jobs) >= self.batch_size:
+                break
+            job = self.claim_next(session_id)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    async def find_all_processed_invoices_by_session_with_limit(self, session_id: str, limit: int) -> List[Dict]:
+        return self._processed.get(session_id, [])[-limit:]
+
+    async def find_latest_processed_invoice_by_session(self, session_id: str) -> Dict[str, Any]:
+        processed = self._processed.get(session_id)
+        return (processed[-1].get("invoice") or {}) if processed else {}
+
+    async def update_job(self, job: Talk2BillModel, update: Dict[str, Any]) -> Dict[str, int]:
+        self.updates += 1
+        if update.get("status") != Talk2BillStatus.FAILED.value:
+            self._processed[job.sessionId].append({
+                "transcription": job.transcription,
+                **update
+            })
+        if self._in_flight.get(job.sessionId) is job:
+            del self._in_flight[job.sessionId]
+            self._next_turn[job.sessionId] += 1
+        return {"matched_count": 1, "modified_count": 1}
+
+    async def bulk_update_jobs(self, batch: List) -> Dict[str, int]:
+        self.bulk_writes += 1
+        for job, update in batch:
+            await self.update_job(job, update)
+        return {"matched_count": len(batch), "modified_count": len(batch)}
+
+
+@contextmanager
+def install_fake_repository(repository: FakeTalk2BillRepository) -> Iterator[FakeTalk2BillRepository]:
+    """
+    Point the pipeline, worker pool and job writer at the fake repository for the block
+    """
+    originals = [(module, module.Talk2BillRepository) for module in REPOSITORY_MODULES]
+    for module, _ in originals:
+        module.Talk2BillRepository = repository
+    try:
+        yield repository
+    finally:
+        for module, original in originals:
+            module.Talk2BillRepository = original
@@ -0,0 +1,380 @@
+"""Module to assign the expense category of talk2bill invoices locally, from a keyword index"""
+import difflib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from constants.talk2bill.vyapar.models import ExpenseModel
+from constants.talk2bill.vyapar.prompts import EXPENSE_CATEGORY_INFERENCE_RULES
+from crons.talk2bill.vyapar.env import env_float, env_str
+from crons.talk2bill.vyapar.invoice_merge import get_invoice_data
+
+REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "category_registry.json")
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+LEXICON_LINE_PATTERN = re.compile(r"^- (?P<category>[\w ]+): (?P<keywords>.+)$", re.MULTILINE)
+# The user names the category ("category is X", "under X") instead of leaving it to inference;
+# "under" followed by an amount ("paid under 100") names none
+EXPLICIT_CATEGORY_PATTERN = re.compile(
+    r"\bcategor(y|ies)\b|\bunder\s+(?!(rs\.?|rupees?|inr|₹)?\s*\d)[^\W\d_]",
+    re.IGNORECASE
+)
+
+# Hinglish words (and their common spellings) → the English keyword of the taxonomies
+TRANSLITERATIONS = {
+    "doodh": "milk", "dudh": "milk", "dood": "milk",
+    "sabzi": "vegetables", "sabji": "vegetables", "subzi": "vegetables", "sabjee": "vegetables",
+    "chai": "tea", "chay": "tea", "chaay": "tea", "kaafi": "coffee",
+    "pani": "water", "paani": "water",
+    "bijli": "electricity", "bijlee": "electricity",
+    "kiraya": "rent", "bhada": "rent", "bhaada": "rent",
+    "dawai": "medicine", "dawa": "medicine", "dawaai": "medicine", "davai": "medicine", "ilaaj": "medical",
+    "chawal": "rice", "gehu": "wheat", "gehun": "wheat", "anda": "egg", "ande": "eggs",
+    "cheeni": "sugar", "chini": "sugar", "tel": "oil", "phal": "fruit", "kela": "banana", "seb": "apple",
+    "khana": "food", "khaana": "food", "nashta": "snacks", "naashta": "snacks",
+    "tankhwah": "salary", "tankha": "salary", "pagaar": "salary", "vetan": "salary",
+    "majdoori": "labour", "mazdoori": "labour", "mazdoor": "labour", "majdoor": "labour",
+    "gaadi": "vehicle", "gadi": "vehicle", "kagaz": "paper", "kagaj": "paper", "kalam": "pen",
+    "safai": "cleaning", "chanda": "donation", "byaj": "interest", "chhapai": "printing", "daak": "postage",
+    "kapde": "clothes", "kapda": "clothes", "kirana": "groceries", "rashan": "groceries", "ration": "groceries"
+}
+# Currency, filler and Hindi function words carrying no category signal
+STOPWORDS = {
+    "rupees", "rupee", "rs", "inr", "ke", "ki", "ka", "ko", "liye", "lie", "diye", "diya", "de", "hai", "tha",
+    "for", "the", "a", "an", "of", "to", "and", "or", "my", "me", "in", "on", "at", "with", "paid", "pay",
+    "spent", "bill", "bills", "payment", "charges", "charge", "fees", "fee", "expense", "expenses", "kharcha",
+    "add", "record", "kg", "litre", "liter", "pcs", "dozen", "each", "per", "total", "today", "yesterday",
+    "aaj", "kal"
+}
+
+
+class CategoryTaxonomy(str, Enum):
+    """
+    The set of categories the local categorizer assigns
+    """
+    # The categories of the extraction prompt's inference lexicon (food, petrol, ...)
+    LEXICON = "lexicon"
+    # The consolidated category registry (category_registry.json)
+    REGISTRY = "registry"
+
+
+def normalize_tokens(text: Optional[str]) -> Tuple[str, ...]:
+    """
+    Split a text into lowercase word tokens, transliterating Hinglish words and dropping
+    numbers and stopwords
+
+    Args:
+        text: An item name or user query
+
+    Returns:
+        The normalized tokens
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or "").lower()):
+        token = TRANSLITERATIONS.get(token, token)
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tuple(tokens)
+
+
+@dataclass
+class CategoryMatch:
+    """
+    A category assigned by the index, with how sure it is (0-1) and the keywords that matched
+    """
+    category: Optional[str]
+    confidence: float
+    keywords: List[str] = field(default_factory=list)
+
+
+class CategoryIndex:
+    """
+    Inverted index from normalized keyword phrases to expense categories
+
+    A text is matched greedily on its longest indexed phrases; a token with no exact entry
+    is retried without its plural suffix, then fuzzily against the single-word keywords.
+    Each match scores its phrase's specificity (tokens shared by several categories weigh
+    less) scaled by the match quality, and the confidence is the share of the winning
+    category in the total score times the quality of its matches.
+
+    Args:
+        keywords: The keywords of each category; category names are indexed as well
+        fallback_category: The category of an invoice without any match (None keeps it null)
+        mixed_category: The category of an invoice whose items match several categories,
+            None to pick the best scoring one
+        fuzzy_cutoff: The lowest similarity ratio of a fuzzy match
+        min_fuzzy_length: The shortest token matched fuzzily
+    """
+    def __init__(
+        self,
+        keywords: Dict[str, Iterable[str]],
+        fallback_category: Optional[str] = None,
+        mixed_category: Optional[str] = None,
+        fuzzy_cutoff: float = 0.85,
+        min_fuzzy_length: int = 4
+    ):
+        self.categories = list(keywords)
+        self.fallback_category = fallback_category
+        self.mixed_category = mixed_category
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.min_fuzzy_length = min_fuzzy_length
+        self.phrases: Dict[Tuple[str, ...], List[str]] = {}
+        for category, words in keywords.items():
+            for keyword in [category, *words]:
+                phrase = normalize_tokens(keyword)
+                if phrase and category not in self.phrases.setdefault(phrase, []):
+                    self.phrases[phrase].append(category)
+
+        token_categories: Dict[str, set] = {}
+        for phrase, categories in self.phrases.items():
+            for token in phrase:
+                token_categories.setdefault(token, set()).update(categories)
+        self.weights = {
+            phrase: sum(1 / len(token_categories[token]) for token in phrase)
+            for phrase in self.phrases
+        }
+        self.max_phrase_length = max((len(phrase) for phrase in self.phrases), default=1)
+        self.vocabulary = sorted(phrase[0] for phrase in self.phrases if len(phrase) == 1)
+        self._fuzzy_matches: Dict[str, Optional[Tuple[str, float]]] = {}
+
+    @classmethod
+    def from_lexicon(cls, rules: str = EXPENSE_CATEGORY_INFERENCE_RULES) -> "CategoryIndex":
+        """
+        Build the index from the inference lexicon of the extraction prompt, with its
+        "daily expense" category for items of several categories
+
+        Args:
+            rules: The category inference rules holding the lexicon
+        """
+        lexicon = rules.split("CATEGORY INFERENCE LEXICON", 1)[-1].split("Inference rules:", 1)[0]
+        keywords = {
+            match.group("category").strip(): [word.strip() for word in match.group("keywords").split(",")]
+            for match in LEXICON_LINE_PATTERN.finditer(lexicon)
+        }
+        return cls(keywords, mixed_category="daily expense")
+
+    @classmethod
+    def from_registry(cls, path: str = REGISTRY_PATH) -> "CategoryIndex":
+        """
+        Build the index from a category registry file
+
+        Args:
+            path: The JSON registry, with the keywords of each category
+        """
+        with open(path, encoding="utf-8") as registry_file:
+            registry = json.load(registry_file)
+        return cls(
+            {category["name"]: category.get("keywords", []) for category in registry["categories"]},
+            fallback_category=registry.get("fallback_category"),
+            mixed_category=registry.get("mixed_category")
+        )
+
+    def is_inferred(self, category: Optional[str], item_names: Iterable[Optional[str]]) -> bool:
+        """
+        Whether an invoice category is what the index infers from its items (or the fallback
+        category), so re-inferring it from changed items cannot overwrite a category the
+        user stated. A user stating the inferred category itself is indistinguishable from
+        inference and re-inferred as well.
+
+        Args:
+            category: The category of the invoice
+            item_names: The names of its items
+        """
+        if not category:
+            return True
+        category = category.strip().lower()
+        inferred = self.categorize(item_names).category
+        return any(category == name.lower() for name in (inferred, self.fallback_category) if name)
+
+    def _match_token(self, token: str) -> Optional[Tuple[Tuple[str, ...], float]]:
+        """
+        Get the single-word keyword a token stands for and the quality of the match
+        """
+        if (token,) in self.phrases:
+            return (token,), 1.0
+        for suffix in ("es", "s"):
+            if token.endswith(suffix) and (token[:-len(suffix)],) in self.phrases:
+                return (token[:-len(suffix)],), 1.0
+        if len(token) < self.min_fuzzy_length:
+            return None
+        if token not in self._fuzzy_matches:
+            close = difflib.get_close_matches(token, self.vocabulary, n=1, cutoff=self.fuzzy_cutoff)
+            self._fuzzy_matches[token] = (
+                (close[0], difflib.SequenceMatcher(None, token, close[0]).ratio()) if close else None
+            )
+        match = self._fuzzy_matches[token]
+        return ((match[0],), match[1]) if match else None
+
+    def classify(self, text: Optional[str]) -> Optional[CategoryMatch]:
+        """
+        Get the category of a single text
+
+        Args:
+            text: An item name or user query
+
+        Returns:
+            The best category, or None when no keyword matched
+        """
+        tokens = normalize_tokens(text)
+        scores: Dict[str, float] = {}
+        qualities: Dict[str, List[float]] = {}
+        keywords: Dict[str, List[str]] = {}
+        position = 0
+        while position < len(tokens):
+            for length in range(min(self.max_phrase_length, len(tokens) - position), 1, -1):
+                phrase = tokens[position:position + length]
+                if phrase in self.phrases:
+                    match = (phrase, 1.0)
+                    break
+            else:
+                length = 1
+                match = self._match_token(tokens[position])
+            position += length
+            if match is None:
+                continue
+            phrase, quality = match
+            categories = self.phrases[phrase]
+            for category in categories:
+                scores[category] = scores.get(category, 0.0) + self.weights[phrase] * quality / len(categories)
+                qualities.setdefault(category, []).append(quality)
+                keywords.setdefault(category, []).append(" ".join(phrase))
+        if not scores:
+            return None
+        category = max(scores, key=scores.get)
+        share = scores[category] / sum(scores.values())
+        quality = sum(qualities[category]) / len(qualities[category])
+        return CategoryMatch(category, round(share * quality, 4), keywords[category])
+
+    def categorize(self, item_names: Iterable[Optional[str]], fallback_text: Optional[str] = None) -> CategoryMatch:
+        """
+        Get the category of an invoice from the categories of its items
+
+        Args:
+            item_names: The names of the items of the invoice
+            fallback_text: Classified when no item name matched, e.g. the user query
+                ("petrol for bike 200" has the item "bike")
+
+        Returns:
+            The single category of the items, the mixed category (or the best scoring one)
+            for items of several categories, else the fallback category with no confidence
+        """
+        matches = [match for match in map(self.classify, filter(None, item_names)) if match is not None]
+        if not matches and fallback_text:
+            matches = [match for match in [self.classify(fallback_text)] if match is not None]
+        if not matches:
+            return CategoryMatch(self.fallback_category, 0.0)
+
+        totals: Dict[str, float] = {}
+        for match in matches:
+            totals[match.category] = totals.get(match.category, 0.0) + match.confidence
+        keywords = [keyword for match in matches for keyword in match.keywords]
+        confidence = min(match.confidence for match in matches)
+        if len(totals) == 1 or self.mixed_category is None:
+            best = max(totals, key=totals.get)
+            return CategoryMatch(best, round(totals[best] / sum(totals.values()) * confidence, 4), keywords)
+        return CategoryMatch(self.mixed_category, confidence, keywords)
+
+
+class LocalCategorizer:
+    """
+    Assigns the expense category of extracted invoices instead of the LLM
+
+    A category the user states in the turn (or gives when asked for one) is kept as
+    extracted, and so is a category of the previous invoice the index does not infer from
+    its items (one the user stated). Any other invoice gets the category of its items,
+    merged ones included, from the index.
+
+    Args:
+        index: The category index
+        min_confidence: Matches below it leave the category to the fallback category
+    """
+    def __init__(self, index: CategoryIndex, min_confidence: float = 0.0):
+        self.index = index
+        self.min_confidence = min_confidence
+        self.calls = 0
+        self.kept = 0
+        self.fallbacks = 0
+        self.total_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LocalCategorizer":
+        """
+        Build the categorizer from VYAPAR_T2B_CATEGORY_TAXONOMY (lexicon or registry) and
+        VYAPAR_T2B_CATEGORY_MIN_CONFIDENCE
+        """
+        taxonomy = CategoryTaxonomy(env_str("VYAPAR_T2B_CATEGORY_TAXONOMY", CategoryTaxonomy.LEXICON.value))
+        if taxonomy == CategoryTaxonomy.REGISTRY:
+            index = CategoryIndex.from_registry(env_str("VYAPAR_T2B_CATEGORY_REGISTRY_PATH", REGISTRY_PATH))
+        else:
+            index = CategoryIndex.from_lexicon()
+        return cls(index, min_confidence=env_float("VYAPAR_T2B_CATEGORY_MIN_CONFIDENCE", 0.0))
+
+    @staticmethod
+    def states_category(user_query: str, history: Optional[List[Dict]] = None) -> bool:
+        """
+        Whether the user query names the category, or answers the model asking for one
+
+        Args:
+            user_query: The user query of the turn
+            history: The history of the conversation, oldest turn first
+                (session_cache.sort_chronologically); the last turn with a model reply holds the question
+        """
+        last_question = next((turn["model"] for turn in reversed(history or []) if turn.get("model")), "")
+        return bool(EXPLICIT_CATEGORY_PATTERN.search(user_query or "") or EXPLICIT_CATEGORY_PATTERN.search(last_question))
+
+    def assign(
+        self,
+        invoice: ExpenseModel,
+        user_query: str,
+        latest_invoice: Any = None,
+        history: Optional[List[Dict]] = None,
+        explicit: Optional[bool] = None
+    ) -> ExpenseModel:
+        """
+        Set the expense category of an extracted invoice
+
+        Args:
+            invoice: The extracted invoice
+            user_query: The user query of the turn
+            latest_invoice: The invoice before the turn
+            history: The history of the conversation
+            explicit: Whether the extraction reported a user-stated category, detected from
+                the query and history when None
+
+        Returns:
+            The invoice with its category
+        """
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            if explicit is None:
+                explicit = self.states_category(user_query, history)
+            if explicit and invoice.expense_category:
+                self.kept += 1
+                return invoice
+            previous = get_invoice_data(latest_invoice)
+            previous_names = [item.get("item_name") for item in previous.get("items", [])]
+            if not self.index.is_inferred(previous.get("expense_category"), previous_names):
+                self.kept += 1
+                return invoice.model_copy(update={"expense_category": previous["expense_category"]})
+
+            match = self.index.categorize([item.item_name for item in invoice.items], user_query)
+            if match.confidence == 0.0 or match.confidence < self.min_confidence:
+                self.fallbacks += 1
+                return invoice.model_copy(update={"expense_category": self.index.fallback_category})
+            return invoice.model_copy(update={"expense_category": match.category})
+        finally:
+            self.total_seconds += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get how many invoices were categorized, kept their category or fell back, and the mean latency
+        """
+        return {
+            "calls": self.calls,
+            "kept": self.kept,
+            "fallbacks": self.fallbacks,
+            "mean_latency_ms": self.total_seconds / self.calls * 1000 if self.calls else 0.0
+        }
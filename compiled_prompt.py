@@ -0,0 +1,83 @@
+"""Module to pre-render the invariant parts of the talk2bill prompt templates"""
+from string import Formatter
+from typing import Any, List, Optional, Tuple
+
+FORMATTER = Formatter()
+
+
+class PromptParts(str):
+    """
+    A rendered prompt that also remembers its stable prefix and per-turn suffix
+
+    It is a plain `str` (prefix + suffix) for every existing caller, while LLMService can
+    send the prefix once as cached context and only the suffix on each turn.
+    """
+    prefix: str
+    suffix: str
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+class CompiledPrompt:
+    """
+    A `str.format` template parsed once, with its static fields rendered at construction
+
+    `render` only splices the per-turn fields into the pre-joined literal chunks, producing
+    exactly what `template.format(**static_fields, **fields)` would.
+    """
+    def __init__(self, template: str, **static_fields: Any):
+        # Alternating literal chunks and (field_name, conversion, format_spec) slots
+        self._chunks: List[str] = []
+        self._slots: List[Tuple[str, Optional[str], str]] = []
+        literal = []
+        for literal_text, field_name, format_spec, conversion in FORMATTER.parse(template):
+            literal.append(literal_text)
+            if field_name is None:
+                continue
+            if not field_name.isidentifier():
+                raise ValueError(f"Unsupported prompt field: {{{field_name}}}")
+            if field_name in static_fields:
+                literal.append(self._format_field(static_fields[field_name], conversion, format_spec))
+                continue
+            self._chunks.append("".join(literal))
+            self._slots.append((field_name, conversion, format_spec))
+            literal = []
+        self._chunks.append("".join(literal))
+        self.field_names = tuple(slot[0] for slot in self._slots)
+
+    @staticmethod
+    def _format_field(value: Any, conversion: Optional[str], format_spec: str) -> str:
+        if conversion == "r":
+            value = repr(value)
+        elif conversion == "s":
+            value = str(value)
+        elif conversion == "a":
+            value = ascii(value)
+        return format(value, format_spec)
+
+    @property
+    def static_prefix(self) -> str:
+        """
+        The rendered text before the first per-turn field
+        """
+        return self._chunks[0]
+
+    def render(self, **fields: Any) -> PromptParts:
+        """
+        Render the prompt with the per-turn fields
+
+        Args:
+            fields: The values of the fields that were not rendered at construction
+
+        Returns:
+            The rendered prompt, split after the static prefix
+        """
+        parts = []
+        for (field_name, conversion, format_spec), chunk in zip(self._slots, self._chunks[1:]):
+            parts.append(self._format_field(fields[field_name], conversion, format_spec))
+            parts.append(chunk)
+        return PromptParts(self._chunks[0], "".join(parts))
@@ -0,0 +1,202 @@
+"""Module to cache the static prompt prefixes on the LLM provider side"""
+import asyncio
+import hashlib
+import time
+import traceback
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+from crons.talk2bill.vyapar.tokens import estimate_tokens
+from logger.logger import Logger
+
+try:
+    from google import genai
+    from google.genai import types as genai_types
+except ImportError:  # pragma: no cover - optional dependency
+    genai = None
+    genai_types = None
+
+
+class ContextCacheBackend(ABC):
+    """
+    Provider API to store a prompt prefix and reference it by a handle on later calls
+    """
+    @abstractmethod
+    async def create(self, model: str, prefix: str, ttl_seconds: int) -> str:
+        """
+        Store the prefix on the provider
+
+        Args:
+            model: The model the cached content will be used with
+            prefix: The static prompt prefix
+            ttl_seconds: How long the provider keeps the content
+
+        Returns:
+            The handle (cached content name) to send instead of the prefix
+        """
+
+    @abstractmethod
+    async def delete(self, handle: str):
+        """
+        Delete cached content before it expires
+        """
+
+
+class GeminiContextCacheBackend(ContextCacheBackend):
+    """
+    Gemini explicit context caching through the google-genai SDK
+    """
+    def __init__(self, api_key: str):
+        if genai is None:
+            raise RuntimeError("google-genai is required for Gemini context caching")
+        self.client = genai.Client(api_key=api_key)
+
+    async def create(self, model: str, prefix: str, ttl_seconds: int) -> str:
+        cached_content = await self.client.aio.caches.create(
+            model=model,
+            config=genai_types.CreateCachedContentConfig(
+                contents=[prefix],
+                ttl=f"{ttl_seconds}s",
+                display_name="vyapar-t2b-prompt-prefix"
+            )
+        )
+        return cached_content.name
+
+    async def delete(self, handle: str):
+        await self.client.aio.caches.delete(name=handle)
+
+
+class InMemoryContextCacheBackend(ContextCacheBackend):
+    """
+    In-process stand-in for the provider cache, used with FakeChatModel in tests/benchmarks
+    """
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.contents: Dict[str, str] = {}
+
+    async def create(self, model: str, prefix: str, ttl_seconds: int) -> str:
+        if self.fail:
+            raise RuntimeError("Context caching unavailable")
+        handle = f"cachedContents/{uuid.uuid4().hex}"
+        self.contents[handle] = prefix
+        return handle
+
+    async def delete(self, handle: str):
+        self.contents.pop(handle, None)
+
+
+class ContextCacheManager:
+    """
+    Maps static prompt prefixes to provider cache handles
+
+    Handles are created once per prefix and refreshed shortly before their TTL runs out.
+    Prefixes below `min_prefix_tokens`, and prefixes whose cache creation failed (for
+    `failure_cooldown` seconds), fall back to sending the full prompt.
+    """
+    def __init__(
+        self,
+        backend: ContextCacheBackend,
+        model: str,
+        ttl_seconds: int = 3600,
+        min_prefix_tokens: int = 1024,
+        failure_cooldown: float = 300.0
+    ):
+        self.backend = backend
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.min_prefix_tokens = min_prefix_tokens
+        self.failure_cooldown = failure_cooldown
+        # prefix hash -> (handle, expires_at)
+        self._handles: Dict[str, Tuple[str, float]] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.creates = 0
+        self.fallbacks = 0
+        self.tokens_saved = 0
+
+    async def get_handle(self, prefix: str) -> Optional[str]:
+        """
+        Get the cache handle of a prefix, creating it if needed
+
+        Args:
+            prefix: The static prompt prefix
+
+        Returns:
+            The handle, or None when the full prompt must be sent
+        """
+        prefix_tokens = estimate_tokens(prefix)
+        if prefix_tokens < self.min_prefix_tokens:
+            return None
+
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        handle = self._get_live_handle(key)
+        if handle is None:
+            if self._failed_until.get(key, 0) > time.monotonic():
+                self.fallbacks += 1
+                return None
+            # Concurrent turns with the same prefix wait for a single creation
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                handle = self._get_live_handle(key) or await self._create(key, prefix)
+            if handle is None:
+                self.fallbacks += 1
+                return None
+        else:
+            self.hits += 1
+
+        self.tokens_saved += prefix_tokens
+        return handle
+
+    def invalidate(self, prefix: str):
+        """
+        Forget the handle of a prefix, e.g. after the provider rejected it as expired
+        """
+        self._handles.pop(hashlib.sha256(prefix.encode("utf-8")).hexdigest(), None)
+
+    def _get_live_handle(self, key: str) -> Optional[str]:
+        handle, expires_at = self._handles.get(key, (None, 0.0))
+        # Refresh early so a call never references a cache that expires in flight
+        if handle and expires_at - min(60, self.ttl_seconds / 10) > time.monotonic():
+            return handle
+        return None
+
+    async def _create(self, key: str, prefix: str) -> Optional[str]:
+        try:
+            handle = await self.backend.create(self.model, prefix, self.ttl_seconds)
+        except Exception as e:
+            self._failed_until[key] = time.monotonic() + self.failure_cooldown
+            Logger.warn({
+                "message": "Failed to create LLM context cache, sending full prompts",
+                "tag": "LLMService",
+                "data": {
+                    "error": str(e),
+                    "prefix_tokens": estimate_tokens(prefix),
+                    "traceback": traceback.format_exc()
+                }
+            })
+            return None
+
+        self._handles[key] = (handle, time.monotonic() + self.ttl_seconds)
+        self.creates += 1
+        Logger.info({
+            "message": "Created LLM context cache",
+            "tag": "LLMService",
+            "data": {
+                "handle": handle,
+                "prefix_tokens": estimate_tokens(prefix),
+                "ttl_seconds": self.ttl_seconds
+            }
+        })
+        return handle
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters
+        """
+        return {
+            "hits": self.hits,
+            "creates": self.creates,
+            "fallbacks": self.fallbacks,
+            "tokens_saved": self.tokens_saved,
+            "live_handles": len(self._handles)
+        }
@@ -0,0 +1,48 @@
+"""Module to read typed settings for the talk2bill pipeline from the environment"""
+from typing import Optional
+from config.settings import fetch_env
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Read a string setting
+
+    Args:
+        name: The name of the environment variable
+        default: The value to use when it is not set
+
+    Returns:
+        The value of the setting
+    """
+    value = fetch_env(name)
+    return value if value not in (None, "") else default
+
+
+def env_int(name: str, default: int) -> int:
+    """
+    Read an integer setting, falling back to the default when it is unset or invalid
+    """
+    try:
+        return int(env_str(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """
+    Read a float setting, falling back to the default when it is unset or invalid
+    """
+    try:
+        return float(env_str(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """
+    Read a boolean setting ("1", "true", "yes" and "on" are truthy)
+    """
+    value = env_str(name)
+    if value is None:
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
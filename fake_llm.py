@@ -0,0 +1,318 @@
+"""In-process stand-ins for the chat model used by LLMService and for the chat providers, for tests and offline benchmarks"""
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type, Union
+from pydantic import BaseModel
+from crons.talk2bill.vyapar.context_cache import InMemoryContextCacheBackend
+from crons.talk2bill.vyapar.providers import ChatProvider
+from crons.talk2bill.vyapar.response_models import get_output_schema
+from crons.talk2bill.vyapar.tokens import estimate_tokens
+
+# (prompt, response model) -> response model instance, dict, or an exception to raise
+Responder = Callable[[str, Type[BaseModel]], Any]
+
+
+def default_responder(prompt: str, response_format: Type[BaseModel]) -> BaseModel:
+    """
+    Answer every call with the defaults of the response model
+    """
+    try:
+        return response_format()
+    except Exception:  # pylint: disable=broad-except
+        return response_format.model_construct()
+
+
+def get_response_model(schema: Union[Type[BaseModel], Dict[str, Any]]) -> Type[BaseModel]:
+    """
+    Get the response model of a structured-output schema given as a model or its JSON schema
+    """
+    if not isinstance(schema, dict):
+        return schema
+    pending = list(BaseModel.__subclasses__())
+    while pending:
+        model = pending.pop()
+        pending.extend(model.__subclasses__())
+        if model.__name__ == schema.get("title") and schema in (model.model_json_schema(), get_output_schema(model)):
+            return model
+    raise ValueError(f"No response model matches the schema {schema.get('title')!r}")
+
+
+class ServiceUnavailable(Exception):
+    """
+    Injected provider failure, classified as transient like a Gemini 503
+    """
+
+
+class LatencyDistribution:
+    """
+    Log-normal call latency, the usual shape of LLM response times: most calls close to the
+    median with a long right tail
+    """
+    def __init__(self, median: float = 0.8, sigma: float = 0.4, seed: Optional[int] = None):
+        """
+        Args:
+            median: The median latency in seconds
+            sigma: The spread of the log of the latency, 0 for a constant latency
+            seed: The seed of the generator, for reproducible runs
+        """
+        self.median = median
+        self.sigma = sigma
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        """
+        Draw a latency in seconds
+        """
+        if self.median <= 0:
+            return 0.0
+        return self._random.lognormvariate(math.log(self.median), self.sigma)
+
+
+@dataclass
+class FakeMessage:
+    """
+    The raw message of a call, as returned with `include_raw=True`
+    """
+    content: str
+    usage_metadata: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class FakeCall:
+    """
+    A call received by the fake model
+    """
+    prompt: str
+    response_format: Type[BaseModel]
+    cached_content: Optional[str]
+    sent_chars: int
+
+
+class FakeChatModel:
+    """
+    Mimics the parts of ChatGoogleGenerativeAI that LLMService uses:
+    `with_structured_output(...).ainvoke(prompt)` and `model_copy(update={"cached_content": ...})`
+
+    Calls are answered by `responder` and recorded in `calls`. When a cache backend is given,
+    the cached prefix is prepended to the prompt the responder sees, as the provider would.
+    Each call waits for a latency drawn from `latency` and fails with ServiceUnavailable with
+    probability `error_rate`, so the pipeline can be benchmarked offline.
+    """
+    def __init__(
+        self,
+        responder: Optional[Responder] = None,
+        model: str = "fake-gemini",
+        cache_backend: Optional[InMemoryContextCacheBackend] = None,
+        cached_content: Optional[str] = None,
+        latency: Optional[LatencyDistribution] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        record_calls: bool = True
+    ):
+        self.responder = responder or default_responder
+        self.model = model
+        self.cache_backend = cache_backend
+        self.cached_content = cached_content
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        # Benchmarks turn the call log off so it does not show up in the peak memory
+        self.record_calls = record_calls
+        self.calls: List[FakeCall] = []
+
+    def model_copy(self, update: Optional[dict] = None) -> "FakeChatModel":
+        """
+        Copy the model with some fields replaced; the copy shares the call log and the
+        latency/error generators
+        """
+        copy = FakeChatModel(
+            self.responder,
+            self.model,
+            self.cache_backend,
+            self.cached_content,
+            self.latency,
+            self.error_rate,
+            record_calls=self.record_calls
+        )
+        copy.calls = self.calls
+        copy._random = self._random  # pylint: disable=protected-access
+        for field, value in (update or {}).items():
+            setattr(copy, field, value)
+        return copy
+
+    def with_structured_output(
+        self,
+        schema: Union[Type[BaseModel], Dict[str, Any]],
+        method: str = "json_schema",
+        include_raw: bool = False,
+        **kwargs
+    ) -> "FakeStructuredRunnable":
+        """
+        Get a runnable that answers with instances of `schema`, or with dicts when the schema is
+        a JSON schema, like the real model
+        """
+        return FakeStructuredRunnable(
+            self,
+            get_response_model(schema),
+            as_dict=isinstance(schema, dict),
+            include_raw=include_raw
+        )
+
+    def resolve_prompt(self, prompt: str) -> str:
+        """
+        Get the full prompt of a call, including the cached prefix it references
+        """
+        if self.cached_content is None:
+            return prompt
+        if self.cache_backend is None or self.cached_content not in self.cache_backend.contents:
+            raise LookupError(f"404 CachedContent not found: {self.cached_content}")
+        return self.cache_backend.contents[self.cached_content] + prompt
+
+
+class FakeStructuredRunnable:
+    """
+    Structured-output runnable of FakeChatModel
+    """
+    def __init__(
+        self,
+        llm: FakeChatModel,
+        schema: Type[BaseModel],
+        as_dict: bool = False,
+        include_raw: bool = False
+    ):
+        self.llm = llm
+        self.schema = schema
+        self.as_dict = as_dict
+        self.include_raw = include_raw
+
+    def _respond(self, prompt: str) -> Any:
+        """
+        Record the call and get the responder's answer, raising injected or scripted errors
+
+        Returns:
+            The full prompt (with the cached prefix) and the parsed answer
+        """
+        full_prompt = self.llm.resolve_prompt(str(prompt))
+        if self.llm.record_calls:
+            self.llm.calls.append(FakeCall(
+                prompt=full_prompt,
+                response_format=self.schema,
+                cached_content=self.llm.cached_content,
+                sent_chars=len(str(prompt))
+            ))
+        if self.llm.error_rate and self.llm._random.random() < self.llm.error_rate:  # pylint: disable=protected-access
+            raise ServiceUnavailable("503 The model is overloaded (injected by FakeChatModel)")
+        result = self.llm.responder(full_prompt, self.schema)
+        if isinstance(result, BaseException):
+            raise result
+        if self.as_dict:
+            return full_prompt, result.model_dump(mode="json") if isinstance(result, BaseModel) else result
+        return full_prompt, self.schema.model_validate(result) if isinstance(result, dict) else result
+
+    async def ainvoke(self, prompt: str, config: Any = None, **kwargs) -> Any:
+        """
+        Answer the prompt with the responder, validating dict answers into the schema
+
+        Returns:
+            The response model instance, its dict when built from a JSON schema, and
+            {"raw", "parsed", "parsing_error"} with `include_raw`
+        """
+        if self.llm.latency is not None:
+            await asyncio.sleep(self.llm.latency.sample())
+        full_prompt, parsed = self._respond(prompt)
+        if not self.include_raw:
+            return parsed
+
+        content = json.dumps(parsed) if isinstance(parsed, dict) else parsed.model_dump_json()
+        raw = FakeMessage(content=content, usage_metadata={
+            "input_tokens": estimate_tokens(full_prompt),
+            "output_tokens": estimate_tokens(content)
+        })
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+    async def astream(self, prompt: str, config: Any = None, **kwargs) -> AsyncIterator[Any]:
+        """
+        Stream the answer as cumulative partial dicts, the `question` growing word by word,
+        like the JSON output parser does on a streamed response
+
+        The first partial arrives after 40% of the sampled latency, the rest is spread over
+        the words.
+        """
+        latency = self.llm.latency.sample() if self.llm.latency is not None else 0.0
+        await asyncio.sleep(latency * 0.4)
+        _, parsed = self._respond(prompt)
+        data = parsed.model_dump(mode="json") if isinstance(parsed, BaseModel) else dict(parsed)
+        words = data.get("question").split(" ") if isinstance(data.get("question"), str) else []
+        for count in range(1, len(words)):
+            yield {key: value for key, value in data.items() if key != "status"} | {
+                "question": " ".join(words[:count])
+            }
+            await asyncio.sleep(latency * 0.6 / len(words))
+        yield data
+
+
+class FakeChatProvider(ChatProvider):
+    """
+    Offline ChatProvider: text replies come from `responder(prompt, model)` (text, or a dict
+    sent as JSON), structured replies from `structured_responder(prompt, response model)` like
+    FakeChatModel's. Each call waits for a latency drawn from `latency` and fails with
+    ServiceUnavailable with probability `error_rate`; both can be changed mid-run to script
+    an outage and its recovery.
+    """
+    def __init__(
+        self,
+        responder: Optional[Callable[[str, str], Any]] = None,
+        structured_responder: Optional[Responder] = None,
+        name: str = "fake",
+        model: str = "fake-model",
+        latency: Optional[LatencyDistribution] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__(api_key="fake", model=model)
+        self.name = name
+        self.responder = responder or (lambda prompt, model: "{}")
+        self.structured_responder = structured_responder or default_responder
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def _create_client(self) -> Any:
+        return self
+
+    async def _wait_or_fail(self):
+        if self.latency is not None:
+            await asyncio.sleep(self.latency.sample())
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ServiceUnavailable(f"503 The model is overloaded (injected by FakeChatProvider {self.name})")
+
+    async def _complete(self, client: Any, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        await self._wait_or_fail()
+        result = self.responder(prompt, model)
+        if isinstance(result, BaseException):
+            raise result
+        return result if isinstance(result, str) else json.dumps(result)
+
+    async def _complete_structured(
+        self,
+        client: Any,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        await self._wait_or_fail()
+        result = self.structured_responder(prompt, get_response_model(schema))
+        if isinstance(result, BaseException):
+            raise result
+        parsed = result.model_dump(mode="json") if isinstance(result, BaseModel) else result
+        content = json.dumps(parsed)
+        usage = {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(content)}
+        return parsed, usage, content
+
+    async def aclose(self):
+        self._client = None
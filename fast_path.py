@@ -0,0 +1,335 @@
+"""Module to resolve trivial talk2bill turns locally, without calling the LLM"""
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from constants.talk2bill.vyapar.models import ExpenseModel, ConversationStatus
+from logger.logger import Logger
+
+# Replies spelled out by GENERIC_QUESTION_ASK_PROMPT and the extraction SPECIAL CASES
+NEGATIVE_REPLIES = {
+    "no", "nope", "nah", "no thanks", "that's all", "thats all", "done", "finished",
+    "not interested", "nothing else", "no more", "nahi", "bas"
+}
+AFFIRMATIVE_REPLIES = {"yes", "yeah", "yep", "sure", "okay", "ok", "alright", "yup", "haan"}
+# Replies that may change the invoice in ways only the LLM resolves
+AMBIGUOUS_REPLIES = {"cancel", "stop", "nevermind", "never mind", "remove", "delete"}
+
+AMOUNT_REPLY_PATTERN = re.compile(
+    r"^(?:rs\.?|inr|₹|rupees?)?\s*(\d+(?:,\d{3})*(?:\.\d+)?)\s*(?:rs\.?|inr|rupees?|/-|₹)?$"
+)
+QUANTITY_REPLY_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*(?:kg|g|l|litres?|liters?|ml|pcs?|pieces?)?$")
+WORDS_REPLY_PATTERN = re.compile(r"^[a-z][a-z &'-]{0,40}$")
+
+ADD_ANOTHER_MARKERS = ("add another", "add more", "more items", "anything else")
+AMOUNT_QUESTION_MARKERS = ("how much",)
+QUANTITY_QUESTION_MARKERS = ("what quantity", "how many")
+CATEGORY_QUESTION_MARKERS = ("which category", "what category")
+PAYMENT_QUESTION_MARKERS = ("how did you pay", "payment method", "payment type")
+
+# The required fields spelled out by EXPENSE_MISSING_FIELDS_PROMPT_VYP
+REQUIRED_FIELDS = ["expense_category", "items", "payment_type"]
+REQUIRED_ITEM_FIELDS = ["item_name", "item_amount", "item_qty"]
+
+GENERIC_START_QUESTION = "What did you spend money on today?"
+
+
+@dataclass
+class FastPathResult:
+    """
+    A turn resolved without the LLM
+    """
+    intent: str
+    invoice: ExpenseModel
+    question: str
+    conversation_status: str
+    rule: str
+
+
+def normalize_reply(user_query: str) -> str:
+    """
+    Lower-case the reply and strip surrounding punctuation and spaces
+    """
+    return re.sub(r"\s+", " ", (user_query or "").strip().lower()).strip(" .!?,")
+
+
+def get_last_model_question(history: List[Dict]) -> str:
+    """
+    Get the last question asked by the model (history is in chronological order)
+    """
+    for turn in reversed(history or []):
+        if turn.get("model"):
+            return turn["model"].strip().lower()
+    return ""
+
+
+def is_positive_number(value: Any) -> bool:
+    """
+    Check that a value is a number greater than 0
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def parse_number(text: str) -> float:
+    """
+    Parse a number from a reply, keeping integers as int ("500" -> 500)
+    """
+    value = float(text.replace(",", ""))
+    return int(value) if value.is_integer() else value
+
+
+def format_number(value: float) -> str:
+    """
+    Format an amount the way the model phrases it ("100", not "100.0")
+    """
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def get_follow_up_question(invoice: ExpenseModel) -> Optional[str]:
+    """
+    Ask for the missing fields of an invoice with the wording of EXPENSE_MISSING_FIELDS_PROMPT_VYP
+
+    Args:
+        invoice: The invoice to validate
+
+    Returns:
+        "" when every required field is valid, the question when a templated one exists,
+        None when the missing fields need the LLM to phrase the question
+    """
+    invoice_data = invoice.model_dump()
+    items = invoice_data.get("items") or []
+    if not items:
+        return None
+
+    unnamed_amounts = [
+        format_number(item["item_amount"]) for item in items
+        if not item.get("item_name") and is_positive_number(item.get("item_amount"))
+    ]
+    if unnamed_amounts:
+        return f"What did you spend {' and '.join(unnamed_amounts[:3])} on?"
+
+    for item in items:
+        missing = [
+            field for field in REQUIRED_ITEM_FIELDS
+            if (field == "item_name" and not item.get(field))
+            or (field != "item_name" and not is_positive_number(item.get(field)))
+        ]
+        if missing == ["item_amount"]:
+            return f"How much did you spend on {item['item_name']}?"
+        if missing == ["item_qty"]:
+            return f"What quantity for {item['item_name']}?"
+        if missing:
+            return None
+
+    missing_fields = [
+        field for field in REQUIRED_FIELDS
+        if field != "items" and not (isinstance(invoice_data.get(field), str) and invoice_data[field].strip())
+    ]
+    if not missing_fields:
+        return ""
+    if missing_fields == ["expense_category"]:
+        return "Which category is this expense?"
+    return None
+
+
+class TrivialTurnResolver:
+    """
+    Pre-LLM stage that resolves short replies to the last model question deterministically
+
+    Only outcomes the prompts already spell out are resolved: a bare amount/quantity/category/
+    payment answering the matching question, "no"/"that's all" closing a finished invoice or
+    a greeting, and "yes" to an empty conversation. Anything else returns None and the turn
+    goes through the LLM.
+    """
+    def __init__(self):
+        self.attempts = 0
+        self.hits: Dict[str, int] = {}
+        self.latency_saved = 0.0
+        # Moving average of the LLM path, used to estimate the latency each hit saves
+        self.llm_turn_latency = 0.0
+
+    def record_llm_turn(self, latency: float):
+        """
+        Record the latency of a turn that went through the LLM
+        """
+        if self.llm_turn_latency == 0.0:
+            self.llm_turn_latency = latency
+        else:
+            self.llm_turn_latency = 0.9 * self.llm_turn_latency + 0.1 * latency
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hit rate, hits per rule and estimated latency saved
+        """
+        total_hits = sum(self.hits.values())
+        return {
+            "attempts": self.attempts,
+            "hits": total_hits,
+            "hit_rate": total_hits / self.attempts if self.attempts else 0.0,
+            "hits_by_rule": dict(self.hits),
+            "latency_saved": self.latency_saved
+        }
+
+    def resolve(
+        self,
+        user_query: str,
+        history: List[Dict],
+        latest_invoice: Optional[Dict[str, Any]]
+    ) -> Optional[FastPathResult]:
+        """
+        Resolve the turn locally if its outcome is deterministic
+
+        Args:
+            user_query: The user query
+            history: The session history, in chronological order
+            latest_invoice: The latest invoice of the session
+
+        Returns:
+            The resolved turn, or None to fall back to the LLM
+        """
+        self.attempts += 1
+        try:
+            result = self._resolve(normalize_reply(user_query), history, latest_invoice)
+        except Exception as e:  # pylint: disable=broad-except
+            Logger.warn({
+                "message": "Fast path failed, falling back to LLM",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "user_query": user_query,
+                    "error": str(e)
+                }
+            })
+            result = None
+
+        if result is not None:
+            self.hits[result.rule] = self.hits.get(result.rule, 0) + 1
+            self.latency_saved += self.llm_turn_latency
+            Logger.info({
+                "message": "Resolved turn on fast path",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "user_query": user_query,
+                    "rule": result.rule,
+                    "conversation_status": result.conversation_status
+                }
+            })
+        return result
+
+    def _resolve(
+        self,
+        reply: str,
+        history: List[Dict],
+        latest_invoice: Optional[Dict[str, Any]]
+    ) -> Optional[FastPathResult]:
+        if not reply or reply in AMBIGUOUS_REPLIES:
+            return None
+
+        last_question = get_last_model_question(history)
+        invoice = ExpenseModel.model_validate(latest_invoice) if latest_invoice else None
+        has_items = bool(invoice and invoice.items)
+
+        if reply in NEGATIVE_REPLIES:
+            if has_items and any(marker in last_question for marker in ADD_ANOTHER_MARKERS):
+                # "no" to "add another item?": invoice unchanged, complete once nothing is missing
+                if get_follow_up_question(invoice) == "":
+                    return self._complete("expense", invoice, "no_more_items")
+                return None
+            if not has_items and not history:
+                return self._complete("other", ExpenseModel(), "generic_decline")
+            return None
+
+        if reply in AFFIRMATIVE_REPLIES:
+            if not has_items and not history:
+                return FastPathResult(
+                    intent="other",
+                    invoice=ExpenseModel(),
+                    question=GENERIC_START_QUESTION,
+                    conversation_status=ConversationStatus.CONTINUE.value,
+                    rule="generic_accept"
+                )
+            return None
+
+        if not has_items:
+            return None
+        return self._fill_asked_field(reply, last_question, invoice)
+
+    def _fill_asked_field(
+        self,
+        reply: str,
+        last_question: str,
+        invoice: ExpenseModel
+    ) -> Optional[FastPathResult]:
+        updated = invoice.model_copy(deep=True)
+        rule = None
+
+        amount_match = AMOUNT_REPLY_PATTERN.match(reply)
+        quantity_match = QUANTITY_REPLY_PATTERN.match(reply)
+        if amount_match and any(marker in last_question for marker in AMOUNT_QUESTION_MARKERS):
+            item = self._get_asked_item(updated, last_question, "item_amount")
+            if item is None:
+                return None
+            item.item_amount = parse_number(amount_match.group(1))
+            rule = "amount_answer"
+        elif quantity_match and any(marker in last_question for marker in QUANTITY_QUESTION_MARKERS):
+            item = self._get_asked_item(updated, last_question, "item_qty")
+            if item is None:
+                return None
+            item.item_qty = parse_number(quantity_match.group(1))
+            rule = "quantity_answer"
+        elif (
+            WORDS_REPLY_PATTERN.match(reply) and len(reply.split()) <= 3
+            # A word reply to an amount/quantity question ("forty", "sau") is a spelled number
+            and not any(marker in last_question for marker in AMOUNT_QUESTION_MARKERS + QUANTITY_QUESTION_MARKERS)
+        ):
+            if any(marker in last_question for marker in CATEGORY_QUESTION_MARKERS):
+                if updated.expense_category:
+                    return None
+                # An explicit category is kept verbatim (CATEGORY EXTRACTION RULES)
+                updated.expense_category = reply
+                rule = "category_answer"
+            elif any(marker in last_question for marker in PAYMENT_QUESTION_MARKERS):
+                if updated.payment_type:
+                    return None
+                updated.payment_type = reply
+                rule = "payment_answer"
+
+        if rule is None:
+            return None
+        question = get_follow_up_question(updated)
+        if question is None:
+            return None
+        if question == "":
+            return self._complete("expense", updated, rule)
+        return FastPathResult(
+            intent="expense",
+            invoice=updated,
+            question=question,
+            conversation_status=ConversationStatus.CONTINUE.value,
+            rule=rule
+        )
+
+    @staticmethod
+    def _get_asked_item(invoice: ExpenseModel, last_question: str, field: str):
+        """
+        Get the single item the question asked about: the one named in the question, or the
+        only item missing the field. None when it is ambiguous.
+        """
+        candidates = [item for item in invoice.items if not is_positive_number(getattr(item, field))]
+        named = [
+            item for item in candidates
+            if item.item_name and item.item_name.lower() in last_question
+        ]
+        if len(named) == 1:
+            return named[0]
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    @staticmethod
+    def _complete(intent: str, invoice: ExpenseModel, rule: str) -> FastPathResult:
+        return FastPathResult(
+            intent=intent,
+            invoice=invoice,
+            question="",
+            conversation_status=ConversationStatus.COMPLETE.value,
+            rule=rule
+        )
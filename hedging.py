@@ -0,0 +1,232 @@
+"""Module to bound the latency of LLM calls of the talk2bill pipeline with deadlines and hedged requests"""
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+from crons.talk2bill.vyapar.env import env_float, env_int
+
+T = TypeVar("T")
+
+# Monotonic time by which the current turn must be answered, set by `turn_deadline`
+TURN_DEADLINE: ContextVar[Optional[float]] = ContextVar("talk2bill_turn_deadline", default=None)
+
+
+class LLMCallTimeout(TimeoutError):
+    """
+    Raised when an LLM call (and its hedge) did not answer within the call deadline;
+    classified as transient, so `_invoke` retries it while the turn budget allows
+    """
+
+
+class TurnBudgetExceeded(Exception):
+    """
+    Raised instead of calling the LLM once the deadline of the turn has passed
+    """
+
+
+@contextmanager
+def turn_deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """
+    Share a deadline of `seconds` between every LLM call of the block, including the ones
+    of tasks it spawns. A falsy value leaves the calls bounded by their own deadline only.
+
+    Args:
+        seconds: The budget of the turn
+
+    Yields:
+        The monotonic deadline, or None
+    """
+    deadline = time.monotonic() + seconds if seconds else None
+    token = TURN_DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        TURN_DEADLINE.reset(token)
+
+
+def remaining_turn_budget() -> Optional[float]:
+    """
+    Get the seconds left before the deadline of the current turn, None without a deadline
+    """
+    deadline = TURN_DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class LatencyWindow:
+    """
+    Latencies of the most recent successful calls of a method
+    """
+    def __init__(self, max_samples: int = 500):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Get a percentile (0-100) of the window, nearest-rank
+        """
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class Hedger:
+    """
+    Runs LLM calls under a deadline, firing a duplicate request when one is slow
+
+    Every call is bounded by `call_timeout` and by the remaining turn budget. When
+    `hedge_percentile` is set and at least `min_samples` latencies of the method were
+    observed, a call still pending after that percentile of its recent latency (never less
+    than `min_hedge_delay`) gets one hedge; the first successful answer wins and the other
+    request is cancelled.
+    """
+    def __init__(
+        self,
+        call_timeout: float = 30.0,
+        hedge_percentile: Optional[float] = None,
+        min_samples: int = 20,
+        min_hedge_delay: float = 0.5,
+        max_samples: int = 500
+    ):
+        self.call_timeout = call_timeout
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.max_samples = max_samples
+        self._latencies: Dict[str, LatencyWindow] = {}
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.budget_exhausted = 0
+
+    @classmethod
+    def from_env(cls) -> "Hedger":
+        """
+        Build the hedger from VYAPAR_T2B_LLM_CALL_TIMEOUT and VYAPAR_T2B_HEDGE_* settings;
+        hedging stays off unless VYAPAR_T2B_HEDGE_PERCENTILE is set
+        """
+        return cls(
+            call_timeout=env_float("VYAPAR_T2B_LLM_CALL_TIMEOUT", 30.0),
+            hedge_percentile=env_float("VYAPAR_T2B_HEDGE_PERCENTILE", 0.0) or None,
+            min_samples=env_int("VYAPAR_T2B_HEDGE_MIN_SAMPLES", 20),
+            min_hedge_delay=env_float("VYAPAR_T2B_HEDGE_MIN_DELAY", 0.5)
+        )
+
+    def get_timeout(self) -> float:
+        """
+        Get the deadline of a call: the call timeout, capped by the remaining turn budget
+
+        Raises:
+            TurnBudgetExceeded: If the turn has no budget left
+        """
+        remaining = remaining_turn_budget()
+        if remaining is None:
+            return self.call_timeout
+        if remaining <= 0:
+            self.budget_exhausted += 1
+            raise TurnBudgetExceeded("The turn deadline passed before the LLM call")
+        return min(self.call_timeout, remaining)
+
+    def get_hedge_delay(self, method: str) -> Optional[float]:
+        """
+        Get how long a call of the method may run before it is hedged, None to never hedge
+        """
+        window = self._latencies.get(method)
+        if self.hedge_percentile is None or window is None or len(window.samples) < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, window.percentile(self.hedge_percentile))
+
+    async def call(
+        self,
+        method: str,
+        make_call: Callable[[], Awaitable[T]],
+        make_hedge: Optional[Callable[[], Awaitable[T]]] = None
+    ) -> T:
+        """
+        Run a call under its deadline, hedging it when it is slow
+
+        Args:
+            method: The calling method, whose recent latencies decide when to hedge
+            make_call: Starts the request
+            make_hedge: Starts the duplicate request, defaults to `make_call`
+
+        Returns:
+            The answer of the first request that succeeded
+
+        Raises:
+            LLMCallTimeout: If no request answered before the call timeout
+            TurnBudgetExceeded: If the turn has no budget left, or ran out of it before any
+                request answered
+            Exception: The error of the request when it failed before being hedged, or the
+                last error when every request failed
+        """
+        timeout = self.get_timeout()
+        budget_limited = timeout < self.call_timeout
+        hedge_delay = self.get_hedge_delay(method)
+        self.calls += 1
+
+        start = time.monotonic()
+        deadline = start + timeout
+        hedge_at = start + hedge_delay if hedge_delay is not None and hedge_delay < timeout else None
+        primary = asyncio.ensure_future(make_call())
+        started_at = {primary: start}
+        pending = {primary}
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, wake_at - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self._record_latency(method, time.monotonic() - started_at[task])
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+
+                now = time.monotonic()
+                if pending and hedge_at is not None and now >= hedge_at:
+                    hedge = asyncio.ensure_future((make_hedge or make_call)())
+                    started_at[hedge] = now
+                    pending.add(hedge)
+                    hedge_at = None
+                    self.hedges_fired += 1
+                elif pending and now >= deadline:
+                    if budget_limited:
+                        # The turn ran out of time, not the call: says nothing about the API's
+                        # health, so it must not reach the circuit breaker as a timeout
+                        self.budget_exhausted += 1
+                        raise TurnBudgetExceeded(f"The turn deadline passed during the LLM call of {method}")
+                    self.timeouts += 1
+                    raise LLMCallTimeout(f"LLM call of {method} did not answer within {timeout:.1f}s")
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _record_latency(self, method: str, latency: float):
+        window = self._latencies.get(method)
+        if window is None:
+            window = self._latencies[method] = LatencyWindow(self.max_samples)
+        window.samples.append(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get how often calls timed out, hedges fired and hedges won, and the current hedge delays
+        """
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "budget_exhausted": self.budget_exhausted,
+            "hedges_fired": self.hedges_fired,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges_fired if self.hedges_fired else 0.0,
+            "hedge_delays": {method: self.get_hedge_delay(method) for method in self._latencies}
+        }
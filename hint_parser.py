@@ -0,0 +1,396 @@
+"""Module to pre-parse the amounts, quantities and payment method of talk2bill user inputs deterministically"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from crons.talk2bill.vyapar.env import env_float
+from crons.talk2bill.vyapar.prompt_budget import compact_json
+
+TOKEN_PATTERN = re.compile(
+    r"\d+(?:st|nd|rd|th)\b"
+    r"|₹\s*\d[\d,]*(?:\.\d+)?"
+    r"|\d[\d,]*(?:\.\d+)?(?:/-)?"
+    r"|/-|₹"
+    r"|[^\W\d_]+(?:'[^\W\d_]+)?"
+    r"|[,;&/?]"
+)
+NUMBER_TOKEN_PATTERN = re.compile(r"^₹?\s*(\d[\d,]*(?:\.\d+)?)(/-)?$")
+ORDINAL_PATTERN = re.compile(r"^\d+(?:st|nd|rd|th)$")
+
+# English and Hindi (romanized) number words of the quantity/amount rules: "one", "two", "ek", "do", ...
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+    "ek": 1, "do": 2, "teen": 3, "char": 4, "chaar": 4, "paanch": 5, "panch": 5, "chhe": 6, "chhah": 6,
+    "saat": 7, "aath": 8, "nau": 9, "das": 10, "gyarah": 11, "barah": 12, "pandrah": 15, "bees": 20,
+    "pachchees": 25, "tees": 30, "chalis": 40, "pachas": 50, "pachaas": 50, "sattar": 70, "assi": 80,
+    "dedh": 1.5, "dhai": 2.5, "adha": 0.5, "aadha": 0.5
+}
+MULTIPLIER_WORDS = {"hundred": 100, "sau": 100, "thousand": 1000, "hazaar": 1000, "hazar": 1000, "lakh": 100000, "lac": 100000}
+# "do" is also an English verb: read as 2 only when no pronoun or particle precedes it
+AMBIGUOUS_NUMBER_WORDS = {"do"}
+VERB_CONTEXT_WORDS = {"i", "you", "we", "to", "please", "not", "don't", "dont", "can", "will", "should", "how", "what"}
+
+# CURRENCY TERMS and UNIT TERMS of the extraction prompt: never an item name
+CURRENCY_WORDS = {"rs", "inr", "rupee", "rupees", "rupaye", "rupay", "rupya", "₹", "/-"}
+UNIT_WORDS = {
+    "kg", "kgs", "kilo", "kilos", "kilogram", "kilograms", "g", "gm", "gms", "gram", "grams", "l", "ltr",
+    "liter", "liters", "litre", "litres", "ml", "piece", "pieces", "pc", "pcs", "packet", "packets",
+    "dozen", "box", "boxes", "bottle", "bottles", "plate", "plates", "cup", "cups"
+}
+# Payment methods spelled out by the PAYMENT TYPE EXTRACTION RULES, kept exactly as the user said them
+PAYMENT_METHODS = {
+    "cash", "card", "upi", "gpay", "phonepe", "paytm", "bhim", "cheque", "credit", "debit", "online",
+    "neft", "imps", "rtgs", "transfer", "wallet", "netbanking", "amazonpay"
+}
+PAYMENT_PHRASES = {
+    ("credit", "card"), ("debit", "card"), ("google", "pay"), ("amazon", "pay"), ("net", "banking"),
+    ("bank", "transfer"), ("online", "transfer")
+}
+BANK_NAMES = {"sbi", "hdfc", "icici", "axis", "kotak", "pnb", "bob", "canara", "idfc", "indusind", "federal", "union"}
+# "paid through X", "via X", "using X": X is the payment method even when it is not a known one
+PAYMENT_CUES = {"through", "via", "using"}
+PAYMENT_PARTICLES = {"by", "in", "with", "from", "se", "mein", "me", "payment", "paid", "pay"}
+
+FILLER_WORDS = {
+    "add", "added", "adding", "i", "want", "to", "an", "a", "the", "expense", "of", "my", "paid", "pay",
+    "spent", "spend", "kharcha", "kiya", "ke", "ka", "ki", "ko", "liye", "lie", "diye", "diya", "de", "hai",
+    "tha", "mein", "me", "se", "in", "on", "also", "as", "well", "please", "record", "rupees", "it", "is",
+    "was", "new", "item", "for"
+}
+# Inputs the parse cannot resolve alone: per-unit/group prices, edits of existing items and
+# explicit categories are left to the LLM
+COMPLEX_WORDS = {
+    "each", "per", "total", "both", "all", "remove", "delete", "change", "instead", "cancel", "not", "nahi",
+    "replace", "update", "make", "correct", "category", "under", "received", "got", "mila", "?", "/"
+}
+SEPARATOR_TOKENS = {",", ";", "&", "and", "aur", "plus"}
+# Days and dates ("yesterday", "on 5th", "kal"): never an item name, and their numbers are neither
+# amounts nor quantities, so a segment with one is left to the LLM
+DATE_WORDS = {
+    "today", "yesterday", "tomorrow", "tonight", "aaj", "kal", "parso", "parson", "date", "tarikh", "tareekh",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "week", "month",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec"
+}
+
+
+@dataclass
+class ParsedItem:
+    """
+    An item of the input: its name, total amount and quantity as far as the patterns tell
+    """
+    item_name: Optional[str] = None
+    item_amount: Optional[float] = None
+    item_qty: Optional[float] = None
+    unit: Optional[str] = None
+
+
+@dataclass
+class ExpenseHints:
+    """
+    What the pre-parser found in a user input
+
+    `confidence` is 1.0 only when every item has a name and an amount and nothing in the
+    input (group prices, edits, explicit categories, dates, several payment methods) needs
+    the extraction rules of the LLM.
+    """
+    items: List[ParsedItem] = field(default_factory=list)
+    amounts: List[float] = field(default_factory=list)
+    payment_type: Optional[str] = None
+    confidence: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the hints as plain data, without nulls
+        """
+        return {
+            "items": [
+                {"item_name": item.item_name, "item_amount": item.item_amount, "item_qty": item.item_qty}
+                for item in self.items
+            ],
+            "payment_type": self.payment_type
+        }
+
+    def to_prompt(self) -> str:
+        """
+        Render the hints for the extraction prompt as compact JSON
+        """
+        return compact_json(self.to_dict())
+
+
+def to_number(value: float) -> float:
+    """
+    Keep whole numbers as int ("500" -> 500)
+    """
+    return int(value) if float(value).is_integer() else value
+
+
+def tokenize(text: str) -> List[Tuple[str, Any]]:
+    """
+    Split an input into (kind, value) tokens: "num", "word", "date" and "sep", with runs of
+    number words ("do hazaar paanch sau") folded into one number and ordinals ("5th") read as dates
+
+    Args:
+        text: The user input
+
+    Returns:
+        The tokens in order
+    """
+    raw = TOKEN_PATTERN.findall((text or "").lower())
+    tokens: List[Tuple[str, Any]] = []
+    index = 0
+    while index < len(raw):
+        token = raw[index]
+        if ORDINAL_PATTERN.match(token) or token in DATE_WORDS:
+            tokens.append(("date", token))
+            index += 1
+            continue
+        number = NUMBER_TOKEN_PATTERN.match(token)
+        if number:
+            tokens.append(("num", to_number(float(number.group(1).replace(",", "")))))
+            if number.group(2):
+                tokens.append(("word", "/-"))
+            index += 1
+            continue
+        if token in NUMBER_WORDS or token in MULTIPLIER_WORDS:
+            words = []
+            while index < len(raw) and (raw[index] in NUMBER_WORDS or raw[index] in MULTIPLIER_WORDS):
+                words.append(raw[index])
+                index += 1
+            previous = tokens[-1][1] if tokens else None
+            if len(words) == 1 and words[0] in AMBIGUOUS_NUMBER_WORDS and previous in VERB_CONTEXT_WORDS:
+                tokens.append(("word", "do"))
+            else:
+                tokens.append(("num", to_number(words_to_number(words))))
+            continue
+        tokens.append(("sep" if token in SEPARATOR_TOKENS else "word", token))
+        index += 1
+    return tokens
+
+
+def words_to_number(words: List[str]) -> float:
+    """
+    Get the value of a run of number words ("two hundred fifty", "do hazaar paanch sau")
+    """
+    total, current = 0.0, 0.0
+    for word in words:
+        multiplier = MULTIPLIER_WORDS.get(word)
+        if multiplier is None:
+            current += NUMBER_WORDS[word]
+        elif multiplier == 100:
+            current = (current or 1) * multiplier
+        else:
+            total += (current or 1) * multiplier
+            current = 0.0
+    return total + current
+
+
+class HintParser:
+    """
+    Pattern-based pre-parser of expense inputs
+
+    Payment methods are taken out first (the last one after "paid through/via/using" wins,
+    else the last known method). The rest is split into segments on "and", "aur", "&" and
+    commas; in each segment a number next to a currency term is an amount, a number before
+    a unit is a quantity, a bare number before an item name is a quantity ("2 chai for 40",
+    and "2 chai" with no amount), and the remaining words are the item name. An amount-only
+    segment followed by a "<qty> <unit> <item>" segment is one item ("Rs 100, 5 kg rice").
+    Name words on both sides of the amount, or after a bare one ("chai 20 from 3 shops"),
+    and dates ("bus 20 on 5th") leave the segment to the LLM.
+
+    Args:
+        direct_confidence: The confidence from which the parse replaces the LLM extraction
+    """
+    def __init__(self, direct_confidence: float = 1.0):
+        self.direct_confidence = direct_confidence
+        self.parses = 0
+        self.direct = 0
+        self.hinted = 0
+
+    @classmethod
+    def from_env(cls) -> "HintParser":
+        """
+        Build the parser from VYAPAR_T2B_HINT_DIRECT_CONFIDENCE
+        """
+        return cls(direct_confidence=env_float("VYAPAR_T2B_HINT_DIRECT_CONFIDENCE", 1.0))
+
+    def parse(self, text: str) -> ExpenseHints:
+        """
+        Pre-parse a user input
+
+        Args:
+            text: The user input
+
+        Returns:
+            The amounts, items and payment method found, with the confidence of the parse
+        """
+        self.parses += 1
+        tokens = tokenize(text)
+        payment_type, payment_methods, tokens = self._take_payment(tokens)
+
+        complex_input = any(kind == "word" and value in COMPLEX_WORDS for kind, value in tokens)
+        segments = [[]]
+        for token in tokens:
+            if token[0] == "sep":
+                segments.append([])
+            else:
+                segments[-1].append(token)
+
+        items: List[ParsedItem] = []
+        confidence = 1.0
+        for segment in segments:
+            item, segment_confidence = self._parse_segment(segment)
+            confidence = min(confidence, segment_confidence)
+            if item is None:
+                continue
+            previous = items[-1] if items else None
+            if (
+                previous is not None and previous.item_name is None and previous.item_qty is None
+                and item.item_amount is None and item.unit is not None
+            ):
+                # "Rs 100, 5 kg rice": the amount is the total of the described item
+                previous.item_name, previous.item_qty, previous.unit = item.item_name, item.item_qty, item.unit
+                continue
+            items.append(item)
+
+        if not items or complex_input:
+            confidence = min(confidence, 0.3)
+        elif any(item.item_name is None or item.item_amount is None for item in items):
+            confidence = min(confidence, 0.6)
+        if payment_methods > 1:
+            confidence = min(confidence, 0.6)
+        hints = ExpenseHints(
+            items=items,
+            amounts=[item.item_amount for item in items if item.item_amount is not None],
+            payment_type=payment_type,
+            confidence=confidence
+        )
+        if hints.items or hints.payment_type:
+            self.hinted += 1
+        return hints
+
+    def is_direct(self, hints: ExpenseHints) -> bool:
+        """
+        Whether the parse is sure enough to be used without the LLM
+        """
+        return hints.confidence >= self.direct_confidence
+
+    @staticmethod
+    def _take_payment(tokens: List[Tuple[str, Any]]) -> Tuple[Optional[str], int, List[Tuple[str, Any]]]:
+        """
+        Take the payment methods out of the tokens
+
+        Returns:
+            The payment type, the number of distinct methods mentioned, and the remaining tokens
+        """
+        found: List[Tuple[bool, str]] = []
+        kept: List[Tuple[str, Any]] = []
+        index = 0
+        while index < len(tokens):
+            kind, value = tokens[index]
+            following = tokens[index + 1][1] if index + 1 < len(tokens) else None
+            cued = bool(kept) and kept[-1][1] in PAYMENT_CUES
+            method = None
+            if kind == "word" and (value, following) in PAYMENT_PHRASES:
+                method, length = f"{value} {following}", 2
+            elif kind == "word" and following == "bank" and (value in BANK_NAMES or cued):
+                method, length = f"{value} bank", 2
+            elif kind == "word" and (value in PAYMENT_METHODS or value in BANK_NAMES):
+                method, length = value, 1
+            elif kind == "word" and cued and value not in FILLER_WORDS and value not in CURRENCY_WORDS:
+                method, length = value, 1
+            if method is None:
+                kept.append(tokens[index])
+                index += 1
+                continue
+            found.append((cued, method))
+            while kept and kept[-1][1] in PAYMENT_CUES | PAYMENT_PARTICLES:
+                kept.pop()
+            index += length
+            while index < len(tokens) and tokens[index][1] in PAYMENT_PARTICLES:
+                index += 1
+        if not found:
+            return None, 0, kept
+        cued_methods = [method for cued, method in found if cued]
+        payment_type = (cued_methods or [method for _, method in found])[-1]
+        return payment_type, len({method for _, method in found}), kept
+
+    @staticmethod
+    def _parse_segment(segment: List[Tuple[str, Any]]) -> Tuple[Optional[ParsedItem], float]:
+        """
+        Parse one segment of the input into an item
+
+        Returns:
+            The item (None for a segment without numbers or names) and the confidence of the segment
+        """
+        numbers = [position for position, (kind, _) in enumerate(segment) if kind == "num"]
+        item = ParsedItem()
+        confidence = 1.0
+        used = set()
+        amount_position, amount_marked = None, False
+        for position in numbers:
+            value = segment[position][1]
+            previous = segment[position - 1][1] if position > 0 else None
+            following = segment[position + 1][1] if position + 1 < len(segment) else None
+            if following in UNIT_WORDS:
+                item.item_qty, item.unit = value, following
+                used.update({position, position + 1})
+            elif following in CURRENCY_WORDS or previous in CURRENCY_WORDS:
+                item.item_amount = value
+                amount_position, amount_marked = position, True
+                used.add(position)
+        bare = [position for position in numbers if position not in used]
+        for position in bare:
+            following = segment[position + 1] if position + 1 < len(segment) else None
+            if item.item_qty is None and following is not None and following[0] == "word" \
+                    and following[1] not in FILLER_WORDS:
+                item.item_qty = segment[position][1]
+            elif item.item_amount is None:
+                item.item_amount = segment[position][1]
+                amount_position = position
+            else:
+                confidence = min(confidence, 0.4)
+            used.add(position)
+
+        name_positions = [
+            position for position, (kind, value) in enumerate(segment)
+            if position not in used and kind == "word"
+            and value not in FILLER_WORDS and value not in CURRENCY_WORDS and value not in UNIT_WORDS
+            and value not in COMPLEX_WORDS
+        ]
+        words = [segment[position][1] for position in name_positions]
+        if amount_position is not None and any(position > amount_position for position in name_positions):
+            # "500 rupees chai" names the item after a marked amount; "tea 20 yesterday 2 times"
+            # and "chai 20 from 3 shops" do not say which number is the amount
+            if not amount_marked or any(position < amount_position for position in name_positions):
+                confidence = min(confidence, 0.5)
+        if any(kind == "date" for kind, _ in segment):
+            confidence = min(confidence, 0.5)
+        # "petrol for my bike": which word is the item is for the LLM to decide
+        for_positions = [position for position, (_, value) in enumerate(segment) if value == "for"]
+        if any(
+            any(kind == "word" and value not in FILLER_WORDS for kind, value in segment[:position])
+            and any(kind == "word" and value not in FILLER_WORDS for kind, value in segment[position + 1:])
+            for position in for_positions
+        ):
+            confidence = min(confidence, 0.5)
+        if len(words) > 3:
+            confidence = min(confidence, 0.5)
+        item.item_name = " ".join(words) or None
+        if item.item_name is None and item.item_amount is None and item.item_qty is None:
+            return None, confidence
+        return item, confidence
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get how many inputs were parsed, produced hints and were used without the LLM
+        """
+        return {
+            "parses": self.parses,
+            "hinted": self.hinted,
+            "direct": self.direct,
+            "direct_rate": self.direct / self.parses if self.parses else 0.0
+        }
+
@@ -0,0 +1,346 @@
+"""Module to record per-stage latencies and token counts of the talk2bill pipeline"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from crons.talk2bill.vyapar.env import env_str, env_int
+from logger.logger import Logger
+
+INSTRUMENTATION = None
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def get_quantile(sorted_samples: List[float], quantile: float) -> float:
+    """
+    Get a quantile of already sorted samples (nearest rank)
+    """
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * quantile))]
+
+
+class MetricsSink(ABC):
+    """
+    Destination of the span durations and token counts
+    """
+    @abstractmethod
+    def record_span(self, stage: str, duration: float, labels: Dict[str, Any]):
+        """
+        Record the duration in seconds of a stage
+        """
+
+    @abstractmethod
+    def record_tokens(self, method: str, input_tokens: int, output_tokens: int):
+        """
+        Record the tokens of one LLM call of an LLMService method
+        """
+
+    def record_prompt_size(self, method: str, prompt_tokens: int):
+        """
+        Record the estimated size of a prompt sent by an LLMService method
+        """
+
+    def flush(self):
+        """
+        Write buffered data out, if the sink buffers any
+        """
+
+
+class HistogramSink(MetricsSink):
+    """
+    Keeps the last `max_samples` durations of each stage in memory for percentiles
+    """
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._sums: Dict[str, float] = {}
+        # method -> [calls, input tokens, output tokens]
+        self._tokens: Dict[str, List[int]] = {}
+        self._prompt_tokens: Dict[str, Deque[int]] = {}
+
+    def record_span(self, stage: str, duration: float, labels: Dict[str, Any]):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.max_samples)
+                self._counts[stage] = 0
+                self._sums[stage] = 0.0
+            self._samples[stage].append(duration)
+            self._counts[stage] += 1
+            self._sums[stage] += duration
+
+    def record_tokens(self, method: str, input_tokens: int, output_tokens: int):
+        with self._lock:
+            totals = self._tokens.setdefault(method, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+
+    def record_prompt_size(self, method: str, prompt_tokens: int):
+        with self._lock:
+            if method not in self._prompt_tokens:
+                self._prompt_tokens[method] = deque(maxlen=self.max_samples)
+            self._prompt_tokens[method].append(prompt_tokens)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the count, mean and p50/p95/p99 in seconds of every stage
+        """
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self._samples.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+        summary = {}
+        for stage, samples in snapshot.items():
+            summary[stage] = {"count": counts[stage], "mean": sums[stage] / counts[stage]}
+            for quantile in QUANTILES:
+                summary[stage][f"p{int(quantile * 100)}"] = get_quantile(samples, quantile)
+        return summary
+
+    def token_summary(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the calls and input/output tokens of every LLMService method
+        """
+        with self._lock:
+            return {
+                method: {"calls": calls, "input_tokens": input_tokens, "output_tokens": output_tokens}
+                for method, (calls, input_tokens, output_tokens) in self._tokens.items()
+            }
+
+
+    def prompt_summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the count, mean, p50/p95/p99 and max estimated prompt tokens of every LLMService method
+        """
+        with self._lock:
+            snapshot = {method: sorted(samples) for method, samples in self._prompt_tokens.items()}
+        summary = {}
+        for method, samples in snapshot.items():
+            summary[method] = {"count": len(samples), "mean": sum(samples) / len(samples), "max": samples[-1]}
+            for quantile in QUANTILES:
+                summary[method][f"p{int(quantile * 100)}"] = get_quantile(samples, quantile)
+        return summary
+
+
+class PrometheusTextSink(HistogramSink):
+    """
+    Renders the histograms in the Prometheus text exposition format, written to `path`
+    (e.g. a node-exporter textfile collector directory) on flush
+    """
+    def __init__(self, path: Optional[str] = None, max_samples: int = 10000):
+        super().__init__(max_samples)
+        self.path = path
+
+    def render(self) -> str:
+        """
+        Get the metrics as Prometheus summaries and counters
+        """
+        lines = [
+            "# HELP vyapar_t2b_stage_seconds Duration of the talk2bill pipeline stages",
+            "# TYPE vyapar_t2b_stage_seconds summary"
+        ]
+        for stage, summary in sorted(self.summary().items()):
+            for quantile in QUANTILES:
+                lines.append(
+                    f'vyapar_t2b_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                    f'{summary[f"p{int(quantile * 100)}"]:.6f}'
+                )
+            lines.append(
+                f'vyapar_t2b_stage_seconds_sum{{stage="{stage}"}} {summary["mean"] * summary["count"]:.6f}'
+            )
+            lines.append(f'vyapar_t2b_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+
+        lines.append("# HELP vyapar_t2b_llm_tokens_total Tokens sent to and received from the LLM")
+        lines.append("# TYPE vyapar_t2b_llm_tokens_total counter")
+        for method, tokens in sorted(self.token_summary().items()):
+            lines.append(f'vyapar_t2b_llm_tokens_total{{method="{method}",direction="input"}} {tokens["input_tokens"]}')
+            lines.append(f'vyapar_t2b_llm_tokens_total{{method="{method}",direction="output"}} {tokens["output_tokens"]}')
+
+        lines.append("# HELP vyapar_t2b_prompt_tokens Estimated tokens of the prompts sent to the LLM")
+        lines.append("# TYPE vyapar_t2b_prompt_tokens summary")
+        for method, summary in sorted(self.prompt_summary().items()):
+            for quantile in QUANTILES:
+                lines.append(
+                    f'vyapar_t2b_prompt_tokens{{method="{method}",quantile="{quantile}"}} '
+                    f'{summary[f"p{int(quantile * 100)}"]}'
+                )
+            lines.append(f'vyapar_t2b_prompt_tokens_sum{{method="{method}"}} {summary["mean"] * summary["count"]:.0f}')
+            lines.append(f'vyapar_t2b_prompt_tokens_count{{method="{method}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        if not self.path:
+            return
+        # Write then rename, so a scraper never reads a partial file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, self.path)
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Appends one JSON object per span / LLM call to a file, for offline analysis
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+    def _write(self, event: Dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(event, default=str) + "\n")
+
+    def record_span(self, stage: str, duration: float, labels: Dict[str, Any]):
+        self._write({"ts": time.time(), "type": "span", "stage": stage, "duration": duration, **labels})
+
+    def record_tokens(self, method: str, input_tokens: int, output_tokens: int):
+        self._write({
+            "ts": time.time(),
+            "type": "tokens",
+            "method": method,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens
+        })
+
+    def record_prompt_size(self, method: str, prompt_tokens: int):
+        self._write({"ts": time.time(), "type": "prompt", "method": method, "prompt_tokens": prompt_tokens})
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+
+class Instrumentation:
+    """
+    Fans the spans and token counts of the pipeline out to the configured sinks
+
+    The in-memory histogram is always present, so `summary` answers which stage dominates
+    the latency of a turn without any external collector.
+    """
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        self.histogram = HistogramSink()
+        self.sinks: List[MetricsSink] = [self.histogram] + list(sinks or [])
+
+    @classmethod
+    def from_env(cls) -> "Instrumentation":
+        """
+        Build the sinks from VYAPAR_T2B_METRICS_JSONL_PATH and VYAPAR_T2B_METRICS_PROMETHEUS_PATH
+        """
+        sinks: List[MetricsSink] = []
+        jsonl_path = env_str("VYAPAR_T2B_METRICS_JSONL_PATH")
+        if jsonl_path:
+            sinks.append(JsonLinesSink(jsonl_path))
+        prometheus_path = env_str("VYAPAR_T2B_METRICS_PROMETHEUS_PATH")
+        if prometheus_path:
+            sinks.append(PrometheusTextSink(
+                prometheus_path,
+                max_samples=env_int("VYAPAR_T2B_METRICS_MAX_SAMPLES", 10000)
+            ))
+        return cls(sinks)
+
+    @contextmanager
+    def span(self, stage: str, **labels: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Time the enclosed block as `stage`; failures are recorded with `error` set
+
+        Args:
+            stage: The stage name, e.g. "mongo_fetch" or "llm_attempt"
+            labels: Extra fields kept by the JSON lines sink
+
+        Yields:
+            The labels, which the block may extend
+        """
+        start_time = time.perf_counter()
+        try:
+            yield labels
+        except BaseException as e:
+            labels["error"] = type(e).__name__
+            raise
+        finally:
+            self.record_span(stage, time.perf_counter() - start_time, labels)
+
+    def record_span(self, stage: str, duration: float, labels: Optional[Dict[str, Any]] = None):
+        """
+        Record a duration measured by the caller
+        """
+        for sink in self.sinks:
+            try:
+                sink.record_span(stage, duration, labels or {})
+            except Exception as e:  # pylint: disable=broad-except
+                self._warn_sink_failure(sink, e)
+
+    def record_tokens(self, method: str, input_tokens: int, output_tokens: int):
+        """
+        Record the input and output tokens of an LLM call
+        """
+        for sink in self.sinks:
+            try:
+                sink.record_tokens(method, input_tokens, output_tokens)
+            except Exception as e:  # pylint: disable=broad-except
+                self._warn_sink_failure(sink, e)
+
+    def record_prompt_size(self, method: str, prompt_tokens: int):
+        """
+        Record the estimated tokens of a prompt about to be sent
+        """
+        for sink in self.sinks:
+            try:
+                sink.record_prompt_size(method, prompt_tokens)
+            except Exception as e:  # pylint: disable=broad-except
+                self._warn_sink_failure(sink, e)
+
+    def flush(self):
+        """
+        Flush every sink
+        """
+        for sink in self.sinks:
+            try:
+                sink.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                self._warn_sink_failure(sink, e)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get the stage percentiles, and the token totals and prompt sizes per LLMService method
+        """
+        return {
+            "stages": self.histogram.summary(),
+            "tokens": self.histogram.token_summary(),
+            "prompts": self.histogram.prompt_summary()
+        }
+
+    @staticmethod
+    def _warn_sink_failure(sink: MetricsSink, error: Exception):
+        Logger.warn({
+            "message": "Metrics sink failed",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "sink": type(sink).__name__,
+                "error": str(error)
+            }
+        })
+
+
+def get_token_usage(raw_message: Any) -> Optional[Tuple[int, int]]:
+    """
+    Get the provider-reported (input, output) tokens of a chat model message, if present
+    """
+    usage = getattr(raw_message, "usage_metadata", None) or {}
+    if "input_tokens" in usage and "output_tokens" in usage:
+        return usage["input_tokens"], usage["output_tokens"]
+    return None
+
+
+def get_instrumentation() -> Instrumentation:
+    """
+    Get the process-wide instrumentation
+    """
+    global INSTRUMENTATION
+    if INSTRUMENTATION is None:
+        INSTRUMENTATION = Instrumentation.from_env()
+    return INSTRUMENTATION
@@ -0,0 +1,154 @@
+"""Module to batch the intent classification calls of concurrent talk2bill sessions"""
+import asyncio
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+from logger.logger import Logger
+from constants.talk2bill.vyapar.models import IntentClassificationResponse
+from crons.talk2bill.vyapar.response_models import IntentBatchResponse
+
+
+@dataclass
+class IntentRequest:
+    """
+    An intent classification request waiting for its batch
+    """
+    user_query: str
+    history: List[Dict]
+    future: asyncio.Future
+
+
+class IntentBatcher:
+    """
+    Micro-batcher of intent classification requests
+
+    Requests are collected for `window` seconds after the first one (or until `max_batch`
+    of them are pending) and classified with one structured call returning a list of
+    results. A lone request, a failed batch call, and requests whose id is missing from
+    the batch response fall back to individual calls, so every caller gets an answer.
+
+    Args:
+        classify_batch: Classifies a list of (history, user query) in one call
+        classify_one: Classifies a single request, the non-batched path
+        window: The seconds to wait for more requests after the first one
+        max_batch: The largest number of requests sent in one call
+    """
+    def __init__(
+        self,
+        classify_batch: Callable[[List[Any]], Awaitable[IntentBatchResponse]],
+        classify_one: Callable[[str, List[Dict]], Awaitable[IntentClassificationResponse]],
+        window: float = 0.05,
+        max_batch: int = 16,
+        max_samples: int = 1000
+    ):
+        self.classify_batch = classify_batch
+        self.classify_one = classify_one
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: List[IntentRequest] = []
+        self._timer: Optional[asyncio.Task] = None
+        # Strong references to the running batches, which nobody else awaits
+        self._batches: Set[asyncio.Task] = set()
+        self._batch_sizes: Deque[int] = deque(maxlen=max_samples)
+        self.batch_calls = 0
+        self.batched_requests = 0
+        self.single_calls = 0
+        self.fallbacks = 0
+        self.failed_batches = 0
+
+    async def classify(self, user_query: str, history: List[Dict]) -> IntentClassificationResponse:
+        """
+        Classify the intent of a user query, batched with the concurrent requests
+
+        Args:
+            user_query: The user query
+            history: The history of the conversation
+
+        Returns:
+            The intent of the user query
+        """
+        request = IntentRequest(user_query, history, asyncio.get_running_loop().create_future())
+        self._pending.append(request)
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._dispatch_later())
+        return await request.future
+
+    async def _dispatch_later(self):
+        await asyncio.sleep(self.window)
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Send the pending requests as one batch, without waiting for its answer
+        """
+        batch, self._pending = self._pending, []
+        if self._timer is not None and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[IntentRequest]):
+        if len(batch) == 1:
+            self.single_calls += 1
+            await self._run_single(batch[0])
+            return
+
+        self.batch_calls += 1
+        self.batched_requests += len(batch)
+        self._batch_sizes.append(len(batch))
+        try:
+            response = await self.classify_batch([(request.history, request.user_query) for request in batch])
+            intents = {result.id: result.intent for result in response.results}
+        except Exception as e:
+            self.failed_batches += 1
+            Logger.warn({
+                "message": "Batched intent classification failed, falling back to individual calls",
+                "tag": "LLMService",
+                "data": {
+                    "batch_size": len(batch),
+                    "error": str(e),
+                    "traceback": traceback.format_exc()
+                }
+            })
+            intents = {}
+
+        unanswered = []
+        for index, request in enumerate(batch):
+            if index in intents:
+                if not request.future.done():
+                    request.future.set_result(IntentClassificationResponse(intent=intents[index]))
+            else:
+                unanswered.append(request)
+        if unanswered:
+            self.fallbacks += len(unanswered)
+            await asyncio.gather(*(self._run_single(request) for request in unanswered))
+
+    async def _run_single(self, request: IntentRequest):
+        try:
+            response = await self.classify_one(request.user_query, request.history)
+        except Exception as e:  # pylint: disable=broad-except
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        if not request.future.done():
+            request.future.set_result(response)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the batch calls, requests per batch and fallbacks to individual calls
+        """
+        sizes = self._batch_sizes
+        return {
+            "batch_calls": self.batch_calls,
+            "batched_requests": self.batched_requests,
+            "mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "single_calls": self.single_calls,
+            "fallbacks": self.fallbacks,
+            "failed_batches": self.failed_batches
+        }
@@ -0,0 +1,181 @@
+"""Module to merge the extracted changes of a turn into the current talk2bill invoice locally"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from constants.talk2bill.vyapar.models import ExpenseModel
+from crons.talk2bill.vyapar.response_models import ExpenseDeltaResponse, ItemDelta
+
+if TYPE_CHECKING:
+    # categorizer imports this module
+    from crons.talk2bill.vyapar.categorizer import CategoryIndex
+
+ITEM_FIELDS = ("item_name", "item_amount", "item_qty")
+# "Only if NO payment is mentioned at all → default to cash"
+DEFAULT_PAYMENT_TYPE = "cash"
+
+
+def get_invoice_data(invoice: Any) -> Dict[str, Any]:
+    """
+    Get an invoice given as an ExpenseModel, a dict or None as a dict with copied items
+    """
+    if invoice is None:
+        return {}
+    if hasattr(invoice, "model_dump"):
+        invoice = invoice.model_dump()
+    data = dict(invoice)
+    data["items"] = [dict(item) for item in data.get("items") or []]
+    return data
+
+
+def is_incomplete(item: Dict[str, Any]) -> bool:
+    """
+    Whether an item still misses its name or its amount
+    """
+    return item.get("item_name") in (None, "") or item.get("item_amount") is None
+
+
+def find_item(items: List[Dict[str, Any]], change: ItemDelta) -> Optional[int]:
+    """
+    Get the position of the item an update/removal refers to: its index when valid, else the
+    first item with the same name
+
+    Args:
+        items: The items of the current invoice
+        change: The update or removal
+
+    Returns:
+        The position, or None when no item matches
+    """
+    if change.index is not None and 0 <= change.index < len(items):
+        return change.index
+    if change.item_name:
+        name = change.item_name.strip().lower()
+        for index, item in enumerate(items):
+            if (item.get("item_name") or "").strip().lower() == name:
+                return index
+    return None
+
+
+def find_incomplete_item(items: List[Dict[str, Any]], new_item: Dict[str, Any]) -> Optional[int]:
+    """
+    Get the incomplete item a single new item completes, as the extraction prompt's
+    in-place completion rule: the earliest incomplete item with the same amount, else the
+    earliest incomplete item whose known fields do not contradict the new ones
+
+    Args:
+        items: The items of the invoice
+        new_item: The single item added by the turn
+
+    Returns:
+        The position of the item to complete, or None to append the new item
+    """
+    candidates = [index for index, item in enumerate(items) if is_incomplete(item)]
+    amount = new_item.get("item_amount")
+    if amount is not None:
+        for index in candidates:
+            if items[index].get("item_amount") == amount:
+                return index
+    for index in candidates:
+        if all(
+            items[index].get(field) in (None, "") or new_item.get(field) in (None, items[index].get(field))
+            for field in ("item_name", "item_amount")
+        ):
+            return index
+    return None
+
+
+def normalize_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Make amounts and quantities positive and default the quantity to 1, as the pipeline
+    does with the full extraction
+    """
+    for field in ("item_amount", "item_qty"):
+        if item.get(field) is not None and item[field] < 0:
+            item[field] = abs(item[field])
+    if item.get("item_qty") is None:
+        item["item_qty"] = 1
+    return item
+
+
+def merge_category(current: Optional[str], delta: ExpenseDeltaResponse, current_inferred: bool = False) -> Optional[str]:
+    """
+    Get the category of the merged invoice: the delta's category replaces an inferred one
+    (CATEGORY AGGREGATION: "food" + petrol → "daily expense"), a stated one only when the
+    user states another
+
+    Args:
+        current: The category of the current invoice
+        delta: The extracted changes
+        current_inferred: Whether the current category is the one its items infer to
+    """
+    if not delta.expense_category:
+        return current
+    if delta.category_explicit or not current or current_inferred:
+        return delta.expense_category
+    return current
+
+
+def merge_expense_delta(
+    current_invoice: Any,
+    delta: ExpenseDeltaResponse,
+    category_index: Optional["CategoryIndex"] = None
+) -> ExpenseModel:
+    """
+    Apply the changes extracted from a turn to the current invoice
+
+    Updates and removals refer to the items of the current invoice and are applied first.
+    A single added item then completes the matching incomplete item, otherwise added
+    items are appended. Category and payment type change only when the delta sets them.
+
+    The invoice does not record whether its category was stated or inferred: a current
+    category the index infers from the current items counts as inferred and follows the
+    delta's, any other is the user's and kept unless the user states a new one.
+
+    Args:
+        current_invoice: The latest invoice of the session (ExpenseModel, dict or None)
+        delta: The extracted changes
+        Optional[category_index]: The index of the category lexicon the delta's category is
+            inferred with; without it every current category is kept as the user's
+
+    Returns:
+        The merged invoice
+    """
+    data = get_invoice_data(current_invoice)
+    items = data["items"]
+    current_inferred = category_index is not None and category_index.is_inferred(
+        data.get("expense_category"),
+        [item.get("item_name") for item in items]
+    )
+
+    removed = set()
+    added = []
+    for change in delta.items:
+        if change.op == "add":
+            added.append({field: getattr(change, field) for field in ITEM_FIELDS})
+            continue
+        index = find_item(items, change)
+        if index is None:
+            continue
+        if change.op == "remove":
+            removed.add(index)
+        else:
+            for field in ITEM_FIELDS:
+                if getattr(change, field) is not None:
+                    items[index][field] = getattr(change, field)
+    items = [item for index, item in enumerate(items) if index not in removed]
+
+    target = find_incomplete_item(items, added[0]) if len(added) == 1 else None
+    if target is not None:
+        for field in ITEM_FIELDS:
+            if items[target].get(field) in (None, "") and added[0][field] is not None:
+                items[target][field] = added[0][field]
+    else:
+        items.extend(added)
+
+    payment_type = delta.payment_type or data.get("payment_type")
+    if not payment_type and items:
+        payment_type = DEFAULT_PAYMENT_TYPE
+    return ExpenseModel.model_validate({
+        **data,
+        "expense_category": merge_category(data.get("expense_category"), delta, current_inferred),
+        "items": [normalize_item(item) for item in items],
+        "payment_type": payment_type
+    })
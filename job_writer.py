@@ -0,0 +1,188 @@
+"""Module to write talk2bill job results back to Mongo in batches"""
+import asyncio
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from crons.talk2bill.vyapar.instrumentation import get_quantile
+from db.mongo.vyapar.talk2bill_repository import Talk2BillRepository
+from logger.logger import Logger
+from models.talk2bill.vyapar import Talk2BillModel
+
+JobUpdate = Tuple[Talk2BillModel, Dict[str, Any]]
+
+
+class JobUpdateBuffer:
+    """
+    Write-behind buffer of job updates, flushed as one bulk write
+
+    Updates are flushed when `max_batch` of them are pending or `flush_interval` seconds
+    after the first one was queued. Flushes are serialized, so the updates of a job are
+    written in the order they were submitted. A failed flush is retried with exponential
+    backoff (up to `max_attempts` times) before `on_write_failure` is called with the
+    dropped updates. `close` flushes everything still pending, backing off between attempts
+    without ever dropping, and must be awaited on shutdown.
+
+    The batch is written with `Talk2BillRepository.bulk_update_jobs(batch)`, expected to
+    send one ordered `bulk_write` of `UpdateOne` ops; see `is_supported`.
+    """
+    def __init__(
+        self,
+        max_batch: int = 50,
+        flush_interval: float = 1.0,
+        max_attempts: int = 3,
+        max_backoff: float = 30.0,
+        on_write_failure: Optional[Callable[[List[JobUpdate]], None]] = None,
+        max_samples: int = 1000
+    ):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.max_backoff = max_backoff
+        self.on_write_failure = on_write_failure
+        self._pending: List[JobUpdate] = []
+        self._attempts = 0
+        self._closing = False
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._flush_latencies: Deque[float] = deque(maxlen=max_samples)
+        self._batch_sizes: Deque[int] = deque(maxlen=max_samples)
+        self.flushes = 0
+        self.updates_written = 0
+        self.updates_dropped = 0
+
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        Whether the repository has a bulk write; without one buffering only delays the writes
+        """
+        return callable(getattr(Talk2BillRepository, "bulk_update_jobs", None))
+
+    def _backoff(self) -> float:
+        """
+        Get the delay before retrying after the current run of failed flushes
+        """
+        return min(self.max_backoff, self.flush_interval * 2 ** max(0, self._attempts - 1))
+
+    async def submit(self, job: Talk2BillModel, update: Dict[str, Any]):
+        """
+        Queue an update of a job
+
+        Args:
+            job: The talk2bill job
+            update: The fields to set on the job
+        """
+        self._pending.append((job, update))
+        # While a failed flush waits for its retry, a full batch does not retry early
+        if len(self._pending) >= self.max_batch and not self._attempts:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self, delay: Optional[float] = None):
+        await asyncio.sleep(self.flush_interval if delay is None else delay)
+        # A failure of this flush must be able to schedule the next retry
+        if self._timer is asyncio.current_task():
+            self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            Logger.warn({
+                "message": "Timed flush of talk2bill job updates failed",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "error": str(e),
+                    "traceback": traceback.format_exc()
+                }
+            })
+
+    async def flush(self):
+        """
+        Write the pending updates as one bulk write
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            start_time = time.monotonic()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self._attempts += 1
+                # Shutdown never drops: close keeps retrying until the batch is written
+                if self._attempts < self.max_attempts or self._closing:
+                    # Keep the order: the failed batch goes before updates queued meanwhile
+                    self._pending = batch + self._pending
+                    Logger.warn({
+                        "message": "Failed to flush talk2bill job updates, will retry",
+                        "tag": "VyaparTalk2Bill",
+                        "data": {
+                            "batch_size": len(batch),
+                            "attempt": self._attempts,
+                            "retry_in": self._backoff(),
+                            "error": str(e)
+                        }
+                    })
+                    if not self._closing and (self._timer is None or self._timer.done()):
+                        self._timer = asyncio.create_task(self._flush_later(self._backoff()))
+                    return
+                self._attempts = 0
+                self.updates_dropped += len(batch)
+                Logger.warn({
+                    "message": "Dropping talk2bill job updates after repeated flush failures",
+                    "tag": "VyaparTalk2Bill",
+                    "data": {
+                        "batch_size": len(batch),
+                        "ref_ids": [job.fileRefId for job, _ in batch],
+                        "error": str(e),
+                        "traceback": traceback.format_exc()
+                    }
+                })
+                if self.on_write_failure is not None:
+                    self.on_write_failure(batch)
+                return
+
+            self._attempts = 0
+            self.flushes += 1
+            self.updates_written += len(batch)
+            self._flush_latencies.append(time.monotonic() - start_time)
+            self._batch_sizes.append(len(batch))
+
+    @staticmethod
+    async def _write(batch: List[JobUpdate]):
+        """
+        Write a batch with the repository's bulk write
+        """
+        await Talk2BillRepository.bulk_update_jobs(batch)
+
+    async def close(self):
+        """
+        Flush every pending update; called when the worker shuts down
+        """
+        self._closing = True
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        # Failed flushes put their batch back, retry with backoff until written
+        while self._pending:
+            if self._attempts:
+                await asyncio.sleep(self._backoff())
+            await self.flush()
+        self._closing = False
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Get the flush latency and batch size metrics of the buffer
+        """
+        latencies = sorted(self._flush_latencies)
+        return {
+            "flushes": self.flushes,
+            "updates_written": self.updates_written,
+            "updates_dropped": self.updates_dropped,
+            "pending": len(self._pending),
+            "mean_flush_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_flush_latency": get_quantile(latencies, 0.95),
+            "mean_batch_size": (
+                sum(self._batch_sizes) / len(self._batch_sizes) if self._batch_sizes else 0.0
+            ),
+            "max_batch_size": max(self._batch_sizes, default=0)
+        }
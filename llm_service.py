@@ -1,8 +1,12 @@
 """Module to interact with the LLM for the talk2bill pipeline"""
 import traceback
-from typing import Optional, Type, List, Dict, Any
+import time
+from functools import partial
+from typing import Optional, Type, List, Dict, Any, Tuple, AsyncIterator
 import asyncio
+from enum import Enum
 from pydantic import BaseModel
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 from config.settings import fetch_env
 from crons.talk2bill.vyapar.prompt_builder import Talk2BillPromptBuilder
@@ -12,29 +16,338 @@ from constants.talk2bill.vyapar.models import (
     ExpenseMissingFieldsResponse,
     GenericQuestionAskResponse
 )
+from crons.talk2bill.vyapar.response_models import (
+    UnifiedExpenseResponse,
+    QuestionStreamChunk,
+    IntentBatchResponse,
+    ExpenseDeltaResponse,
+    ItemDelta,
+    get_output_schema
+)
+from crons.talk2bill.vyapar.invoice_merge import merge_expense_delta
+from crons.talk2bill.vyapar.categorizer import CategoryIndex, LocalCategorizer
+from crons.talk2bill.vyapar.hint_parser import ExpenseHints, HintParser
+from crons.talk2bill.vyapar.rate_limiter import get_shared_rate_limiter
+from crons.talk2bill.vyapar.tokens import estimate_tokens, estimate_json_tokens
+from crons.talk2bill.vyapar.instrumentation import get_instrumentation, get_token_usage
+from crons.talk2bill.vyapar.env import env_int, env_bool, env_str
+from crons.talk2bill.vyapar.response_cache import ResponseCache
+from crons.talk2bill.vyapar.model_router import ModelRouter, RouteDecision
+from crons.talk2bill.vyapar.intent_batcher import IntentBatcher
+from crons.talk2bill.vyapar.hedging import Hedger, TurnBudgetExceeded, remaining_turn_budget
+from crons.talk2bill.vyapar.provider_chain import ProviderChain
+from crons.talk2bill.vyapar.context_cache import ContextCacheManager, GeminiContextCacheBackend
+from crons.talk2bill.vyapar.retry_policy import (
+    RetryPolicy,
+    CircuitOpenError,
+    ErrorKind,
+    classify_error,
+    get_shared_circuit_breaker
+)
 from logger.logger import Logger
 
+GEMINI_MODEL = 'gemini-2.0-flash'
+# Runnables bound to cache handles rotate with the handles' TTL, keep only the recent ones
+MAX_CACHED_CONTENT_RUNNABLES = 64
+
+
+class ExtractionMode(str, Enum):
+    """
+    What the expense extraction call returns
+    """
+    # The whole updated invoice, merged by the model
+    FULL = "full"
+    # Only the changes of the turn, merged locally by invoice_merge
+    DELTA = "delta"
+
+
 class LLMService:
     """
     LLMService class to interact with the LLM
     """
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model='gemini-2.0-flash',
+    def __init__(
+        self,
+        llm: Optional[Any] = None,
+        context_cache: Optional[ContextCacheManager] = None,
+        response_cache: Optional[ResponseCache] = None,
+        llms: Optional[Dict[str, Any]] = None,
+        router: Optional[ModelRouter] = None,
+        hedger: Optional[Hedger] = None,
+        categorizer: Optional[LocalCategorizer] = None,
+        hint_parser: Optional[HintParser] = None,
+        provider_chain: Optional[ProviderChain] = None
+    ):
+        """
+        Args:
+            Optional[llm]: The chat model, defaults to Gemini (a FakeChatModel in tests)
+            Optional[context_cache]: Provider-side cache of the static prompt prefixes,
+                defaults to Gemini context caching when VYAPAR_T2B_CONTEXT_CACHE_ENABLED is set
+            Optional[response_cache]: Cache of responses to identical prompts, built from
+                VYAPAR_T2B_RESPONSE_CACHE_* when VYAPAR_T2B_RESPONSE_CACHE_ENABLED is set
+            Optional[llms]: The chat model of each route of the router
+            Optional[router]: Routes the calls between `llms`, built with Gemini models from
+                the VYAPAR_T2B_MODEL_ROUTING policy when set; without a router every call uses `llm`
+            Optional[hedger]: Deadline and hedging of each call, built from
+                VYAPAR_T2B_LLM_CALL_TIMEOUT and VYAPAR_T2B_HEDGE_* by default
+            Optional[categorizer]: Assigns the expense category after extraction instead of
+                the LLM, built from VYAPAR_T2B_CATEGORY_* when VYAPAR_T2B_LOCAL_CATEGORIZER_ENABLED is set
+            Optional[hint_parser]: Pre-parses amounts, quantities and payment methods of the
+                user query for the extraction prompt, and replaces the extraction call when
+                it is sure; built when VYAPAR_T2B_HINT_PARSER_ENABLED is set
+            Optional[provider_chain]: Fails calls over to other providers when the primary
+                (`llm` and the router's routes, or the chain's first provider when `llm` is not
+                given) is unhealthy; built with Gemini first from VYAPAR_T2B_PROVIDER_CHAIN when set
+        """
+        if llm is None and provider_chain is not None:
+            llm = provider_chain.primary.llm
+        self.llm = llm or ChatGoogleGenerativeAI(
+            model=GEMINI_MODEL,
             temperature=0.0,
             api_key=fetch_env("VYAPAR_T2B_API_KEY")
         )
+        if context_cache is None and llm is None and env_bool("VYAPAR_T2B_CONTEXT_CACHE_ENABLED"):
+            context_cache = ContextCacheManager(
+                GeminiContextCacheBackend(fetch_env("VYAPAR_T2B_API_KEY")),
+                model=GEMINI_MODEL,
+                ttl_seconds=env_int("VYAPAR_T2B_CONTEXT_CACHE_TTL", 3600),
+                min_prefix_tokens=env_int("VYAPAR_T2B_CONTEXT_CACHE_MIN_TOKENS", 1024)
+            )
+        self.context_cache = context_cache
+        if response_cache is None and env_bool("VYAPAR_T2B_RESPONSE_CACHE_ENABLED"):
+            response_cache = ResponseCache(
+                model=getattr(self.llm, "model", GEMINI_MODEL),
+                ttl_seconds=env_int("VYAPAR_T2B_RESPONSE_CACHE_TTL", 3600),
+                max_entries=env_int("VYAPAR_T2B_RESPONSE_CACHE_MAX_ENTRIES", 1024),
+                sqlite_path=env_str("VYAPAR_T2B_RESPONSE_CACHE_PATH")
+            )
+        self.response_cache = response_cache
+        if router is None and llms is None and llm is None:
+            router = ModelRouter.from_env()
+            if router is not None:
+                llms = {
+                    name: ChatGoogleGenerativeAI(
+                        model=route.model,
+                        temperature=0.0,
+                        api_key=fetch_env("VYAPAR_T2B_API_KEY")
+                    )
+                    for name, route in router.policy.routes.items()
+                }
+        self.router = router
+        self.llms = llms or {}
+        if router is not None and set(router.policy.routes) - set(self.llms):
+            raise ValueError("LLMService needs a chat model for every route of the router")
+        if provider_chain is None and llm is None:
+            provider_chain = ProviderChain.from_env(self.llm, GEMINI_MODEL)
+        self.provider_chain = provider_chain
+        self.hedger = hedger or Hedger.from_env()
+        self.extraction_mode = ExtractionMode(env_str("VYAPAR_T2B_EXTRACTION_MODE", ExtractionMode.FULL.value))
+        if categorizer is None and env_bool("VYAPAR_T2B_LOCAL_CATEGORIZER_ENABLED"):
+            categorizer = LocalCategorizer.from_env()
+        self.categorizer = categorizer
+        # Tells the inferred categories of invoices, which delta extractions re-infer, from stated ones
+        self.delta_category_index = (
+            CategoryIndex.from_lexicon() if self.extraction_mode == ExtractionMode.DELTA else None
+        )
+        if hint_parser is None and env_bool("VYAPAR_T2B_HINT_PARSER_ENABLED"):
+            hint_parser = HintParser.from_env()
+        self.hint_parser = hint_parser
+        # Categorizes the invoices built from the pre-parse when the LLM infers the categories
+        self.hint_categorizer = LocalCategorizer(CategoryIndex.from_lexicon()) if hint_parser is not None else None
+        self.intent_batcher = None
+        if env_bool("VYAPAR_T2B_INTENT_BATCH_ENABLED"):
+            self.intent_batcher = IntentBatcher(
+                self._classify_intent_batch,
+                self._classify_intent,
+                window=env_int("VYAPAR_T2B_INTENT_BATCH_WINDOW_MS", 50) / 1000,
+                max_batch=env_int("VYAPAR_T2B_INTENT_BATCH_MAX_SIZE", 16)
+            )
         self.default_intent_response = IntentClassificationResponse(intent="other")
         self.default_expense_response = ExpenseModel()
         self.default_expense_missing_fields_response = ExpenseMissingFieldsResponse()
         self.default_generic_question_ask_response = GenericQuestionAskResponse()
+        self.retry_policy = RetryPolicy.from_env()
+        self.circuit_breaker = get_shared_circuit_breaker()
+        self.rate_limiter = get_shared_rate_limiter()
+        self.instrumentation = get_instrumentation()
+        # Output tokens are unknown before the call, reserve a typical response size
+        self.output_token_reserve = env_int("VYAPAR_T2B_LLM_OUTPUT_TOKEN_RESERVE", 256)
+        # Structured-output runnables are built once per response model and reused. They are
+        # built from the JSON schema with the raw message included, so validation and token
+        # usage are measured here rather than inside the runnable
+        self._structured_llms: Dict[Type[BaseModel], Runnable] = {}
+        self._cached_content_llms: Dict[Tuple[Type[BaseModel], str], Runnable] = {}
+        self._routed_llms: Dict[Tuple[str, Type[BaseModel]], Runnable] = {}
+        self._provider_llms: Dict[Tuple[str, Type[BaseModel]], Runnable] = {}
+        # Streaming runnables yield partial dicts, keyed like the two registries above
+        self._streaming_llms: Dict[Tuple[Type[BaseModel], Optional[str]], Runnable] = {}
+        for response_format in (
+            IntentClassificationResponse,
+            ExpenseModel,
+            ExpenseMissingFieldsResponse,
+            GenericQuestionAskResponse,
+            UnifiedExpenseResponse
+        ):
+            self._get_structured_llm(response_format)
+
+    def _get_structured_llm(
+        self,
+        response_format: Type[BaseModel],
+        cached_content: Optional[str] = None,
+        route: Optional[str] = None,
+        provider: Optional[str] = None
+    ) -> Runnable:
+        """
+        Get the structured-output runnable for a response model, building it on first use
+
+        Args:
+            response_format: The response model the LLM output is parsed into
+            Optional[cached_content]: The context cache handle the calls should reference
+            Optional[route]: The router route whose model answers, instead of `llm`
+            Optional[provider]: The fallback provider of the chain that answers, instead of `llm`
+
+        Returns:
+            The structured-output runnable
+        """
+        if provider is not None:
+            structured_llm = self._provider_llms.get((provider, response_format))
+            if structured_llm is None:
+                structured_llm = self.provider_chain.members[provider].llm.with_structured_output(
+                    get_output_schema(response_format),
+                    method="json_schema",
+                    include_raw=True
+                )
+                self._provider_llms[(provider, response_format)] = structured_llm
+            return structured_llm
+
+        if route is not None:
+            structured_llm = self._routed_llms.get((route, response_format))
+            if structured_llm is None:
+                structured_llm = self.llms[route].with_structured_output(
+                    get_output_schema(response_format),
+                    method="json_schema",
+                    include_raw=True
+                )
+                self._routed_llms[(route, response_format)] = structured_llm
+            return structured_llm
+
+        if cached_content is not None:
+            key = (response_format, cached_content)
+            structured_llm = self._cached_content_llms.get(key)
+            if structured_llm is None:
+                if len(self._cached_content_llms) >= MAX_CACHED_CONTENT_RUNNABLES:
+                    self._cached_content_llms.clear()
+                structured_llm = self.llm.model_copy(
+                    update={"cached_content": cached_content}
+                ).with_structured_output(
+                    get_output_schema(response_format),
+                    method="json_schema",
+                    include_raw=True
+                )
+                self._cached_content_llms[key] = structured_llm
+            return structured_llm
+
+        structured_llm = self._structured_llms.get(response_format)
+        if structured_llm is None:
+            structured_llm = self.llm.with_structured_output(
+                get_output_schema(response_format),
+                method="json_schema",
+                include_raw=True
+            )
+            self._structured_llms[response_format] = structured_llm
+        return structured_llm
+
+    def _get_streaming_llm(
+        self,
+        response_format: Type[BaseModel],
+        cached_content: Optional[str] = None
+    ) -> Runnable:
+        """
+        Get the runnable streaming partial JSON of a response model, building it on first use
+
+        Args:
+            response_format: The response model the LLM output is parsed into
+            Optional[cached_content]: The context cache handle the calls should reference
+
+        Returns:
+            The streaming structured-output runnable
+        """
+        key = (response_format, cached_content)
+        streaming_llm = self._streaming_llms.get(key)
+        if streaming_llm is None:
+            if len(self._streaming_llms) >= MAX_CACHED_CONTENT_RUNNABLES:
+                self._streaming_llms.clear()
+            llm = self.llm
+            if cached_content is not None:
+                llm = llm.model_copy(update={"cached_content": cached_content})
+            streaming_llm = llm.with_structured_output(
+                get_output_schema(response_format),
+                method="json_schema"
+            )
+            self._streaming_llms[key] = streaming_llm
+        return streaming_llm
+
+    async def _resolve_context_cache(self, prompt: str) -> Tuple[Optional[str], str]:
+        """
+        Get the context cache handle of the prompt's static prefix, if one can be used
+
+        Args:
+            prompt: The prompt, a PromptParts when built by Talk2BillPromptBuilder
+
+        Returns:
+            The cache handle (or None) and the text to send: only the suffix when cached
+        """
+        prefix = getattr(prompt, "prefix", None)
+        if self.context_cache is None or not prefix:
+            return None, prompt
+        cached_content = await self.context_cache.get_handle(prefix)
+        if cached_content is None:
+            return None, prompt
+        return cached_content, prompt.suffix
+
+    def _parse_response(
+        self,
+        result: Dict[str, Any],
+        response_format: Type[BaseModel],
+        method: str,
+        llm_input: str
+    ) -> BaseModel:
+        """
+        Validate the structured output of a call and record its token usage
+
+        Args:
+            result: The {"raw", "parsed", "parsing_error"} output of the runnable
+            response_format: The response model to validate into
+            method: The LLMService method the call was made for
+            llm_input: The text that was sent
+
+        Returns:
+            The validated response
+        """
+        if result.get("parsing_error") is not None:
+            raise result["parsing_error"]
+        parsed = result.get("parsed")
+        if parsed is None:
+            raise ValueError(f"LLM returned no structured output for {response_format.__name__}")
+
+        with self.instrumentation.span(f"validation:{method}"):
+            response = response_format.model_validate(parsed)
+
+        token_usage = get_token_usage(result.get("raw"))
+        if token_usage is None:
+            token_usage = estimate_tokens(llm_input), estimate_json_tokens(parsed)
+        self.instrumentation.record_tokens(method, *token_usage)
+        return response
 
     async def _invoke(
             self,
             prompt: str,
             response_format: Optional[Type[BaseModel]] = None,
             max_retries: int = 3,
-            retry_delay: int = 1
+            retry_delay: float = 1,
+            method: Optional[str] = None,
+            route: Optional[str] = None,
+            provider: Optional[str] = None,
+            attempt_latencies: Optional[List[float]] = None
         ) -> Optional[Type[BaseModel]]:
         """
         Invoke the LLM with the prompt and return the response
@@ -43,51 +356,314 @@ class LLMService:
             prompt: The prompt to invoke the LLM with
             response_format: The response format to return
             Optional[max_retries]: The maximum number of retries
-            Optional[retry_delay]: The delay between retries
+            Optional[retry_delay]: The base delay of the exponential backoff between retries
+            Optional[method]: The calling method, used to label the spans and token counts
+            Optional[route]: The router route to call instead of `llm`
+            Optional[provider]: The fallback provider of the chain to call instead of `llm`
+            Optional[attempt_latencies]: Collects the seconds the model took to answer each
+                attempt, without the rate limiter wait and the backoff between retries
         Returns:
             Either a validated Pydantic model instance or a dictionary
         """
+        if response_format is None:
+            raise ValueError("LLMService._invoke needs a response model to parse the output into")
+        method = method or response_format.__name__
+        model = self.router.policy.routes[route].model if route is not None else None
+        if provider is not None:
+            model = self.provider_chain.members[provider].model
+        if self.response_cache is not None and response_format is not None:
+            cached_response = await self.response_cache.get(prompt, response_format, model)
+            if cached_response is not None:
+                return cached_response
+
         last_exception = None
+        if route is None and provider is None:
+            cached_content, llm_input = await self._resolve_context_cache(prompt)
+        else:
+            # Context cache handles belong to the model of `llm`
+            cached_content, llm_input = None, prompt
+        structured_llm_json = self._get_structured_llm(response_format, cached_content, route, provider)
+        # The breaker tracks the health of `llm`'s API; fallback providers are tracked by the chain
+        circuit_breaker = self.circuit_breaker if provider is None else None
+        prompt_tokens = estimate_tokens(prompt)
+        self.instrumentation.record_prompt_size(method, prompt_tokens)
+        request_tokens = prompt_tokens + self.output_token_reserve
 
         for attempt in range(max_retries + 1):  # +1 because we want 3 retries total
+            # Fails fast with CircuitOpenError while the API is unhealthy, before taking any quota
+            if circuit_breaker is not None:
+                circuit_breaker.before_call()
+            # Wait for RPM/TPM capacity instead of getting a 429
+            await self.rate_limiter.acquire(request_tokens)
             try:
-                # response = await self.llm.ainvoke(prompt)
-                structured_llm_json = self.llm.with_structured_output(
-                    response_format,
-                    method="json_schema"
-                )
-                response = await structured_llm_json.ainvoke(prompt)
+                with self.instrumentation.span(f"llm_attempt:{method}", attempt=attempt + 1):
+                    attempt_start = time.perf_counter()
+                    try:
+                        # Bounded by the call deadline and the turn budget, hedged when slow
+                        result = await self.hedger.call(
+                            method,
+                            partial(structured_llm_json.ainvoke, llm_input),
+                            partial(self._invoke_hedge, structured_llm_json, llm_input, request_tokens)
+                        )
+                    finally:
+                        if attempt_latencies is not None:
+                            attempt_latencies.append(time.perf_counter() - attempt_start)
+                response = self._parse_response(result, response_format, method, llm_input)
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()
+                if self.response_cache is not None and isinstance(response, BaseModel):
+                    await self.response_cache.set(prompt, response_format, response, model)
                 return response
 
             except Exception as e:
                 last_exception = e
+                error_kind = classify_error(e)
+                if circuit_breaker is not None:
+                    circuit_breaker.record_failure(error_kind)
+
+                if cached_content is not None:
+                    # The handle may have expired on the provider: send the full prompt from now on
+                    self.context_cache.invalidate(prompt.prefix)
+                    cached_content, llm_input = None, prompt
+                    structured_llm_json = self._get_structured_llm(response_format, route=route, provider=provider)
+                    if error_kind == ErrorKind.NON_RETRYABLE:
+                        error_kind = ErrorKind.TRANSIENT
 
-                if attempt < max_retries:  # Don't sleep on the last attempt
+                delay = self.retry_policy.get_delay(attempt, e, retry_delay)
+                remaining_budget = remaining_turn_budget()
+                # A retry after the turn deadline would only fail with TurnBudgetExceeded
+                within_budget = remaining_budget is None or delay < remaining_budget
+
+                if error_kind != ErrorKind.NON_RETRYABLE and attempt < max_retries and within_budget:
                     Logger.warn({
-                        "message": f"LLM invoke failed on attempt {attempt + 1}, retrying in {retry_delay}s",
+                        "message": f"LLM invoke failed on attempt {attempt + 1}, retrying in {delay:.2f}s",
                         "tag": "LLMService",
                         "data": {
                             "error": str(e),
+                            "error_kind": error_kind.value,
                             "attempt": attempt + 1,
                             "max_retries": max_retries,
-                            "retry_delay": retry_delay
+                            "retry_delay": delay
                         }
                     })
-                    await asyncio.sleep(retry_delay)
+                    await asyncio.sleep(delay)
                 else:
                     Logger.warn({
-                        "message": f"LLM invoke failed after {max_retries + 1} attempts",
+                        "message": f"LLM invoke failed after {attempt + 1} attempts",
                         "tag": "LLMService",
                         "data": {
                             "error": str(e),
-                            "total_attempts": max_retries + 1,
+                            "error_kind": error_kind.value,
+                            "total_attempts": attempt + 1,
                             "traceback": traceback.format_exc()
                         }
                     })
+                    break
 
         # If we get here, all retries failed
         raise last_exception
 
+    async def _invoke_hedge(self, structured_llm_json: Runnable, llm_input: Any, request_tokens: int) -> Dict:
+        """
+        Send the duplicate request of a slow call, which takes its own rate limiter capacity
+        """
+        await self.rate_limiter.acquire(request_tokens)
+        return await structured_llm_json.ainvoke(llm_input)
+
+    async def _invoke_with_failover(
+        self,
+        prompt: str,
+        response_format: Type[BaseModel],
+        max_retries: int = 3,
+        method: Optional[str] = None,
+        route: Optional[str] = None
+    ) -> BaseModel:
+        """
+        Invoke the provider the chain chooses, moving to the next provider when the call fails
+        there; without a chain, invoke `llm` (or the route)
+
+        A provider with a fallback left only gets `retries_before_failover` retries, the last
+        one the full `max_retries`. Every outcome but a non-retryable error (as for the circuit
+        breaker) updates the health of its provider, with the latency of its last attempt; a
+        call answered from the response cache did not reach the provider and is not recorded.
+
+        Args:
+            prompt: The prompt to invoke the LLM with
+            response_format: The response format to return
+            Optional[max_retries]: The maximum number of retries on the last provider
+            Optional[method]: The calling method, used to label the spans and token counts
+            Optional[route]: The router route answering on the primary; fallback providers
+                answer with their own model
+
+        Returns:
+            The validated response
+        """
+        chain = self.provider_chain
+        if chain is None:
+            return await self._invoke(prompt, response_format, max_retries=max_retries, method=method, route=route)
+
+        tried = set()
+        while True:
+            member = chain.select(exclude=tried)
+            has_fallback = chain.has_fallback(member, tried)
+            attempt_latencies: List[float] = []
+            try:
+                response = await self._invoke(
+                    prompt,
+                    response_format,
+                    max_retries=min(max_retries, chain.retries_before_failover) if has_fallback else max_retries,
+                    method=method,
+                    route=route if member is chain.primary else None,
+                    provider=None if member is chain.primary else member.name,
+                    attempt_latencies=attempt_latencies
+                )
+            except TurnBudgetExceeded:
+                # The turn is out of time on any provider
+                raise
+            except Exception as e:
+                # An open circuit breaker is the primary's own verdict on its health
+                error_kind = ErrorKind.TRANSIENT if isinstance(e, CircuitOpenError) else classify_error(e)
+                chain.record(member, attempt_latencies[-1] if attempt_latencies else 0.0, False, error_kind)
+                tried.add(member.name)
+                if not has_fallback:
+                    raise e
+                chain.call_failovers += 1
+                Logger.warn({
+                    "message": f"LLM call failed on provider {member.name}, failing over",
+                    "tag": "LLMService",
+                    "data": {
+                        "method": method,
+                        "provider": member.name,
+                        "error": str(e),
+                        "error_kind": error_kind.value
+                    }
+                })
+                continue
+            if attempt_latencies:
+                chain.record(member, attempt_latencies[-1], success=True)
+            return response
+
+    async def _route_and_invoke(
+        self,
+        task: str,
+        prompt: str,
+        response_format: Type[BaseModel],
+        user_query: str,
+        latest_invoice: Optional[Dict[str, Any]] = None
+    ) -> BaseModel:
+        """
+        Invoke the route the router chooses for the task, escalating to the stronger route
+        when the call fails or its answer looks unreliable
+
+        Args:
+            task: The calling method
+            prompt: The prompt to invoke the LLM with
+            response_format: The response format to return
+            user_query: The user query of the turn
+            Optional[latest_invoice]: The latest invoice of the session
+
+        Returns:
+            The validated response
+        """
+        if self.router is None:
+            return await self._invoke_with_failover(prompt, response_format, method=task)
+
+        decision = self.router.choose(task, user_query, latest_invoice)
+        try:
+            response = await self._invoke_route(decision, prompt, response_format)
+        except Exception as e:
+            escalated = self.router.escalate(decision, "error")
+            if escalated is None:
+                raise e
+            Logger.warn({
+                "message": f"Escalating {task} to route {escalated.route} after failure",
+                "tag": "LLMService",
+                "data": {
+                    "route": decision.route,
+                    "error": str(e)
+                }
+            })
+            return await self._invoke_route(escalated, prompt, response_format)
+
+        if self.router.is_low_confidence(task, user_query, response):
+            escalated = self.router.escalate(decision, "low_confidence")
+            if escalated is not None:
+                try:
+                    return await self._invoke_route(escalated, prompt, response_format)
+                except Exception as e:
+                    # The cheap route's answer is valid, only doubtful: keep it over failing the turn
+                    Logger.warn({
+                        "message": f"Escalation of {task} to route {escalated.route} failed, keeping route {decision.route}",
+                        "tag": "LLMService",
+                        "data": {
+                            "route": decision.route,
+                            "error": str(e)
+                        }
+                    })
+        return response
+
+    async def _invoke_route(
+        self,
+        decision: RouteDecision,
+        prompt: str,
+        response_format: Type[BaseModel]
+    ) -> BaseModel:
+        """
+        Invoke a route, failing over along the provider chain like unrouted calls, and record
+        its latency and estimated tokens on the router
+        """
+        start_time = time.perf_counter()
+        try:
+            response = await self._invoke_with_failover(
+                prompt,
+                response_format,
+                method=decision.task,
+                route=decision.route
+            )
+        except Exception:
+            self.router.record(decision, time.perf_counter() - start_time, estimate_tokens(prompt), failed=True)
+            raise
+        self.router.record(
+            decision,
+            time.perf_counter() - start_time,
+            estimate_tokens(prompt),
+            estimate_json_tokens(response)
+        )
+        return response
+
+    async def _classify_intent(self, user_query: str, history: List[Dict]) -> IntentClassificationResponse:
+        """
+        Classify the intent of one user query with its own call
+        """
+        with self.instrumentation.span("prompt_build:identify_intent"):
+            prompt = Talk2BillPromptBuilder.build_intent_classification_prompt(history, user_query)
+        return await self._route_and_invoke(
+            "identify_intent",
+            prompt,
+            IntentClassificationResponse,
+            user_query
+        )
+
+    async def _classify_intent_batch(self, requests: List[Tuple[List[Dict], str]]) -> IntentBatchResponse:
+        """
+        Classify the intent of several independent user queries with one call
+
+        Args:
+            requests: The (history, user query) of each request
+
+        Returns:
+            The intent of each request, by its index
+        """
+        with self.instrumentation.span("prompt_build:identify_intent_batch"):
+            prompt = Talk2BillPromptBuilder.build_intent_classification_batch_prompt(requests)
+        # A single retry: the batcher falls back to individual calls, which retry on their own
+        return await self._invoke_with_failover(
+            prompt,
+            IntentBatchResponse,
+            max_retries=1,
+            method="identify_intent_batch"
+        )
+
     async def identify_intent(
         self,
         user_query: str,
@@ -113,9 +689,9 @@ class LLMService:
                     "user_query": user_query,
                 }
             })
-            prompt = Talk2BillPromptBuilder.build_intent_classification_prompt(history, user_query)
-            intent_response = await self._invoke(prompt, IntentClassificationResponse)
-            return intent_response
+            if self.intent_batcher is not None:
+                return await self.intent_batcher.classify(user_query, history)
+            return await self._classify_intent(user_query, history)
         except Exception as e:
             Logger.warn({
                 "message": "Failed to identify intent",
@@ -154,12 +730,63 @@ class LLMService:
             })
             if not user_query:
                 return self.default_expense_response
-            prompt = Talk2BillPromptBuilder.build_expense_extraction_prompt(
+            hints = None
+            if self.hint_parser is not None:
+                with self.instrumentation.span("hint_parse"):
+                    parsed = self.hint_parser.parse(user_query)
+                if self.hint_parser.is_direct(parsed):
+                    invoice = self._apply_hints(parsed, user_query, latest_invoice, history)
+                    if invoice is not None:
+                        return invoice
+                if parsed.items or parsed.payment_type:
+                    hints = parsed.to_prompt()
+            if self.extraction_mode == ExtractionMode.DELTA:
+                with self.instrumentation.span("prompt_build:extract_expense"):
+                    prompt = Talk2BillPromptBuilder.build_expense_delta_extraction_prompt(
+                        user_query,
+                        latest_invoice,
+                        history,
+                        hints=hints
+                    )
+                delta = await self._route_and_invoke(
+                    "extract_expense",
+                    prompt,
+                    ExpenseDeltaResponse,
+                    user_query,
+                    latest_invoice
+                )
+                with self.instrumentation.span("invoice_merge"):
+                    invoice = merge_expense_delta(latest_invoice, delta, self.delta_category_index)
+                if self.categorizer is None:
+                    return invoice
+                with self.instrumentation.span("categorize"):
+                    return self.categorizer.assign(
+                        invoice,
+                        user_query,
+                        latest_invoice,
+                        history,
+                        explicit=delta.category_explicit
+                    )
+
+            with self.instrumentation.span("prompt_build:extract_expense"):
+                prompt = Talk2BillPromptBuilder.build_expense_extraction_prompt(
+                    user_query,
+                    latest_invoice,
+                    history,
+                    local_category=self.categorizer is not None,
+                    hints=hints
+                )
+            invoice = await self._route_and_invoke(
+                "extract_expense",
+                prompt,
+                ExpenseModel,
                 user_query,
-                latest_invoice,
-                history
+                latest_invoice
             )
-            return await self._invoke(prompt, ExpenseModel)
+            if self.categorizer is None:
+                return invoice
+            with self.instrumentation.span("categorize"):
+                return self.categorizer.assign(invoice, user_query, latest_invoice, history)
 
         except Exception as e:
             Logger.warn({
@@ -173,6 +800,81 @@ class LLMService:
             })
             raise e
 
+    def _apply_hints(
+        self,
+        hints: ExpenseHints,
+        user_query: str,
+        latest_invoice: Dict[str, Any],
+        history: List[Dict]
+    ) -> Optional[ExpenseModel]:
+        """
+        Build the invoice from a pre-parse sure enough to skip the extraction call, merged
+        into the latest invoice like a delta extraction
+
+        Returns:
+            The invoice, or None when its category needs the LLM
+        """
+        delta = ExpenseDeltaResponse(
+            items=[
+                ItemDelta(op="add", item_name=item.item_name, item_amount=item.item_amount, item_qty=item.item_qty)
+                for item in hints.items
+            ],
+            payment_type=hints.payment_type
+        )
+        with self.instrumentation.span("invoice_merge"):
+            invoice = merge_expense_delta(latest_invoice, delta)
+        with self.instrumentation.span("categorize"):
+            invoice = (self.categorizer or self.hint_categorizer).assign(
+                invoice,
+                user_query,
+                latest_invoice,
+                history,
+                explicit=False
+            )
+        if invoice.expense_category is None:
+            return None
+        self.hint_parser.direct += 1
+        Logger.info({
+            "message": "Extracted expense from the pre-parsed hints",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "user_query": user_query,
+                "hints": hints.to_dict()
+            }
+        })
+        return invoice
+
+    def _build_question_prompt(
+        self,
+        user_query: str,
+        intent: str,
+        invoice: ExpenseModel = None,
+        history: List[Dict] = []
+    ) -> Tuple[Optional[str], Optional[Type[BaseModel]]]:
+        """
+        Build the question prompt of the intent
+
+        Returns:
+            The prompt and its response model, or (None, None) for an unknown intent
+        """
+        with self.instrumentation.span("prompt_build:ask_question"):
+            if intent == "other":
+                prompt = Talk2BillPromptBuilder.build_generic_question_ask_prompt(
+                    user_query,
+                    history
+                )
+                return prompt, GenericQuestionAskResponse
+
+            if intent == "expense":
+                prompt = Talk2BillPromptBuilder.build_expense_missing_fields_prompt(
+                    invoice.model_dump(),
+                    user_query,
+                    history
+                )
+                return prompt, ExpenseMissingFieldsResponse
+
+        return None, None
+
     async def ask_question(
         self,
         user_query: str,
@@ -194,35 +896,185 @@ class LLMService:
             (GenericQuestionAskResponse or ExpenseMissingFieldsResponse)
         """
         try:
+            prompt, response_format = self._build_question_prompt(user_query, intent, invoice, history)
+            if prompt is None:
+                return self.default_generic_question_ask_response
+            return await self._route_and_invoke("ask_question", prompt, response_format, user_query)
 
-            if intent == "other":
-                prompt = Talk2BillPromptBuilder.build_generic_question_ask_prompt(
-                    user_query,
-                    history
-                )
-                response: GenericQuestionAskResponse = await self._invoke(
-                    prompt,
-                    GenericQuestionAskResponse
-                )
-                return response
+        except Exception as e:
+            Logger.warn({
+                "message": "Failed to ask question",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "user_query": user_query,
+                    "error": str(e),
+                    "traceback": traceback.format_exc()
+                }
+            })
+            raise e
 
-            if intent == "expense":
-                prompt = Talk2BillPromptBuilder.build_expense_missing_fields_prompt(
-                    invoice.model_dump(),
+    async def stream_question(
+        self,
+        user_query: str,
+        intent: str,
+        invoice: ExpenseModel = None,
+        history: List[Dict] = []
+    ) -> AsyncIterator[QuestionStreamChunk]:
+        """
+        Ask a question like `ask_question`, yielding the question text as the LLM generates it
+
+        The structured output is parsed incrementally: every new part of the `question` field
+        is yielded as a delta, and a final chunk carries the full question and the status,
+        which is only known once the JSON is complete. A call that fails before anything was
+        yielded falls back to `ask_question` (with its retries).
+
+        Args:
+            user_query: The user query to ask a question about
+            intent: The intent of the user query
+            invoice: The invoice to ask a question about
+            history: The history of the conversation
+
+        Yields:
+            Question deltas, then the final chunk
+        """
+        prompt, response_format = self._build_question_prompt(user_query, intent, invoice, history)
+        if prompt is None:
+            response = self.default_generic_question_ask_response
+            yield QuestionStreamChunk(
+                delta=response.question,
+                final=True,
+                question=response.question,
+                status=response.status
+            )
+            return
+
+        if self.provider_chain is not None and not self.provider_chain.primary.healthy:
+            # Only `llm` streams: while it is failed over, answer through the chain at once
+            response = await self.ask_question(user_query, intent, invoice, history)
+            yield QuestionStreamChunk(
+                delta=response.question,
+                final=True,
+                question=response.question,
+                status=response.status
+            )
+            return
+
+        streamed = ""
+        partial_output = None
+        cached_content, llm_input = await self._resolve_context_cache(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        self.instrumentation.record_prompt_size("ask_question", prompt_tokens)
+        try:
+            # Fails fast with CircuitOpenError while the API is unhealthy, as `_invoke` does,
+            # and falls back to ask_question like any other stream failure
+            self.circuit_breaker.before_call()
+            await self.rate_limiter.acquire(prompt_tokens + self.output_token_reserve)
+            start_time = time.perf_counter()
+            with self.instrumentation.span("llm_stream:ask_question"):
+                streaming_llm = self._get_streaming_llm(response_format, cached_content)
+                async for partial_output in streaming_llm.astream(llm_input):
+                    question = partial_output.get("question") if isinstance(partial_output, dict) else None
+                    # Partial outputs are cumulative: only the new tail of the question is yielded
+                    if (
+                        isinstance(question, str)
+                        and len(question) > len(streamed)
+                        and question.startswith(streamed)
+                    ):
+                        if not streamed:
+                            self.instrumentation.record_span(
+                                "llm_first_token:ask_question",
+                                time.perf_counter() - start_time
+                            )
+                        delta, streamed = question[len(streamed):], question
+                        yield QuestionStreamChunk(delta=delta)
+            self.circuit_breaker.record_success()
+            with self.instrumentation.span("validation:ask_question"):
+                response = response_format.model_validate(partial_output or {})
+            self.instrumentation.record_tokens(
+                "ask_question",
+                estimate_tokens(llm_input),
+                estimate_json_tokens(partial_output or {})
+            )
+
+        except Exception as e:
+            if streamed:
+                Logger.warn({
+                    "message": "Question stream failed after partial output",
+                    "tag": "VyaparTalk2Bill",
+                    "data": {
+                        "user_query": user_query,
+                        "streamed": streamed,
+                        "error": str(e),
+                        "traceback": traceback.format_exc()
+                    }
+                })
+                raise e
+            if not isinstance(e, CircuitOpenError):
+                # The breaker's own rejection is no outcome of a call (nor the end of its probe)
+                self.circuit_breaker.record_failure(classify_error(e))
+            if cached_content is not None:
+                self.context_cache.invalidate(prompt.prefix)
+            Logger.warn({
+                "message": "Question stream failed, falling back to ask_question",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "user_query": user_query,
+                    "error": str(e)
+                }
+            })
+            response = await self.ask_question(user_query, intent, invoice, history)
+
+        # The complete question normally extends what was streamed; yield any remainder
+        remainder = response.question[len(streamed):] if response.question.startswith(streamed) else ""
+        yield QuestionStreamChunk(
+            delta=remainder,
+            final=True,
+            question=response.question,
+            status=response.status
+        )
+
+    async def process_turn_unified(
+        self,
+        user_query: str,
+        latest_invoice: Dict[str, Any] = {},
+        history: List[Dict] = []
+    ) -> UnifiedExpenseResponse:
+        """
+        Classify the intent, merge the expense and ask the follow-up question in a single call
+
+        Args:
+            user_query: The user query
+            latest_invoice: The latest invoice of the session
+            history: The history of the conversation
+
+        Returns:
+            The combined intent, invoice and question response
+        """
+        try:
+            Logger.info({
+                "message": "Processing turn in unified mode",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "user_query": user_query,
+                }
+            })
+            with self.instrumentation.span("prompt_build:process_turn_unified"):
+                prompt = Talk2BillPromptBuilder.build_unified_expense_prompt(
                     user_query,
+                    latest_invoice,
                     history
                 )
-                response: ExpenseMissingFieldsResponse = await self._invoke(
-                    prompt,
-                    ExpenseMissingFieldsResponse
-                )
-                return response
-
-            return self.default_generic_question_ask_response
+            return await self._route_and_invoke(
+                "process_turn_unified",
+                prompt,
+                UnifiedExpenseResponse,
+                user_query,
+                latest_invoice
+            )
 
         except Exception as e:
             Logger.warn({
-                "message": "Failed to ask question",
+                "message": "Failed to process turn in unified mode",
                 "tag": "VyaparTalk2Bill",
                 "data": {
                     "user_query": user_query,
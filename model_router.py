@@ -0,0 +1,266 @@
+"""Module to route the LLM calls of the talk2bill pipeline between cheaper and stronger models"""
+import json
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Set
+from pydantic import BaseModel
+from crons.talk2bill.vyapar.env import env_str
+from crons.talk2bill.vyapar.instrumentation import get_quantile
+from crons.talk2bill.vyapar.response_models import ExpenseDeltaResponse
+
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+@dataclass
+class ModelRoute:
+    """
+    A model the router can send calls to, with its price per million tokens
+    """
+    name: str
+    model: str
+    input_cost_per_million: float = 0.0
+    output_cost_per_million: float = 0.0
+
+
+@dataclass
+class RouteDecision:
+    """
+    The route chosen for a call and why
+    """
+    task: str
+    route: str
+    reason: str
+
+
+@dataclass
+class RouteStats:
+    """
+    Latency, token and cost totals of a route
+    """
+    calls: int = 0
+    failures: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+
+def is_multi_item(user_query: str, max_digits: int = 6) -> bool:
+    """
+    Whether the query likely lists several items, with the heuristic of `route_to_agent`
+    in vaani_functions.ipynb: a comma, " and "/" aur ", or more than `max_digits` digits
+    """
+    query = (user_query or "").lower()
+    return (
+        "," in query
+        or " and " in query
+        or " aur " in query
+        or sum(char.isdigit() for char in query) > max_digits
+    )
+
+
+class RoutingPolicy:
+    """
+    Which route each LLMService task uses, and when extraction turns escalate
+
+    Args:
+        routes: The available routes by name
+        task_routes: The default route of each task (identify_intent, extract_expense,
+            ask_question, process_turn_unified); tasks not listed use `default_route`
+        default_route: The route of unlisted tasks
+        escalate_to: The stronger route multi-item and low-confidence turns go to
+        escalate_tasks: The tasks that may escalate
+        multi_item_digits: The digit count above which a query counts as multi-item
+        max_invoice_items: Invoices with more items than this escalate
+        escalate_on_error: Retry a failed call on the stronger route
+    """
+    def __init__(
+        self,
+        routes: Dict[str, ModelRoute],
+        task_routes: Optional[Dict[str, str]] = None,
+        default_route: str = "fast",
+        escalate_to: str = "strong",
+        escalate_tasks: Optional[Set[str]] = None,
+        multi_item_digits: int = 6,
+        max_invoice_items: int = 2,
+        escalate_on_error: bool = True
+    ):
+        self.routes = routes
+        self.task_routes = task_routes or {}
+        self.default_route = default_route
+        self.escalate_to = escalate_to
+        self.escalate_tasks = escalate_tasks or {"extract_expense", "process_turn_unified"}
+        self.multi_item_digits = multi_item_digits
+        self.max_invoice_items = max_invoice_items
+        self.escalate_on_error = escalate_on_error
+        for route in {default_route, escalate_to, *self.task_routes.values()}:
+            if route not in routes:
+                raise ValueError(f"Routing policy references unknown route {route!r}")
+
+    @classmethod
+    def from_json(cls, config: str) -> "RoutingPolicy":
+        """
+        Build the policy from its JSON configuration, e.g.
+        {"routes": {"fast": {"model": "gemini-2.0-flash-lite", "input_cost_per_million": 0.075,
+        "output_cost_per_million": 0.3}, "strong": {"model": "gemini-2.0-flash"}},
+        "task_routes": {"ask_question": "fast"}, "escalate_to": "strong"}
+        """
+        data = json.loads(config)
+        routes = {
+            name: ModelRoute(name=name, **route)
+            for name, route in data.pop("routes").items()
+        }
+        if "escalate_tasks" in data:
+            data["escalate_tasks"] = set(data["escalate_tasks"])
+        return cls(routes, **data)
+
+
+class ModelRouter:
+    """
+    Chooses the route of each LLM call and records the decisions, latency and cost per route
+    """
+    def __init__(self, policy: RoutingPolicy):
+        self.policy = policy
+        self.decisions: Dict[str, int] = {}
+        self.escalations: Dict[str, int] = {}
+        self.route_stats: Dict[str, RouteStats] = {name: RouteStats() for name in policy.routes}
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelRouter"]:
+        """
+        Build the router from the VYAPAR_T2B_MODEL_ROUTING JSON policy, None when it is unset
+        """
+        config = env_str("VYAPAR_T2B_MODEL_ROUTING")
+        return cls(RoutingPolicy.from_json(config)) if config else None
+
+    def choose(
+        self,
+        task: str,
+        user_query: str = "",
+        latest_invoice: Optional[Dict[str, Any]] = None
+    ) -> RouteDecision:
+        """
+        Choose the route of a call
+
+        Args:
+            task: The LLMService method making the call
+            user_query: The user query of the turn
+            latest_invoice: The latest invoice of the session
+
+        Returns:
+            The route decision
+        """
+        policy = self.policy
+        decision = RouteDecision(task, policy.task_routes.get(task, policy.default_route), "task_default")
+        if task in policy.escalate_tasks and decision.route != policy.escalate_to:
+            items = (latest_invoice or {}).get("items") or []
+            if is_multi_item(user_query, policy.multi_item_digits):
+                decision = RouteDecision(task, policy.escalate_to, "multi_item")
+            elif len(items) > policy.max_invoice_items:
+                decision = RouteDecision(task, policy.escalate_to, "large_invoice")
+        self._count_decision(decision)
+        return decision
+
+    def escalate(self, decision: RouteDecision, reason: str) -> Optional[RouteDecision]:
+        """
+        Get the stronger route for a call whose first answer was not good enough
+
+        Args:
+            decision: The decision of the first call
+            reason: Why it escalates, e.g. "low_confidence" or "error"
+
+        Returns:
+            The escalated decision, or None when the call already used the strongest route
+        """
+        if decision.route == self.policy.escalate_to:
+            return None
+        if reason == "error" and not self.policy.escalate_on_error:
+            return None
+        escalated = RouteDecision(decision.task, self.policy.escalate_to, reason)
+        self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        self._count_decision(escalated)
+        return escalated
+
+    def is_low_confidence(self, task: str, user_query: str, response: BaseModel) -> bool:
+        """
+        Whether an extraction answer looks unreliable: no item (or delta change) although the
+        query has an amount, or an added item with neither a name nor an amount
+
+        Args:
+            task: The LLMService method that made the call
+            user_query: The user query of the turn
+            response: The validated answer
+
+        Returns:
+            True if the turn should be re-run on the stronger route
+        """
+        if task not in self.policy.escalate_tasks:
+            return False
+        if getattr(response, "intent", "expense") != "expense":
+            return False
+        invoice = getattr(response, "invoice", response)
+        items = getattr(invoice, "items", None) or []
+        if not items:
+            return bool(NUMBER_PATTERN.search(user_query or ""))
+        if isinstance(response, ExpenseDeltaResponse):
+            # Updates and removals point at an item by index, only added items carry a name/amount
+            items = [item for item in items if item.op == "add"]
+        return any(not item.item_name and item.item_amount is None for item in items)
+
+    def record(
+        self,
+        decision: RouteDecision,
+        latency: float,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        failed: bool = False
+    ):
+        """
+        Record the outcome of a routed call
+
+        Args:
+            decision: The route decision of the call
+            latency: The seconds the call took, retries included
+            input_tokens: The estimated prompt tokens
+            output_tokens: The estimated response tokens
+            failed: Whether the call raised
+        """
+        route = self.policy.routes[decision.route]
+        stats = self.route_stats[decision.route]
+        stats.calls += 1
+        stats.failures += int(failed)
+        stats.latencies.append(latency)
+        stats.input_tokens += input_tokens
+        stats.output_tokens += output_tokens
+        stats.cost += (
+            input_tokens * route.input_cost_per_million
+            + output_tokens * route.output_cost_per_million
+        ) / 1e6
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the routing decisions, escalations and per-route latency, tokens and cost
+        """
+        routes = {}
+        for name, stats in self.route_stats.items():
+            latencies = sorted(stats.latencies)
+            routes[name] = {
+                "model": self.policy.routes[name].model,
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p95_latency": get_quantile(latencies, 0.95),
+                "input_tokens": stats.input_tokens,
+                "output_tokens": stats.output_tokens,
+                "cost": stats.cost
+            }
+        return {
+            "decisions": dict(self.decisions),
+            "escalations": dict(self.escalations),
+            "routes": routes
+        }
+
+    def _count_decision(self, decision: RouteDecision):
+        key = f"{decision.task}:{decision.route}:{decision.reason}"
+        self.decisions[key] = self.decisions.get(key, 0) + 1
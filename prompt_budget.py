@@ -0,0 +1,133 @@
+"""Module to keep the per-turn parts of the talk2bill prompts compact and within a token budget"""
+import json
+from typing import Any, Dict, List, Optional
+from crons.talk2bill.vyapar.env import env_int
+from crons.talk2bill.vyapar.tokens import estimate_tokens
+
+PROMPT_BUDGET = None
+
+
+def drop_nulls(value: Any) -> Any:
+    """
+    Remove the None values of dicts, recursively
+
+    Args:
+        value: A pydantic model, dict, list or scalar
+
+    Returns:
+        The value as plain dicts/lists without None fields
+    """
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {key: drop_nulls(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [drop_nulls(item) for item in value]
+    return value
+
+
+def compact_json(value: Any, keep_nulls: bool = False) -> str:
+    """
+    Serialize a value for a prompt: JSON without whitespace between tokens, and without
+    nulls unless `keep_nulls`
+
+    Args:
+        value: A pydantic model, dict or list
+        Optional[keep_nulls]: Keep the None fields as explicit nulls
+
+    Returns:
+        The compact JSON
+    """
+    if keep_nulls:
+        value = value.model_dump() if hasattr(value, "model_dump") else value
+    else:
+        value = drop_nulls(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def truncate_text(text: Any, max_chars: int) -> Any:
+    """
+    Shorten a string to `max_chars`, marking the cut with an ellipsis; other values are kept
+    """
+    if not isinstance(text, str) or len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)].rstrip() + "…"
+
+
+class PromptBudget:
+    """
+    Token budget of the conversation history spliced into each prompt
+
+    The newest turns are kept first. Each message is cut to `max_message_chars`, and the
+    turns that no longer fit in `max_history_tokens` are replaced by a single marker
+    counting them, so the prompt size stays flat however long the session gets.
+    """
+    def __init__(self, max_history_tokens: int = 600, max_message_chars: int = 300):
+        self.max_history_tokens = max_history_tokens
+        self.max_message_chars = max_message_chars
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        """
+        Build the budget from VYAPAR_T2B_PROMPT_HISTORY_TOKENS and VYAPAR_T2B_PROMPT_MESSAGE_CHARS
+        """
+        return cls(
+            max_history_tokens=env_int("VYAPAR_T2B_PROMPT_HISTORY_TOKENS", 600),
+            max_message_chars=env_int("VYAPAR_T2B_PROMPT_MESSAGE_CHARS", 300)
+        )
+
+    def fit_history(self, history: Optional[List[Dict]]) -> List[Dict]:
+        """
+        Get the history entries that fit in the budget
+
+        Args:
+            history: The history of the conversation, oldest turn first
+
+        Returns:
+            The kept turns in order, after a {"earlier_turns_omitted": n} marker when turns were dropped
+        """
+        history = history or []
+        kept = []
+        used_tokens = 1
+        for turn in reversed(history):
+            entry = {
+                key: truncate_text(value, self.max_message_chars)
+                for key, value in turn.items()
+                if value not in (None, "")
+            }
+            entry_tokens = estimate_tokens(compact_json(entry)) + 1
+            if used_tokens + entry_tokens > self.max_history_tokens:
+                break
+            kept.append(entry)
+            used_tokens += entry_tokens
+        kept.reverse()
+        omitted = len(history) - len(kept)
+        if omitted:
+            kept.insert(0, {"earlier_turns_omitted": omitted})
+        return kept
+
+    def render_history(self, history: Optional[List[Dict]]) -> str:
+        """
+        Serialize the history that fits in the budget as compact JSON
+        """
+        return compact_json(self.fit_history(history))
+
+    @staticmethod
+    def render_invoice(invoice: Any) -> str:
+        """
+        Serialize an invoice as compact JSON, "{}" when there is none
+
+        Null fields are kept: the extraction and missing-fields prompts spot incomplete
+        items by their explicit nulls (e.g. {"item_name": null, "item_amount": 100}).
+        """
+        return compact_json(invoice, keep_nulls=True) if invoice else "{}"
+
+
+def get_prompt_budget() -> PromptBudget:
+    """
+    Get the process-wide prompt budget
+    """
+    global PROMPT_BUDGET
+    if PROMPT_BUDGET is None:
+        PROMPT_BUDGET = PromptBudget.from_env()
+    return PROMPT_BUDGET
@@ -1,6 +1,5 @@
 """Module to build the prompts for the talk2bill pipeline"""
-import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from constants.talk2bill.vyapar.generic import SUPPORTED_INVOICE_CATEGORIES
 from constants.talk2bill.vyapar.prompts import (
     EXPENSE_MISSING_FIELDS_PROMPT_VYP,
@@ -9,14 +8,56 @@ from constants.talk2bill.vyapar.prompts import (
     EXPENSE_EXAMPLES,
     OTHER_EXAMPLES,
     INTENT_CLASSIFICATION_PROMPT_VYP,
+    INTENT_CLASSIFICATION_BATCH_PROMPT_VYP,
+    INTENT_CLASSIFICATION_BATCH_REQUEST,
     EXPENSE_EXTRACTION_PROMPT_V1,
-    GENERIC_QUESTION_ASK_PROMPT
+    EXPENSE_EXTRACTION_PROMPT_LOCAL_CATEGORY,
+    EXPENSE_DELTA_EXTRACTION_PROMPT_VYP,
+    EXPENSE_EXTRACTION_HINTS,
+    GENERIC_QUESTION_ASK_PROMPT,
+    UNIFIED_EXPENSE_PROMPT_VYP
+)
+from crons.talk2bill.vyapar.compiled_prompt import CompiledPrompt, PromptParts
+from crons.talk2bill.vyapar.prompt_budget import get_prompt_budget
+
+# The rules, examples and supported categories never change between turns: render them
+# into the templates once at import and only splice in the per-turn fields
+ALL_RULES = "\n".join([EXPENSE_RULES, OTHER_RULES])
+ALL_EXAMPLES = "\n".join([EXPENSE_EXAMPLES, OTHER_EXAMPLES])
+INTENT_CLASSIFICATION_TEMPLATE = CompiledPrompt(
+    INTENT_CLASSIFICATION_PROMPT_VYP,
+    all_rules=ALL_RULES,
+    all_examples=ALL_EXAMPLES
+)
+INTENT_CLASSIFICATION_BATCH_TEMPLATE = CompiledPrompt(
+    INTENT_CLASSIFICATION_BATCH_PROMPT_VYP,
+    all_rules=ALL_RULES,
+    all_examples=ALL_EXAMPLES
+)
+INTENT_CLASSIFICATION_BATCH_REQUEST_TEMPLATE = CompiledPrompt(INTENT_CLASSIFICATION_BATCH_REQUEST)
+EXPENSE_EXTRACTION_TEMPLATE = CompiledPrompt(EXPENSE_EXTRACTION_PROMPT_V1)
+EXPENSE_EXTRACTION_LOCAL_CATEGORY_TEMPLATE = CompiledPrompt(EXPENSE_EXTRACTION_PROMPT_LOCAL_CATEGORY)
+EXPENSE_DELTA_EXTRACTION_TEMPLATE = CompiledPrompt(EXPENSE_DELTA_EXTRACTION_PROMPT_VYP)
+EXPENSE_EXTRACTION_HINTS_TEMPLATE = CompiledPrompt(EXPENSE_EXTRACTION_HINTS)
+EXPENSE_MISSING_FIELDS_TEMPLATE = CompiledPrompt(EXPENSE_MISSING_FIELDS_PROMPT_VYP)
+GENERIC_QUESTION_ASK_TEMPLATE = CompiledPrompt(
+    GENERIC_QUESTION_ASK_PROMPT,
+    supported_categories=SUPPORTED_INVOICE_CATEGORIES
+)
+UNIFIED_EXPENSE_TEMPLATE = CompiledPrompt(
+    UNIFIED_EXPENSE_PROMPT_VYP,
+    all_rules=ALL_RULES,
+    all_examples=ALL_EXAMPLES,
+    supported_categories=SUPPORTED_INVOICE_CATEGORIES
 )
 
 
 class Talk2BillPromptBuilder:
     """
     Class to build the prompts for the talk2bill pipeline
+
+    Prompts are returned as PromptParts: plain strings that also expose the stable `prefix`
+    (rules, lexicon, examples) and the per-turn `suffix`, for provider-side context caching.
     """
     @staticmethod
     def build_all_rules_and_examples():
@@ -26,11 +67,7 @@ class Talk2BillPromptBuilder:
         Returns:
             The all rules and examples
         """
-        rules_list = [EXPENSE_RULES, OTHER_RULES]
-        examples_list = [EXPENSE_EXAMPLES, OTHER_EXAMPLES]
-        all_rules = "\n".join(rules_list)
-        all_examples = "\n".join(examples_list)
-        return all_rules, all_examples
+        return ALL_RULES, ALL_EXAMPLES
 
     @staticmethod
     def build_intent_classification_prompt(
@@ -47,19 +84,42 @@ class Talk2BillPromptBuilder:
         Returns:
             The intent classification prompt
         """
-        all_rules, all_examples = Talk2BillPromptBuilder.build_all_rules_and_examples()
-        return INTENT_CLASSIFICATION_PROMPT_VYP.format(
-            all_rules=all_rules,
-            all_examples=all_examples,
-            history=history,
+        return INTENT_CLASSIFICATION_TEMPLATE.render(
+            history=get_prompt_budget().render_history(history),
             user_query=user_query
         )
 
+    @staticmethod
+    def build_intent_classification_batch_prompt(
+        requests: List[Tuple[List[Dict], str]]
+    ) -> str:
+        """
+        Build the prompt classifying the intent of several independent requests in one call
+
+        Args:
+            requests: The (history, user query) of each request, identified by its index
+
+        Returns:
+            The batched intent classification prompt
+        """
+        return INTENT_CLASSIFICATION_BATCH_TEMPLATE.render(
+            requests="\n\n".join(
+                str(INTENT_CLASSIFICATION_BATCH_REQUEST_TEMPLATE.render(
+                    id=index,
+                    history=get_prompt_budget().render_history(history),
+                    user_query=user_query
+                ))
+                for index, (history, user_query) in enumerate(requests)
+            )
+        )
+
     @staticmethod
     def build_expense_extraction_prompt(
         user_input: str,
         latest_invoice: Dict[str, Any] = {},
-        history: List[Dict] = []
+        history: List[Dict] = [],
+        local_category: bool = False,
+        hints: Optional[str] = None
     ) -> str:
         """
         Build the expense extraction prompt
@@ -68,22 +128,65 @@ class Talk2BillPromptBuilder:
             user_input: The user input
             latest_invoice: The latest invoice
             history: The history of the conversation
+            local_category: Leave out the category inference lexicon and aggregation rules,
+                for a category assigned after extraction by the local categorizer
+            hints: The pre-parsed amounts, quantities and payment method of the user input
 
         Returns:
             The expense extraction prompt
         """
-        # Serialize the invoice to JSON string for proper formatting in the prompt
-        current_invoice_json = json.dumps(
-            latest_invoice,
-            ensure_ascii=False
-        ) if latest_invoice else "{}"
-        history_json = json.dumps(history, ensure_ascii=False) if history else "[]"
+        template = EXPENSE_EXTRACTION_LOCAL_CATEGORY_TEMPLATE if local_category else EXPENSE_EXTRACTION_TEMPLATE
+        # Compact JSON without nulls, with the history trimmed to the prompt budget
+        prompt_budget = get_prompt_budget()
+        prompt = template.render(
+            user_input=user_input,
+            current_invoice=prompt_budget.render_invoice(latest_invoice),
+            history=prompt_budget.render_history(history)
+        )
+        return Talk2BillPromptBuilder.append_hints(prompt, hints)
+
+    @staticmethod
+    def build_expense_delta_extraction_prompt(
+        user_input: str,
+        latest_invoice: Dict[str, Any] = {},
+        history: List[Dict] = [],
+        hints: Optional[str] = None
+    ) -> str:
+        """
+        Build the prompt extracting only the changes the user input makes to the invoice
 
-        return EXPENSE_EXTRACTION_PROMPT_V1.format(
+        Args:
+            user_input: The user input
+            latest_invoice: The latest invoice
+            history: The history of the conversation
+            hints: The pre-parsed amounts, quantities and payment method of the user input
+
+        Returns:
+            The delta extraction prompt
+        """
+        prompt_budget = get_prompt_budget()
+        prompt = EXPENSE_DELTA_EXTRACTION_TEMPLATE.render(
             user_input=user_input,
-            current_invoice=current_invoice_json,
-            history=history_json
+            current_invoice=prompt_budget.render_invoice(latest_invoice),
+            history=prompt_budget.render_history(history)
         )
+        return Talk2BillPromptBuilder.append_hints(prompt, hints)
+
+    @staticmethod
+    def append_hints(prompt: PromptParts, hints: Optional[str]) -> PromptParts:
+        """
+        Append the pre-parsed hints to the per-turn suffix of an extraction prompt
+
+        Args:
+            prompt: The rendered extraction prompt
+            hints: The hints as compact JSON, None to keep the prompt as is
+
+        Returns:
+            The prompt with its hints
+        """
+        if not hints:
+            return prompt
+        return PromptParts(prompt.prefix, prompt.suffix + EXPENSE_EXTRACTION_HINTS_TEMPLATE.render(hints=hints))
 
     @staticmethod
     def build_expense_missing_fields_prompt(
@@ -102,10 +205,11 @@ class Talk2BillPromptBuilder:
         Returns:
             The expense missing fields prompt
         """
-        return EXPENSE_MISSING_FIELDS_PROMPT_VYP.format(
-            extracted_data=extracted_data,
+        prompt_budget = get_prompt_budget()
+        return EXPENSE_MISSING_FIELDS_TEMPLATE.render(
+            extracted_data=prompt_budget.render_invoice(extracted_data),
             user_input=user_input,
-            history=history
+            history=prompt_budget.render_history(history)
         )
 
     @staticmethod
@@ -123,8 +227,31 @@ class Talk2BillPromptBuilder:
         Returns:
             The generic question ask prompt
         """
-        return GENERIC_QUESTION_ASK_PROMPT.format(
+        return GENERIC_QUESTION_ASK_TEMPLATE.render(
             user_input=user_input,
-            conversation_history=conversation_history,
-            supported_categories=SUPPORTED_INVOICE_CATEGORIES
+            conversation_history=get_prompt_budget().render_history(conversation_history)
+        )
+
+    @staticmethod
+    def build_unified_expense_prompt(
+        user_input: str,
+        latest_invoice: Dict[str, Any] = {},
+        history: List[Dict] = []
+    ) -> str:
+        """
+        Build the single-call prompt that classifies, extracts and asks in one request
+
+        Args:
+            user_input: The user input
+            latest_invoice: The latest invoice
+            history: The history of the conversation
+
+        Returns:
+            The unified expense prompt
+        """
+        prompt_budget = get_prompt_budget()
+        return UNIFIED_EXPENSE_TEMPLATE.render(
+            current_invoice=prompt_budget.render_invoice(latest_invoice),
+            history=prompt_budget.render_history(history),
+            user_input=user_input
         )
@@ -21,6 +21,28 @@ Classify user query as "expense" or "other" based on conversation history.
 <<USER_QUERY>>
 """
 
+INTENT_CLASSIFICATION_BATCH_PROMPT_VYP = r"""
+Classify each of the independent requests below as "expense" or "other" based on its own
+conversation history. Requests belong to different users: never use one request's history for another.
+
+**Rules**:
+{all_rules}
+
+**Examples**:
+{all_examples}
+
+**Requests**:
+{requests}
+
+**Response**: one result per request id, e.g.
+{{"results": [{{"id": 0, "intent": "expense"}}, {{"id": 1, "intent": "other"}}]}}
+"""
+
+INTENT_CLASSIFICATION_BATCH_REQUEST = r"""<<REQUEST {id}>>
+History: {history}
+User Query: "{user_query}"
+<<REQUEST {id}>>"""
+
 # ----------------------------------------- EXPENSE -----------------------------------------
 # Expense categories (easily expandable)
 EXPENSE_CATEGORIES = r"""
@@ -79,10 +101,14 @@ User: "Can you help me?" → {{"intent": "other"}}
 User: "What can you do?" → {{"intent": "other"}}
 """
 
-EXPENSE_EXTRACTION_PROMPT_V1 = r"""
+# EXPENSE_EXTRACTION_PROMPT_V1 is assembled from sections so the category rules can be
+# swapped out when the category is assigned locally (categorizer.py)
+EXPENSE_EXTRACTION_HEAD = r"""
 Extract expense information from user input and merge with existing invoice data. Return ONLY updated JSON.
 
-CATEGORIZATION:
+"""
+
+EXPENSE_CATEGORY_INFERENCE_RULES = r"""CATEGORIZATION:
 - Examples: food, petrol/diesel, salary, utilities, medical, transport, shopping, etc.
 
 CATEGORY EXTRACTION RULES:
@@ -112,7 +138,9 @@ Inference rules:
 lexicon (e.g., "diesel" → "petrol", "coffee" → "food"), you MUST set the expense_category accordingly.
 Do not leave it as null if a match exists.
 
-INFERENCE RULES:
+"""
+
+EXPENSE_EXTRACTION_ITEM_RULES = r"""INFERENCE RULES:
 - Use predefined rules above
 - item_name = specific object/person (e.g., "bike", "chai", "Ram"), NOT full description
 - item_amount = TOTAL cost for this line item
@@ -220,7 +248,9 @@ In-place completion for partial items:
   - Current: [{{"item_name": null, "item_amount": 100, "item_qty": 1}}]
     User: "car" → Result: [{{"item_name": "car", "item_amount": 100, "item_qty": 1}}]
 
-CATEGORY AGGREGATION (multi-category handling):
+"""
+
+EXPENSE_CATEGORY_AGGREGATION_RULES = r"""CATEGORY AGGREGATION (multi-category handling):
 - When user did NOT explicitly provide a category:
   1) Infer each item's category using the lexicon (food, petrol, utilities, etc.).
   2) Let inferred_set = unique set of inferred categories for all items (ignore items with no match).
@@ -232,7 +262,9 @@ CATEGORY AGGREGATION (multi-category handling):
   - If current_invoice.expense_category is a single category and adding a new item causes inferred_set to include a different category (size ≥ 2) → set expense_category = "daily expense"
 - Never overwrite an explicit user-provided category (if the user states a category, that wins).
 
-GROUP QUANTITY MODIFIERS:
+"""
+
+EXPENSE_EXTRACTION_EXAMPLES = r"""GROUP QUANTITY MODIFIERS:
 - If the input contains a trailing/group quantity like:
   - "<qty> <unit> both" (e.g., "2 kg both")
   - "<qty> <unit> each" (already covered but keep consistent)
@@ -369,6 +401,105 @@ RESPONSE FORMAT (JSON ONLY):
 }}
 """
 
+EXPENSE_EXTRACTION_PROMPT_V1 = (
+    EXPENSE_EXTRACTION_HEAD
+    + EXPENSE_CATEGORY_INFERENCE_RULES
+    + EXPENSE_EXTRACTION_ITEM_RULES
+    + EXPENSE_CATEGORY_AGGREGATION_RULES
+    + EXPENSE_EXTRACTION_EXAMPLES
+)
+
+# Explicit categories only: the category of the items is inferred after extraction
+EXPENSE_CATEGORY_EXPLICIT_RULES = r"""CATEGORY EXTRACTION RULES:
+- If the user explicitly states a category (e.g., "category is X", "create a category called X", "under X", "add to X category"):
+  - Set expense_category to EXACTLY what the user said (verbatim), without mapping.
+  - Examples:
+    - "create a category called travel expense" → expense_category: "travel expense"
+    - "record paper under office supplies" → expense_category: "office supplies"
+    - "category is team outing" → expense_category: "team outing"
+- Otherwise keep the expense_category of the Current Invoice (null if none). Do NOT infer a category
+  from the items, it is assigned after extraction.
+- Never overwrite a user-provided category.
+
+"""
+
+EXPENSE_EXTRACTION_PROMPT_LOCAL_CATEGORY = (
+    EXPENSE_EXTRACTION_HEAD
+    + EXPENSE_CATEGORY_EXPLICIT_RULES
+    + EXPENSE_EXTRACTION_ITEM_RULES
+    + EXPENSE_EXTRACTION_EXAMPLES
+)
+
+# Delta variant of EXPENSE_EXTRACTION_PROMPT_V1: the model only returns what the user input
+# changes, the merge into the current invoice is done locally (invoice_merge.py)
+EXPENSE_DELTA_EXTRACTION_PROMPT_VYP = r"""
+Extract ONLY the changes the user input makes to the current invoice. Do NOT repeat existing items.
+
+**ITEM OPERATIONS** (indexes are 0-based positions in Current Invoice items):
+- "add": a new item the user mentions → {{"op": "add", "item_name": ..., "item_amount": ..., "item_qty": ...}}
+- "update": the user explicitly corrects an existing item → {{"op": "update", "index": i, <only the changed fields>}}
+- "remove": the user removes/deletes/cancels an existing item → {{"op": "remove", "index": i}}
+- An incomplete existing item (e.g. item_name null) answered by a single item ("car 100", "car") → return it as "add"; it is matched to the earliest incomplete item locally
+- "yes" / "ok" / "no" / "done" / "cancel" without item details → {{"items": []}}
+
+**ITEM RULES**:
+- item_name = specific object/person as said by the user (e.g., "bike", "chai", "Ram"), never a currency ("rs", "rupees", "₹", "/-") or unit ("kg", "liter", "pcs", "dozen") term; null if none
+- item_amount = number found in the input ("100", "Rs 100", "100 rupees", "100/-", "₹100"); null if none
+- item_qty = quantity ("one", "2", "5 kg" → 5); default 1
+- "each" / "per <unit>" / "<amount>/<unit>" → item_amount is the per-unit price; "<qty> <unit> both/each" applies to every listed item
+- "total" with a quantity → item_amount = total / item_qty (2 decimals)
+- An amount before "<qty> <unit> <item>" ("Rs 100, 5 kg rice") is ONE item
+- Several amounts without item names ("100 and 200") → one item per amount with item_name null
+
+**CATEGORY** (expense_category of the whole invoice after the change, null if unchanged):
+- The user states a category ("category is X", "under X", "add to X category") → exactly what the user said, and set "category_explicit": true
+- Otherwise infer from all items (existing and new): food: milk, apple, banana, rice, wheat, bread, egg, meat, chicken, tea, chai, coffee, sugar, oil, biryani, vegetables, fruit, snacks | petrol: petrol, diesel, gas | utilities: electricity, water, internet, phone | medical: doctor, medicine, hospital | transport: taxi, bus, auto | shopping: clothes, groceries, stationery, office supplies
+- Items of several categories → "daily expense"; no match → null
+
+**PAYMENT**: payment_type = exact method/bank/app mentioned ("sbi bank", "hdfc", "phonepe", "card", "upi"); null if none is mentioned
+
+**EXAMPLES**:
+Current Invoice: {{}}
+User Input: "2 chai 40 rupees"
+Output: {{"items": [{{"op": "add", "item_name": "chai", "item_amount": 40, "item_qty": 2}}], "expense_category": "food", "payment_type": null}}
+
+Current Invoice: {{"expense_category":"food","items":[{{"item_name":"coffee","item_amount":100,"item_qty":1}}],"payment_type":"cash"}}
+User Input: "add petrol 200 via phonepe"
+Output: {{"items": [{{"op": "add", "item_name": "petrol", "item_amount": 200, "item_qty": 1}}], "expense_category": "daily expense", "payment_type": "phonepe"}}
+
+Current Invoice: {{"expense_category":"daily expense","items":[{{"item_name":"milk","item_amount":20,"item_qty":1}},{{"item_name":"petrol","item_amount":100,"item_qty":1}}],"payment_type":"cash"}}
+User Input: "remove petrol, make milk 25"
+Output: {{"items": [{{"op": "remove", "index": 1}}, {{"op": "update", "index": 0, "item_amount": 25}}], "expense_category": "food", "payment_type": null}}
+
+Current Invoice: {{"items":[{{"item_name":null,"item_amount":100,"item_qty":1}},{{"item_name":null,"item_amount":200,"item_qty":1}}],"payment_type":"cash"}}
+User Input: "car 100"
+Output: {{"items": [{{"op": "add", "item_name": "car", "item_amount": 100, "item_qty": 1}}], "expense_category": null, "payment_type": null}}
+
+Current Invoice: {{"items":[{{"item_name":"paper","item_amount":50,"item_qty":1}}]}}
+User Input: "put it under office supplies"
+Output: {{"items": [], "expense_category": "office supplies", "category_explicit": true, "payment_type": null}}
+
+INPUT:
+Current Invoice: {current_invoice}
+Recent history: {history}
+User Input: "{user_input}"
+
+RESPONSE FORMAT (JSON ONLY):
+{{
+    "items": [{{"op": "add" | "update" | "remove", "index": index or null, "item_name": "name", "item_amount": amount, "item_qty": qty}}],
+    "expense_category": "category" or null,
+    "category_explicit": true or false,
+    "payment_type": "payment_method" or null
+}}
+"""
+
+# Appended to the extraction prompts when the deterministic pre-parser (hint_parser.py) found
+# amounts, quantities or a payment method in the user input
+EXPENSE_EXTRACTION_HINTS = r"""
+PARSED HINTS (deterministic pre-parse of the User Input; use them unless the input clearly says otherwise):
+{hints}
+"""
+
 EXPENSE_MISSING_FIELDS_PROMPT_VYP = r"""
 You are VAANI, an expense tracker assistant.
 
@@ -570,3 +701,115 @@ EXAMPLES:
 - User says "that's all": {{"question": "", "status": "complete"}}
 
 """
+
+
+# ---------------------------------- UNIFIED (SINGLE CALL) PROMPT ---------------------------------
+
+UNIFIED_EXPENSE_PROMPT_VYP = r"""
+You are VAANI, an expense tracker assistant. In ONE response:
+1. Classify the user query as "expense" or "other" using the history
+2. If "expense": merge the user input into the current invoice
+3. Check the merged invoice for missing/invalid fields and ask for them
+4. If "other": give a brief helpful reply and redirect to expenses
+
+**INTENT RULES**:
+{all_rules}
+
+**EXTRACTION RULES** (only when intent is "expense"):
+- item_name = specific object/person as said by the user (e.g., "bike", "chai", "Ram"), never a currency or unit term
+- item_amount = number found in the input ("100", "Rs 100", "100 rupees", "100/-", "₹100"); null if none
+- item_qty = quantity ("one", "2", "5 kg" → 5); default 1
+- "each" / "per <unit>" / "<amount>/<unit>" → item_amount is the per-unit price
+- "total" with a quantity → item_amount = total / item_qty (2 decimals)
+- payment_type = exact method/bank/app mentioned ("sbi bank", "hdfc", "phonepe", "card", "upi"); "cash" only if none is mentioned
+- expense_category = verbatim if the user states one; otherwise infer from items:
+  food: milk, rice, bread, egg, chicken, tea, chai, coffee, sugar, oil, biryani, vegetables, fruit, snacks
+  petrol: petrol, diesel, gas | utilities: electricity, water, internet, phone
+  medical: doctor, medicine, hospital | transport: taxi, bus, auto | shopping: clothes, groceries, stationery
+  Items from several categories → "daily expense"; no match → null. Never overwrite a user-provided category.
+
+**MERGING**:
+- Return the COMPLETE invoice: all existing items plus new ones
+- If an existing item has missing fields and the user gives a single item/amount, complete the earliest such item instead of appending
+- Only change existing items when the user explicitly corrects or removes them
+- "yes" / "ok" / "no" / "done" / "cancel" without item details → return the current invoice unchanged
+
+**QUESTION RULES**:
+- expense: required fields are expense_category, payment_type and at least one item with item_name, item_amount > 0 and item_qty > 0
+  - If all are valid → {{"question": "", "status": "complete"}}
+  - Item amounts without names → "What did you spend [amounts] on?"
+  - Only category missing → "Which category is this expense?"
+  - Otherwise ask up to 3 missing fields in one short question, naming the item. Never repeat the user's query
+  - User wants to add more items → "What would you like to add?"
+- other:
+  - "yes" / "sure" / "okay" → "What did you spend money on today?" with status "continue"
+  - "no" / "that's all" / "done" / "not interested" → {{"question": "", "status": "complete"}}
+  - The last 3 user messages mean the same, or more than 4 off-topic messages in a row → {{"question": "", "status": "complete"}}
+  - Otherwise: brief, polite reply (max 2 sentences) that redirects to expenses; supported categories: {supported_categories}
+
+**EXAMPLES**:
+{all_examples}
+
+Input: "2 chai 40 rupees" (no history, empty invoice)
+Output: {{"intent": "expense", "invoice": {{"expense_category": "food", "items": [{{"item_name": "chai", "item_amount": 40, "item_qty": 2}}], "payment_type": "cash"}}, "question": "", "status": "complete"}}
+
+Input: "Add 100 rupees and 200 rupees." (no history, empty invoice)
+Output: {{"intent": "expense", "invoice": {{"expense_category": null, "items": [{{"item_name": null, "item_amount": 100, "item_qty": 1}}, {{"item_name": null, "item_amount": 200, "item_qty": 1}}], "payment_type": "cash"}}, "question": "What did you spend 100 and 200 on?", "status": "continue"}}
+
+Input: "Hello!" (no history)
+Output: {{"intent": "other", "invoice": {{"expense_category": null, "items": [], "payment_type": null}}, "question": "Hello! I'm VAANI, your expense helper. What did you spend money on today?", "status": "continue"}}
+
+INPUT:
+Current Invoice: {current_invoice}
+History: {history}
+User Input: "{user_input}"
+
+RESPONSE FORMAT (JSON ONLY):
+{{
+    "intent": "expense" or "other",
+    "invoice": {{"expense_category": "category", "items": [{{"item_name": "name", "item_amount": amount, "item_qty": qty}}], "payment_type": "payment_method"}},
+    "question": "question or empty string",
+    "status": "continue" or "complete"
+}}
+"""
+
+# ---------------------------------------- EXTRACTION AGENTS ----------------------------------------
+# The single-call agents of vaani_functions.ipynb (agents.py)
+AGENT_BASIC_EXTRACTOR_PROMPT = """You are an expense tracking assistant. Extract the following from the voice input:
+
+Voice Input: "{voice_input}"
+
+Extract and return ONLY a JSON object with these fields:
+- amount: The amount spent (number only, no currency)
+- item: The item name
+- category: Best category for this expense (Food, Transport, Utilities, etc.)
+
+Return ONLY valid JSON, nothing else."""
+
+AGENT_SMART_CATEGORIZER_PROMPT = """You are an expense tracking assistant for Indian MSMEs. Extract information from this voice input.
+
+Voice Input: "{voice_input}"
+{context_section}
+Extract and return ONLY a JSON object:
+- amount: Amount spent (number only)
+- item: Item name
+- category: Most appropriate category (consider common Indian business expenses)
+
+Return ONLY valid JSON."""
+
+AGENT_SMART_CATEGORIZER_CONTEXT = "\n\nCommon categories used by similar businesses:\n{excel_db_context}\n"
+
+AGENT_MULTI_ITEM_PROMPT = """You are an expense tracking assistant. The voice input may contain multiple items.
+
+Voice Input: "{voice_input}"
+
+Extract ALL items mentioned. Return ONLY a JSON object:
+{{
+    "items": [
+        {{"amount": number, "item": "name", "category": "category"}},
+        ...
+    ],
+    "total_amount": sum of all amounts
+}}
+
+Return ONLY valid JSON."""
@@ -0,0 +1,331 @@
+"""Module to fail the LLM calls of the talk2bill pipeline over along an ordered chain of providers by their health"""
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple, Type, Union
+from pydantic import BaseModel
+from crons.talk2bill.vyapar.env import env_float, env_int, env_str
+from crons.talk2bill.vyapar.instrumentation import get_quantile
+from crons.talk2bill.vyapar.providers import ChatProvider, get_provider
+from crons.talk2bill.vyapar.retry_policy import ErrorKind
+from crons.talk2bill.vyapar.response_models import get_output_schema
+from logger.logger import Logger
+
+
+@dataclass
+class StructuredMessage:
+    """
+    The raw reply of a structured call, shaped like the langchain message LLMService reads
+    the token usage from
+    """
+    content: str
+    usage_metadata: Optional[Dict[str, int]] = None
+
+
+class StructuredOutputAdapter:
+    """
+    Presents a ChatProvider as the chat model LLMService calls:
+    `with_structured_output(schema, method="json_schema", include_raw=True).ainvoke(prompt)`,
+    answered with the provider's own structured output (OpenAI JSON schema response format,
+    Anthropic forced tool call, Gemini JSON schema mode) for the same response models
+    """
+    def __init__(
+        self,
+        provider: ChatProvider,
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        max_tokens: int = 2048
+    ):
+        self.provider = provider
+        self.model = model or provider.model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def with_structured_output(
+        self,
+        schema: Union[Type[BaseModel], Dict[str, Any]],
+        method: str = "json_schema",
+        include_raw: bool = False,
+        **kwargs
+    ) -> "StructuredOutputRunnable":
+        """
+        Get a runnable answering with objects of `schema`: dicts for a JSON schema, model
+        instances for a response model
+        """
+        return StructuredOutputRunnable(self, schema, include_raw)
+
+
+class StructuredOutputRunnable:
+    """
+    Structured-output runnable of StructuredOutputAdapter
+    """
+    def __init__(
+        self,
+        adapter: StructuredOutputAdapter,
+        schema: Union[Type[BaseModel], Dict[str, Any]],
+        include_raw: bool = False
+    ):
+        self.adapter = adapter
+        self.response_model = None if isinstance(schema, dict) else schema
+        self.schema = schema if isinstance(schema, dict) else get_output_schema(schema)
+        self.include_raw = include_raw
+
+    async def ainvoke(self, prompt: Any, config: Any = None, **kwargs) -> Any:
+        """
+        Call the provider; reply parsing errors are returned in `parsing_error` with `include_raw`
+        like langchain does, transport errors raise
+
+        Returns:
+            The parsed reply, or {"raw", "parsed", "parsing_error"} with `include_raw`
+        """
+        try:
+            parsed, usage, content = await self.adapter.provider.complete_structured(
+                str(prompt),
+                self.schema,
+                self.adapter.model,
+                self.adapter.temperature,
+                self.adapter.max_tokens
+            )
+            if self.response_model is not None:
+                parsed = self.response_model.model_validate(parsed)
+        except (json.JSONDecodeError, ValueError) as e:
+            if not self.include_raw:
+                raise
+            return {"raw": StructuredMessage(content=""), "parsed": None, "parsing_error": e}
+        if not self.include_raw:
+            return parsed
+        return {"raw": StructuredMessage(content, usage), "parsed": parsed, "parsing_error": None}
+
+
+@dataclass
+class ChainMember:
+    """
+    A provider of the chain: its chat model and health over the recent calls
+    """
+    name: str
+    llm: Any
+    model: str
+    healthy: bool = True
+    # (time, latency in seconds, success) of the calls within the window
+    outcomes: Deque[Tuple[float, float, bool]] = field(default_factory=deque)
+    unhealthy_since: float = 0.0
+    probe_started_at: Optional[float] = None
+    calls: int = 0
+    failures: int = 0
+    failovers: int = 0
+    recoveries: int = 0
+
+
+class ProviderChain:
+    """
+    Ordered chain of chat model providers, the first one being the primary
+
+    Each call goes to the first healthy provider. A provider turns unhealthy when, over the
+    last `window_seconds` and at least `min_calls` calls, its error rate reaches
+    `error_rate_threshold` or the `latency_percentile` of its latency reaches
+    `latency_threshold`; calls then fail over to the next one. After `recovery_after`
+    seconds a single probe call is sent to it again: success makes it healthy, so traffic
+    returns to the primary as soon as it recovers; failure restarts the wait.
+    """
+    def __init__(
+        self,
+        members: List[ChainMember],
+        error_rate_threshold: float = 0.5,
+        latency_threshold: float = 0.0,
+        latency_percentile: float = 0.9,
+        min_calls: int = 5,
+        window_seconds: float = 60.0,
+        recovery_after: float = 30.0,
+        retries_before_failover: int = 1
+    ):
+        """
+        Args:
+            members: The providers, in order of preference
+            error_rate_threshold: The error rate making a provider unhealthy
+            latency_threshold: The latency percentile in seconds making a provider unhealthy,
+                0 to ignore latency
+            latency_percentile: The percentile of the latencies compared to the threshold
+            min_calls: The calls in the window before a provider can turn unhealthy
+            window_seconds: The span of the health window
+            recovery_after: The seconds before an unhealthy provider is probed again
+            retries_before_failover: The retries of a call on a provider before it moves to
+                the next one (the last provider keeps the full retry policy)
+        """
+        if not members:
+            raise ValueError("A provider chain needs at least one provider")
+        self.members = {member.name: member for member in members}
+        self.order = [member.name for member in members]
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.recovery_after = recovery_after
+        self.retries_before_failover = retries_before_failover
+        self.call_failovers = 0
+
+    @classmethod
+    def from_env(cls, primary_llm: Any, primary_model: str) -> Optional["ProviderChain"]:
+        """
+        Build the chain from VYAPAR_T2B_PROVIDER_CHAIN ("gemini,openai,anthropic") and the
+        VYAPAR_T2B_FAILOVER_* thresholds; None without a fallback provider
+
+        Args:
+            primary_llm: The chat model of LLMService, answering for the first provider
+            primary_model: Its model name
+        """
+        names = [name.strip() for name in (env_str("VYAPAR_T2B_PROVIDER_CHAIN") or "").split(",") if name.strip()]
+        if len(names) < 2:
+            return None
+        members = [ChainMember(name=names[0], llm=primary_llm, model=primary_model)]
+        for name in names[1:]:
+            adapter = StructuredOutputAdapter(get_provider(name))
+            members.append(ChainMember(name=name, llm=adapter, model=adapter.model))
+        return cls(
+            members,
+            error_rate_threshold=env_float("VYAPAR_T2B_FAILOVER_ERROR_RATE", 0.5),
+            latency_threshold=env_float("VYAPAR_T2B_FAILOVER_LATENCY", 0.0),
+            latency_percentile=env_float("VYAPAR_T2B_FAILOVER_LATENCY_PERCENTILE", 0.9),
+            min_calls=env_int("VYAPAR_T2B_FAILOVER_MIN_CALLS", 5),
+            window_seconds=env_float("VYAPAR_T2B_FAILOVER_WINDOW", 60.0),
+            recovery_after=env_float("VYAPAR_T2B_FAILOVER_RECOVERY_AFTER", 30.0),
+            retries_before_failover=env_int("VYAPAR_T2B_FAILOVER_RETRIES", 1)
+        )
+
+    @property
+    def primary(self) -> ChainMember:
+        return self.members[self.order[0]]
+
+    def select(self, exclude: Optional[Set[str]] = None) -> Optional[ChainMember]:
+        """
+        Choose the provider of a call
+
+        Args:
+            Optional[exclude]: Providers that already failed the call
+
+        Returns:
+            The first healthy provider, or an unhealthy one due for its recovery probe when it
+            comes first; the first provider left when none is healthy; None when all are excluded
+        """
+        exclude = exclude or set()
+        now = time.monotonic()
+        candidates = [self.members[name] for name in self.order if name not in exclude]
+        for member in candidates:
+            if member.healthy:
+                return member
+            probe_due = now - member.unhealthy_since >= self.recovery_after
+            # A probe that never reported back (e.g. cancelled) expires after recovery_after
+            probe_free = member.probe_started_at is None or now - member.probe_started_at >= self.recovery_after
+            if probe_due and probe_free:
+                member.probe_started_at = now
+                return member
+        return candidates[0] if candidates else None
+
+    def active(self, exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """
+        Get the first healthy provider, without starting a recovery probe
+        """
+        return next(
+            (name for name in self.order if self.members[name].healthy and name not in (exclude or set())),
+            None
+        )
+
+    def has_fallback(self, member: ChainMember, exclude: Optional[Set[str]] = None) -> bool:
+        """
+        Whether a call failing on `member` could still move to another provider
+        """
+        return any(name != member.name for name in self.order if name not in (exclude or set()))
+
+    def _trim(self, member: ChainMember, now: float):
+        while member.outcomes and now - member.outcomes[0][0] > self.window_seconds:
+            member.outcomes.popleft()
+
+    def _is_degraded(self, member: ChainMember) -> Optional[str]:
+        """
+        Get why the provider's window crosses a threshold, None when it does not
+        """
+        if len(member.outcomes) < self.min_calls:
+            return None
+        error_rate = sum(1 for _, _, ok in member.outcomes if not ok) / len(member.outcomes)
+        if error_rate >= self.error_rate_threshold:
+            return f"error rate {error_rate:.0%}"
+        if self.latency_threshold > 0:
+            latencies = sorted(latency for _, latency, _ in member.outcomes)
+            latency = get_quantile(latencies, self.latency_percentile)
+            if latency >= self.latency_threshold:
+                return f"p{self.latency_percentile * 100:.0f} latency {latency:.2f}s"
+        return None
+
+    def record(self, member: ChainMember, latency: float, success: bool, error_kind: Optional[ErrorKind] = None):
+        """
+        Record the outcome of a call on a provider and update its health; non-retryable
+        errors say nothing about the provider's health and only end its recovery probe
+
+        Args:
+            member: The provider
+            latency: The seconds the provider took to answer the last attempt of the call,
+                without the backoff between retries
+            success: Whether it returned a valid response
+            Optional[error_kind]: The classification of the failure
+        """
+        now = time.monotonic()
+        if not success and error_kind == ErrorKind.NON_RETRYABLE:
+            member.probe_started_at = None
+            return
+        member.calls += 1
+        member.failures += not success
+        if member.probe_started_at is not None and not member.healthy:
+            member.probe_started_at = None
+            if success:
+                member.healthy = True
+                member.outcomes.clear()
+                member.recoveries += 1
+                Logger.info({
+                    "message": f"LLM provider {member.name} recovered",
+                    "tag": "LLMService",
+                    "data": {"provider": member.name, "probe_latency": round(latency, 3)}
+                })
+            else:
+                member.unhealthy_since = now
+            return
+
+        member.outcomes.append((now, latency, success))
+        self._trim(member, now)
+        if not member.healthy:
+            return
+        reason = self._is_degraded(member)
+        if reason is not None:
+            member.healthy = False
+            member.unhealthy_since = now
+            member.failovers += 1
+            Logger.warn({
+                "message": f"LLM provider {member.name} unhealthy ({reason}), failing over",
+                "tag": "LLMService",
+                "data": {
+                    "provider": member.name,
+                    "reason": reason,
+                    "calls_in_window": len(member.outcomes),
+                    "next_provider": self.active(exclude={member.name})
+                }
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the health and call counters of each provider
+        """
+        return {
+            "active": self.active(),
+            "call_failovers": self.call_failovers,
+            "providers": {
+                name: {
+                    "model": member.model,
+                    "healthy": member.healthy,
+                    "calls": member.calls,
+                    "failures": member.failures,
+                    "failovers": member.failovers,
+                    "recoveries": member.recoveries
+                }
+                for name, member in self.members.items()
+            }
+        }
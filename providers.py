@@ -0,0 +1,453 @@
+"""Module to call the chat models of Gemini, OpenAI and Anthropic through one provider interface"""
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+from crons.talk2bill.vyapar.env import env_float, env_int, env_str
+from logger.logger import Logger
+
+# Connections each provider client keeps to its API; calls beyond them wait for a free one
+PROVIDER_MAX_CONNECTIONS = env_int("VYAPAR_T2B_PROVIDER_MAX_CONNECTIONS", 100)
+PROVIDER_KEEPALIVE_CONNECTIONS = env_int("VYAPAR_T2B_PROVIDER_KEEPALIVE_CONNECTIONS", 20)
+PROVIDER_TIMEOUT = env_float("VYAPAR_T2B_PROVIDER_TIMEOUT", 30.0)
+
+SHARED_PROVIDERS: Dict[str, "ChatProvider"] = {}
+
+
+class ChatProvider(ABC):
+    """
+    A chat model provider: text completions of a prompt by one of its models
+
+    The SDK client is built on the first call and reused by every later one, so calls share
+    its HTTP connection pool instead of opening a connection each. Building it imports the
+    SDK, so importing this module needs none of them.
+    """
+    name = "provider"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 500,
+        max_connections: int = PROVIDER_MAX_CONNECTIONS,
+        timeout: float = PROVIDER_TIMEOUT
+    ):
+        """
+        Args:
+            api_key: The API key of the provider
+            model: The model of calls that do not name one
+            temperature: The default sampling temperature
+            max_tokens: The default bound on the reply tokens
+            max_connections: The size of the connection pool of the client
+            timeout: The HTTP timeout of a call in seconds
+        """
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self.clients_created = 0
+        self.calls = 0
+        self.failures = 0
+        self.total_latency = 0.0
+
+    @abstractmethod
+    def _create_client(self) -> Any:
+        """
+        Build the SDK client of the provider, once per provider (see get_client)
+        """
+
+    @abstractmethod
+    async def _complete(self, client: Any, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        """
+        Get the text reply of the model to a single user message
+        """
+
+    @abstractmethod
+    async def _complete_structured(
+        self,
+        client: Any,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        """
+        Get the reply of the model constrained to a JSON schema
+
+        Returns:
+            The parsed reply, the token usage and the raw reply text
+        """
+
+    def _http_client(self) -> Any:
+        """
+        Build the pooled HTTP client handed to the SDK client
+        """
+        import httpx
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=min(PROVIDER_KEEPALIVE_CONNECTIONS, self.max_connections)
+            ),
+            timeout=self.timeout
+        )
+
+    def get_client(self) -> Any:
+        """
+        Get the client of the provider, building it on the first call
+        """
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError(f"The {self.name} API key is not configured")
+            self._client = self._create_client()
+            self.clients_created += 1
+        return self._client
+
+    async def complete(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Get the text reply of a model to a single user message
+
+        Args:
+            prompt: The user message
+            Optional[model]: The model, else the provider's default
+            Optional[temperature]: The sampling temperature, else the provider's default
+            Optional[max_tokens]: The bound on the reply tokens, else the provider's default
+
+        Returns:
+            The text of the reply
+        """
+        model = model or self.model
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            return await self._complete(
+                self.get_client(),
+                prompt,
+                model,
+                self.temperature if temperature is None else temperature,
+                max_tokens or self.max_tokens
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.total_latency += time.perf_counter() - start
+
+    async def complete_structured(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        """
+        Get the reply of a model to a single user message as an object of a JSON schema, with
+        the provider's own structured-output mechanism
+
+        Args:
+            prompt: The user message
+            schema: The JSON schema of the reply (a response model's `get_output_schema`)
+            Optional[model]: The model, else the provider's default
+            Optional[temperature]: The sampling temperature, else the provider's default
+            Optional[max_tokens]: The bound on the reply tokens, else the provider's default
+
+        Returns:
+            The parsed object, the {"input_tokens", "output_tokens"} usage when reported, and
+            the raw reply text
+        """
+        model = model or self.model
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            return await self._complete_structured(
+                self.get_client(),
+                prompt,
+                schema,
+                model,
+                self.temperature if temperature is None else temperature,
+                max_tokens or self.max_tokens
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.total_latency += time.perf_counter() - start
+
+    async def aclose(self):
+        """
+        Close the client and its connections
+        """
+        if self._client is not None and hasattr(self._client, "close"):
+            await self._client.close()
+        self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the call counters of the provider
+        """
+        return {
+            "provider": self.name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "clients_created": self.clients_created,
+            "mean_latency": round(self.total_latency / self.calls, 4) if self.calls else 0.0
+        }
+
+
+class OpenAIProvider(ChatProvider):
+    """
+    OpenAI chat completions on one AsyncOpenAI client
+    """
+    name = "openai"
+
+    def _create_client(self) -> Any:
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self.api_key, http_client=self._http_client())
+
+    async def _complete(self, client: Any, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content or ""
+
+    async def _complete_structured(
+        self,
+        client: Any,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        # JSON schema response format; not strict, the response models have optional fields
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name(schema), "schema": schema, "strict": False}
+            }
+        )
+        content = response.choices[0].message.content or ""
+        usage = None
+        if response.usage is not None:
+            usage = {"input_tokens": response.usage.prompt_tokens, "output_tokens": response.usage.completion_tokens}
+        return json.loads(content), usage, content
+
+
+class AnthropicProvider(ChatProvider):
+    """
+    Anthropic messages on one AsyncAnthropic client
+    """
+    name = "anthropic"
+
+    def _create_client(self) -> Any:
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key=self.api_key, http_client=self._http_client())
+
+    async def _complete(self, client: Any, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        response = await client.messages.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return "".join(block.text for block in response.content if getattr(block, "type", None) == "text")
+
+    async def _complete_structured(
+        self,
+        client: Any,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        # A single tool whose input is the response, and the model is made to call it
+        name = schema_name(schema)
+        response = await client.messages.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            tools=[{"name": name, "description": f"Record the {name} response", "input_schema": schema}],
+            tool_choice={"type": "tool", "name": name}
+        )
+        parsed = next(
+            (block.input for block in response.content if getattr(block, "type", None) == "tool_use"),
+            None
+        )
+        if parsed is None:
+            raise ValueError(f"Anthropic returned no {name} tool call")
+        usage = {"input_tokens": response.usage.input_tokens, "output_tokens": response.usage.output_tokens}
+        return parsed, usage, json.dumps(parsed)
+
+
+class GeminiProvider(ChatProvider):
+    """
+    Gemini through langchain's ChatGoogleGenerativeAI, like LLMService; one chat model per
+    (model, temperature, max tokens), each reusing its Google client
+    """
+    name = "gemini"
+
+    def _create_client(self) -> Dict[Tuple[str, float, int], Any]:
+        return {}
+
+    def _get_llm(self, client: Dict[Tuple[str, float, int], Any], model: str, temperature: float, max_tokens: int) -> Any:
+        key = (model, temperature, max_tokens)
+        llm = client.get(key)
+        if llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            llm = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                max_output_tokens=max_tokens,
+                api_key=self.api_key
+            )
+            client[key] = llm
+        return llm
+
+    async def _complete(self, client: Any, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        response = await self._get_llm(client, model, temperature, max_tokens).ainvoke(prompt)
+        return response.content if isinstance(response.content, str) else str(response.content)
+
+    async def _complete_structured(
+        self,
+        client: Any,
+        prompt: str,
+        schema: Dict[str, Any],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[Any, Optional[Dict[str, int]], str]:
+        # Gemini's JSON schema response mode, through langchain as in LLMService
+        llm = self._get_llm(client, model, temperature, max_tokens)
+        result = await llm.with_structured_output(schema, method="json_schema", include_raw=True).ainvoke(prompt)
+        if result.get("parsing_error") is not None:
+            raise result["parsing_error"]
+        raw = result.get("raw")
+        usage = getattr(raw, "usage_metadata", None)
+        return result.get("parsed"), usage, str(getattr(raw, "content", ""))
+
+    async def aclose(self):
+        self._client = None
+
+
+def schema_name(schema: Dict[str, Any]) -> str:
+    """
+    Get the name of a JSON schema usable as a tool or response format name ("ExpenseModel")
+    """
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", schema.get("title") or "response")[:64]
+
+
+def provider_name_for_model(model: str) -> str:
+    """
+    Get the provider serving a model from its name ("gpt-4o-mini" -> "openai")
+
+    Raises:
+        ValueError: The model belongs to no known provider
+    """
+    name = model.lower()
+    if name.startswith(("gpt", "o1", "o3", "o4", "chatgpt")):
+        return "openai"
+    if name.startswith("claude"):
+        return "anthropic"
+    if name.startswith("gemini"):
+        return "gemini"
+    raise ValueError(f"Unknown model: {model}")
+
+
+def build_provider(name: str) -> ChatProvider:
+    """
+    Build a provider from its VYAPAR_T2B_* settings
+
+    Args:
+        name: "gemini", "openai" or "anthropic"
+
+    Returns:
+        The provider, its client not built yet
+    """
+    if name == "openai":
+        return OpenAIProvider(
+            api_key=env_str("VYAPAR_T2B_OPENAI_API_KEY"),
+            model=env_str("VYAPAR_T2B_OPENAI_MODEL", "gpt-4o-mini")
+        )
+    if name == "anthropic":
+        return AnthropicProvider(
+            api_key=env_str("VYAPAR_T2B_ANTHROPIC_API_KEY"),
+            model=env_str("VYAPAR_T2B_ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+        )
+    if name == "gemini":
+        return GeminiProvider(
+            api_key=env_str("VYAPAR_T2B_API_KEY"),
+            model=env_str("VYAPAR_T2B_GEMINI_MODEL", "gemini-2.0-flash"),
+            temperature=0.0
+        )
+    raise ValueError(f"Unknown provider: {name}")
+
+
+def get_provider(name: str) -> ChatProvider:
+    """
+    Get the process-wide provider of a name, shared by every caller
+    """
+    provider = SHARED_PROVIDERS.get(name)
+    if provider is None:
+        provider = build_provider(name)
+        SHARED_PROVIDERS[name] = provider
+        Logger.info({
+            "message": "Chat provider created",
+            "tag": "LLMService",
+            "data": {
+                "provider": name,
+                "model": provider.model,
+                "max_connections": provider.max_connections
+            }
+        })
+    return provider
+
+
+def get_provider_for_model(model: str) -> ChatProvider:
+    """
+    Get the shared provider serving a model
+    """
+    return get_provider(provider_name_for_model(model))
+
+
+def register_provider(provider: ChatProvider, name: Optional[str] = None):
+    """
+    Install a provider as the shared one of its name, e.g. a fake one for offline runs
+    """
+    SHARED_PROVIDERS[name or provider.name] = provider
+
+
+async def close_providers():
+    """
+    Close the clients of every shared provider
+    """
+    for provider in list(SHARED_PROVIDERS.values()):
+        await provider.aclose()
+    SHARED_PROVIDERS.clear()
+
+
+def get_provider_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the call counters of the shared providers
+    """
+    return {name: provider.stats() for name, provider in SHARED_PROVIDERS.items()}
@@ -0,0 +1,256 @@
+"""Module to keep LLM calls of the talk2bill pipeline within the requests/tokens per minute quota"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+from crons.talk2bill.vyapar.env import env_int, env_str
+from crons.talk2bill.vyapar.instrumentation import get_quantile
+from logger.logger import Logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+SHARED_RATE_LIMITER = None
+
+
+class LocalBucketStore:
+    """
+    Requests and tokens buckets held in the memory of this process
+    """
+    blocking = False
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def try_consume(self, tokens: int) -> float:
+        """
+        Take one request and `tokens` tokens if both buckets have capacity
+
+        Args:
+            tokens: The estimated tokens of the request
+
+        Returns:
+            0 if the capacity was taken, else the seconds to wait before trying again
+        """
+        self._refill(time.monotonic())
+        return consume(self, tokens)
+
+
+class FileBucketStore:
+    """
+    Requests and tokens buckets persisted in a file and guarded by an exclusive lock,
+    so every worker process on the host draws from the same quota
+
+    `try_consume` blocks on the lock and the file, RateLimiter runs it in a thread.
+    """
+    blocking = True
+
+    def __init__(self, path: str, rpm: int, tpm: int):
+        if fcntl is None:
+            raise RuntimeError("File based rate limiting needs fcntl (POSIX only)")
+        self.path = path
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+
+    def try_consume(self, tokens: int) -> float:
+        """
+        Take one request and `tokens` tokens from the shared buckets if they have capacity
+
+        Args:
+            tokens: The estimated tokens of the request
+
+        Returns:
+            0 if the capacity was taken, else the seconds to wait before trying again
+        """
+        with open(self.path, "a+", encoding="utf-8") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                raw_state = state_file.read()
+                # Wall clock: monotonic clocks are not comparable across processes
+                now = time.time()
+                state = json.loads(raw_state) if raw_state else {}
+                elapsed = max(0.0, now - state.get("updated_at", now))
+                self.requests = min(self.rpm, state.get("requests", self.rpm) + elapsed * self.rpm / 60)
+                self.tokens = min(self.tpm, state.get("tokens", self.tpm) + elapsed * self.tpm / 60)
+
+                wait = consume(self, tokens)
+
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps({
+                    "requests": self.requests,
+                    "tokens": self.tokens,
+                    "updated_at": now
+                }))
+                state_file.flush()
+                return wait
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+
+def consume(store, tokens: int) -> float:
+    """
+    Take capacity from refilled buckets, or compute how long until there is enough
+
+    Args:
+        store: A bucket store with rpm, tpm, requests and tokens
+        tokens: The estimated tokens of the request
+
+    Returns:
+        0 if the capacity was taken, else the seconds to wait
+    """
+    # A request larger than the whole TPM budget would wait forever, cap it to the budget
+    tokens = min(tokens, store.tpm) if store.tpm else 0
+    wait = 0.0
+    if store.rpm and store.requests < 1:
+        wait = max(wait, (1 - store.requests) * 60 / store.rpm)
+    if store.tpm and store.tokens < tokens:
+        wait = max(wait, (tokens - store.tokens) * 60 / store.tpm)
+    if wait > 0:
+        return wait
+    if store.rpm:
+        store.requests -= 1
+    if store.tpm:
+        store.tokens -= tokens
+    return 0.0
+
+
+class RateLimiter:
+    """
+    Client-side token-bucket limiter on requests per minute and tokens per minute
+
+    Callers wait in FIFO order for capacity instead of sending requests that would be
+    answered with a 429. A budget of 0 disables that bucket.
+    """
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        shared_file: Optional[str] = None,
+        max_wait_samples: int = 1000
+    ):
+        self.enabled = bool(rpm or tpm)
+        if shared_file:
+            self.store = FileBucketStore(shared_file, rpm, tpm)
+        else:
+            self.store = LocalBucketStore(rpm, tpm)
+        self._lock = asyncio.Lock()
+        self._wait_samples: Deque[float] = deque(maxlen=max_wait_samples)
+        self.acquired = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """
+        Build the limiter from VYAPAR_T2B_LLM_RPM, VYAPAR_T2B_LLM_TPM and VYAPAR_T2B_RATE_LIMIT_FILE
+        """
+        return cls(
+            rpm=env_int("VYAPAR_T2B_LLM_RPM", 0),
+            tpm=env_int("VYAPAR_T2B_LLM_TPM", 0),
+            shared_file=env_str("VYAPAR_T2B_RATE_LIMIT_FILE")
+        )
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Wait until there is capacity for one request of `tokens` tokens and take it
+
+        Args:
+            tokens: The estimated input and output tokens of the request
+
+        Returns:
+            The seconds spent waiting in the queue
+        """
+        if not self.enabled:
+            return 0.0
+
+        start_time = time.monotonic()
+        self.waiting += 1
+        try:
+            # One waiter at a time, so a large request is not starved by smaller ones
+            async with self._lock:
+                while True:
+                    if self.store.blocking:
+                        # flock and the file I/O would stall every coroutine of the loop
+                        wait = await asyncio.to_thread(self.store.try_consume, tokens)
+                    else:
+                        wait = self.store.try_consume(tokens)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start_time
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self._wait_samples.append(waited)
+        if waited > 1:
+            Logger.info({
+                "message": "LLM call waited for rate limit capacity",
+                "tag": "LLMService",
+                "data": {
+                    "waited": round(waited, 3),
+                    "tokens": tokens,
+                    "waiting": self.waiting
+                }
+            })
+        return waited
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Get the queue wait metrics of the limiter
+
+        Returns:
+            Acquisitions, current waiters and mean/p95/max queue wait in seconds
+        """
+        samples = sorted(self._wait_samples)
+        return {
+            "acquired": self.acquired,
+            "waiting": self.waiting,
+            "mean_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "p95_wait": get_quantile(samples, 0.95),
+            "max_wait": self.max_wait
+        }
+
+
+def get_shared_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide rate limiter shared by every LLMService call
+    """
+    global SHARED_RATE_LIMITER
+    if SHARED_RATE_LIMITER is None:
+        SHARED_RATE_LIMITER = RateLimiter.from_env()
+        if SHARED_RATE_LIMITER.enabled:
+            Logger.info({
+                "message": "LLM rate limiter enabled",
+                "tag": "LLMService",
+                "data": {
+                    "rpm": SHARED_RATE_LIMITER.store.rpm,
+                    "tpm": SHARED_RATE_LIMITER.store.tpm,
+                    "shared_file": env_str("VYAPAR_T2B_RATE_LIMIT_FILE"),
+                    "pid": os.getpid()
+                }
+            })
+    return SHARED_RATE_LIMITER
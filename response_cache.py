@@ -0,0 +1,230 @@
+"""Module to cache LLM responses of identical prompts for the talk2bill pipeline"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Type
+from pydantic import BaseModel
+from logger.logger import Logger
+
+
+class InMemoryResponseStore:
+    """
+    Bounded LRU of serialized responses with per-entry expiry
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a live entry and mark it as recently used
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(self, key: str, payload: str, expires_at: float):
+        """
+        Store an entry, evicting the least recently used ones beyond `max_entries`
+        """
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteResponseStore:
+    """
+    On-disk store of serialized responses that survives restarts
+    """
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a live entry and refresh its last access time
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Get the payload and expiry time of a live entry and refresh its last access time
+        """
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT payload, expires_at FROM llm_responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                connection.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            connection.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def set(self, key: str, payload: str, expires_at: float):
+        """
+        Store an entry; every 100 writes expired and least recently used entries are pruned
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, payload, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                connection.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,))
+                connection.execute(
+                    "DELETE FROM llm_responses WHERE key IN (SELECT key FROM llm_responses "
+                    "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+
+class ResponseCache:
+    """
+    Cache of structured LLM responses keyed on the rendered prompt, the response schema and
+    the model
+
+    The LLM runs at temperature 0.0, so an identical prompt and schema yields the same
+    answer. Responses are kept as their JSON serialization, not as live pydantic objects,
+    in a bounded LRU with TTL and optionally in SQLite.
+    """
+    def __init__(
+        self,
+        model: str,
+        ttl_seconds: int = 3600,
+        max_entries: int = 1024,
+        sqlite_path: Optional[str] = None
+    ):
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.memory = InMemoryResponseStore(max_entries)
+        self.disk = SqliteResponseStore(sqlite_path) if sqlite_path else None
+        self._schema_hashes: Dict[Type[BaseModel], str] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def make_key(self, prompt: str, response_format: Type[BaseModel], model: Optional[str] = None) -> str:
+        """
+        Hash the prompt, the response schema and the model (default: the cache's) into a cache key
+        """
+        schema_hash = self._schema_hashes.get(response_format)
+        if schema_hash is None:
+            schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+            schema_hash = hashlib.sha256(schema.encode("utf-8")).hexdigest()
+            self._schema_hashes[response_format] = schema_hash
+        digest = hashlib.sha256()
+        for part in (model or self.model, schema_hash, str(prompt)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(
+        self,
+        prompt: str,
+        response_format: Type[BaseModel],
+        model: Optional[str] = None
+    ) -> Optional[BaseModel]:
+        """
+        Get the cached response of a prompt
+
+        Args:
+            prompt: The rendered prompt
+            response_format: The response model
+            Optional[model]: The model that answers the prompt, when not the cache's default
+
+        Returns:
+            A fresh response model instance, or None on a miss
+        """
+        key = self.make_key(prompt, response_format, model)
+        payload = self.memory.get(key)
+        if payload is None and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get_entry, key)
+            if entry is not None:
+                payload, expires_at = entry
+                self.disk_hits += 1
+                # Keep the stored expiry, so a disk hit does not extend the entry's life
+                self.memory.set(key, payload, expires_at)
+
+        if payload is None:
+            self.misses += 1
+            return None
+        try:
+            response = response_format.model_validate_json(payload)
+        except Exception as e:  # pylint: disable=broad-except
+            # Schema changed under an old entry: treat as a miss
+            Logger.warn({
+                "message": "Discarding unreadable cached LLM response",
+                "tag": "LLMService",
+                "data": {"error": str(e)}
+            })
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    async def set(
+        self,
+        prompt: str,
+        response_format: Type[BaseModel],
+        response: BaseModel,
+        model: Optional[str] = None
+    ):
+        """
+        Cache the response of a prompt
+
+        Args:
+            prompt: The rendered prompt
+            response_format: The response model
+            response: The validated response
+            Optional[model]: The model that answered the prompt, when not the cache's default
+        """
+        key = self.make_key(prompt, response_format, model)
+        payload = response.model_dump_json()
+        expires_at = time.time() + self.ttl_seconds
+        self.memory.set(key, payload, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, payload, expires_at)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the hit/miss counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
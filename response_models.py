@@ -0,0 +1,119 @@
+"""Response models for the talk2bill pipeline modes built on top of the core models"""
+import copy
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Type
+from pydantic import BaseModel, Field
+from constants.talk2bill.vyapar.models import ExpenseModel, ConversationStatus, PipelineResponse
+
+
+class UnifiedExpenseResponse(BaseModel):
+    """
+    Combined response of the single-call (unified) mode: intent, merged invoice and question
+    """
+    intent: Literal["expense", "other"] = "other"
+    invoice: ExpenseModel = Field(default_factory=ExpenseModel)
+    question: str = ""
+    status: ConversationStatus = ConversationStatus.CONTINUE
+
+
+class ItemDelta(BaseModel):
+    """
+    A change the user input makes to one invoice item; `index` is the item's position in
+    the current invoice for updates and removals
+    """
+    op: Literal["add", "update", "remove"] = "add"
+    index: Optional[int] = None
+    item_name: Optional[str] = None
+    item_amount: Optional[float] = None
+    item_qty: Optional[float] = None
+
+
+class ExpenseDeltaResponse(BaseModel):
+    """
+    Response of the delta extraction mode: only the changes to the current invoice, merged
+    locally by invoice_merge. None fields leave the invoice unchanged.
+    """
+    items: List[ItemDelta] = Field(default_factory=list)
+    expense_category: Optional[str] = None
+    category_explicit: bool = False
+    payment_type: Optional[str] = None
+
+
+class IntentBatchItem(BaseModel):
+    """
+    Intent of one request of a batched intent classification call
+    """
+    id: int
+    intent: Literal["expense", "other"] = "other"
+
+
+class IntentBatchResponse(BaseModel):
+    """
+    Response of a batched intent classification call, one result per request id
+    """
+    results: List[IntentBatchItem] = Field(default_factory=list)
+
+
+class QuestionStreamChunk(BaseModel):
+    """
+    A piece of a streamed question: text deltas first, then a final chunk with the full
+    question and the status
+    """
+    delta: str = ""
+    final: bool = False
+    question: str = ""
+    status: Optional[ConversationStatus] = None
+
+
+class PipelineStreamChunk(BaseModel):
+    """
+    A piece of a streamed pipeline turn: question text deltas, then a final chunk carrying
+    the pipeline response once the job has been updated
+    """
+    delta: str = ""
+    final: bool = False
+    response: Optional[PipelineResponse] = None
+
+
+def inline_refs(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve the local `$ref`s of a JSON schema into copies of their `$defs`, so the schema
+    does not depend on how a provider's converter handles references
+
+    Args:
+        schema: A JSON schema, e.g. a response model's `model_json_schema()`
+
+    Returns:
+        The schema without `$defs` and `$ref`, or the schema unchanged when it is recursive
+    """
+    definitions = schema.get("$defs", {})
+
+    def resolve(node: Any, seen: tuple) -> Any:
+        if isinstance(node, list):
+            return [resolve(value, seen) for value in node]
+        if not isinstance(node, dict):
+            return node
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/$defs/"):
+            name = ref[len("#/$defs/"):]
+            if name in seen:
+                raise RecursionError(name)
+            # Keys next to the $ref (e.g. a description) override the definition's
+            siblings = {key: value for key, value in node.items() if key != "$ref"}
+            return resolve({**copy.deepcopy(definitions[name]), **siblings}, seen + (name,))
+        return {key: resolve(value, seen) for key, value in node.items() if key != "$defs"}
+
+    try:
+        return resolve(schema, ())
+    except RecursionError:
+        return schema
+
+
+@lru_cache(maxsize=None)
+def get_output_schema(response_format: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Get the self-contained JSON schema the structured-output runnables of a response model
+    are built with; callers must not mutate it
+    """
+    return inline_refs(response_format.model_json_schema())
+
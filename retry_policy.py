@@ -0,0 +1,312 @@
+"""Module to decide how LLM calls of the talk2bill pipeline are retried"""
+import random
+import re
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Optional, Tuple
+from crons.talk2bill.vyapar.env import env_float, env_int
+from logger.logger import Logger
+
+SHARED_CIRCUIT_BREAKER = None
+
+
+class ErrorKind(str, Enum):
+    """
+    Classification of an LLM call failure
+    """
+    # Quota / 429: retry, honoring the server's retry-after hint
+    RATE_LIMITED = "rate_limited"
+    # Timeouts, 5xx, dropped connections: retry with backoff
+    TRANSIENT = "transient"
+    # Bad schema, invalid key, invalid request: retrying cannot help
+    NON_RETRYABLE = "non_retryable"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the LLM while the circuit breaker is open
+    """
+    def __init__(self, retry_in: float):
+        super().__init__(f"LLM circuit breaker is open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+# Matched against the exception class and its bases, so google.api_core / httpx / pydantic
+# do not need to be imported here
+RATE_LIMITED_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+TRANSIENT_ERROR_NAMES = {
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+    "TimeoutError", "TimeoutException", "ConnectionError", "ConnectError", "ReadTimeout",
+    "APITimeoutError", "APIConnectionError"
+}
+NON_RETRYABLE_ERROR_NAMES = {
+    "InvalidArgument", "PermissionDenied", "Unauthenticated", "NotFound", "BadRequest",
+    "ValidationError", "OutputParserException", "JSONDecodeError", "AuthenticationError",
+    "CircuitOpenError", "TurnBudgetExceeded"
+}
+RATE_LIMITED_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit")
+NON_RETRYABLE_MARKERS = (
+    "api key not valid", "api_key_invalid", "permission denied", "unauthenticated",
+    "invalid argument", "invalid_argument", "invalid json schema", "400 "
+)
+RETRY_AFTER_PATTERN = re.compile(
+    r"(?:retry[_ ]?delay\W+|retry in |retry after |retry-after\W+)(\d+(?:\.\d+)?)\s*s?",
+    re.IGNORECASE
+)
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """
+    Classify an LLM call failure by exception type first, then by message
+
+    Args:
+        error: The exception raised by the call
+
+    Returns:
+        The error kind
+    """
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & RATE_LIMITED_ERROR_NAMES:
+        return ErrorKind.RATE_LIMITED
+    if names & NON_RETRYABLE_ERROR_NAMES:
+        return ErrorKind.NON_RETRYABLE
+    if names & TRANSIENT_ERROR_NAMES:
+        return ErrorKind.TRANSIENT
+
+    message = str(error).lower()
+    if any(marker in message for marker in RATE_LIMITED_MARKERS):
+        return ErrorKind.RATE_LIMITED
+    if any(marker in message for marker in NON_RETRYABLE_MARKERS):
+        return ErrorKind.NON_RETRYABLE
+    return ErrorKind.TRANSIENT
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """
+    Get the server's retry-after hint from an exception, if it carries one
+
+    Looks at a `retry_after` attribute, a `Retry-After` response header and the
+    `retryDelay` / "retry in Ns" text Gemini puts in quota errors.
+
+    Args:
+        error: The exception raised by the call
+
+    Returns:
+        The number of seconds to wait, or None
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+
+    match = RETRY_AFTER_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, honoring retry-after hints
+
+    Full jitter spreads the retries of coroutines that failed together, so a 429 storm is
+    not replayed in lockstep.
+    """
+    def __init__(
+        self,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0
+    ):
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """
+        Build the policy from VYAPAR_T2B_RETRY_* settings
+        """
+        return cls(
+            max_delay=env_float("VYAPAR_T2B_RETRY_MAX_DELAY", 30.0),
+            multiplier=env_float("VYAPAR_T2B_RETRY_MULTIPLIER", 2.0)
+        )
+
+    def get_delay(
+        self,
+        attempt: int,
+        error: BaseException,
+        base_delay: float = 1.0
+    ) -> float:
+        """
+        Get the delay before retrying a failed attempt
+
+        Args:
+            attempt: The zero-based index of the attempt that failed
+            error: The exception raised by the attempt
+            base_delay: The delay of the first retry before jitter
+
+        Returns:
+            The number of seconds to sleep
+        """
+        backoff = min(self.max_delay, base_delay * (self.multiplier ** attempt))
+        delay = random.uniform(0, backoff)
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            # Never retry before the server asked us to, jitter on top to desync callers
+            delay = retry_after + random.uniform(0, base_delay)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by every in-flight LLM call
+
+    Closed: calls go through and outcomes are recorded over a sliding window.
+    Open: once the error rate of the window crosses the threshold, calls fail fast with
+    CircuitOpenError for `open_duration` seconds.
+    Half-open: after that a single probe call is let through; its outcome closes or re-opens
+    the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        error_rate_threshold: float = 0.5,
+        min_calls: int = 10,
+        window_seconds: float = 30.0,
+        open_duration: float = 15.0
+    ):
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_duration = open_duration
+        self.state = self.CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """
+        Build the breaker from VYAPAR_T2B_BREAKER_* settings
+        """
+        return cls(
+            error_rate_threshold=env_float("VYAPAR_T2B_BREAKER_ERROR_RATE", 0.5),
+            min_calls=env_int("VYAPAR_T2B_BREAKER_MIN_CALLS", 10),
+            window_seconds=env_float("VYAPAR_T2B_BREAKER_WINDOW", 30.0),
+            open_duration=env_float("VYAPAR_T2B_BREAKER_OPEN_DURATION", 15.0)
+        )
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def error_rate(self) -> float:
+        """
+        Get the error rate over the sliding window
+        """
+        self._trim(time.monotonic())
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def before_call(self):
+        """
+        Check that a call may go through
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe in flight
+        """
+        if self.state == self.OPEN:
+            retry_in = self._opened_at + self.open_duration - time.monotonic()
+            if retry_in > 0:
+                raise CircuitOpenError(retry_in)
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            now = time.monotonic()
+            # A probe that never reported back (e.g. cancelled) expires after open_duration
+            if self._probe_in_flight and now - self._probe_started_at < self.open_duration:
+                raise CircuitOpenError(self.open_duration)
+            self._probe_in_flight = True
+            self._probe_started_at = now
+
+    def record_success(self):
+        """
+        Record a successful call
+        """
+        if self.state == self.HALF_OPEN:
+            self._close()
+        self._record(True)
+
+    def record_failure(self, error_kind: ErrorKind):
+        """
+        Record a failed call; non-retryable errors say nothing about the API's health
+
+        Args:
+            error_kind: The classification of the failure
+        """
+        if error_kind == ErrorKind.NON_RETRYABLE:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+            return
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._record(False)
+        if (
+            self.state == self.CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and self.error_rate() >= self.error_rate_threshold
+        ):
+            self._open()
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        self._trim(now)
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        Logger.warn({
+            "message": "LLM circuit breaker opened",
+            "tag": "LLMService",
+            "data": {
+                "error_rate": round(self.error_rate(), 3),
+                "calls_in_window": len(self._outcomes),
+                "open_duration": self.open_duration
+            }
+        })
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._probe_in_flight = False
+        Logger.info({
+            "message": "LLM circuit breaker closed",
+            "tag": "LLMService",
+            "data": {}
+        })
+
+
+def get_shared_circuit_breaker() -> CircuitBreaker:
+    """
+    Get the process-wide circuit breaker shared by every LLMService call
+    """
+    global SHARED_CIRCUIT_BREAKER
+    if SHARED_CIRCUIT_BREAKER is None:
+        SHARED_CIRCUIT_BREAKER = CircuitBreaker.from_env()
+    return SHARED_CIRCUIT_BREAKER
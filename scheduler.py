@@ -1,15 +1,23 @@
 """Module to schedule the talk2bill pipeline"""
 import threading
 import asyncio
+import signal
 import time
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
-from db.mongo.vyapar.talk2bill_repository import Talk2BillRepository
 from logger.logger import Logger
 from .talk2bill_pipeline import Talk2BillPipeline
+from .worker_pool import Talk2BillWorkerPool
+from .env import env_int, env_float
+from .instrumentation import get_instrumentation
 from models.talk2bill.vyapar import Talk2BillModel
 load_dotenv()
 
 TALK2BILL_PIPELINE = None
+# Maximum number of documents processed (and so LLM sessions in flight) at the same time
+WORKER_CONCURRENCY = env_int("VYAPAR_T2B_WORKER_CONCURRENCY", 8)
+# Seconds the long-running worker waits before polling again when there are no jobs
+WORKER_POLL_INTERVAL = env_float("VYAPAR_T2B_WORKER_POLL_INTERVAL", 2.0)
 
 async def process_document(document: Talk2BillModel):
     """
@@ -59,20 +67,109 @@ async def main():
             "start_time": start_time
         }
     })
-    results = []
+    pool = Talk2BillWorkerPool(process_document, concurrency=WORKER_CONCURRENCY)
     try:
         if TALK2BILL_PIPELINE is None:
             TALK2BILL_PIPELINE = await Talk2BillPipeline.get_instance()
 
-        docs = await Talk2BillRepository.get_batch_of_jobs()
-
-        results = await asyncio.gather(*[process_document(document) for document in docs])
+        await pool.run(once=True)
 
     finally:
+        if TALK2BILL_PIPELINE is not None:
+            # No buffered job update may outlive the batch
+            await TALK2BILL_PIPELINE.flush_job_updates()
+        instrumentation = get_instrumentation()
+        instrumentation.flush()
         Logger.info({
             "message": "Invoice Generation batch completed",
             "tag": "VyaparTalk2Bill",
             "data": {
-                "docs_processed": len(results),
+                "docs_processed": pool.docs_processed,
+                "docs_failed": pool.docs_failed,
+                "concurrency": WORKER_CONCURRENCY,
+                "latency": instrumentation.summary(),
+                **get_component_stats()
+            }
+        })
+
+
+# Logged name -> path from the pipeline of each component reporting its counters with
+# stats() or metrics(); a disabled component (a None attribute) is logged as None
+COMPONENT_STATS = {
+    "routing": "llm_service.router",
+    "intent_batching": "llm_service.intent_batcher",
+    "hedging": "llm_service.hedger",
+    "categorizer": "llm_service.categorizer",
+    "hint_parser": "llm_service.hint_parser",
+    "provider_chain": "llm_service.provider_chain",
+    "response_cache": "llm_service.response_cache",
+    "context_cache": "llm_service.context_cache",
+    "rate_limiter": "llm_service.rate_limiter",
+    "fast_path": "fast_path",
+    "session_cache": "session_cache",
+    "job_writer": "job_writer"
+}
+
+
+def get_component_stats() -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Get the counters of every pipeline component listed in COMPONENT_STATS
+    """
+    stats = {}
+    for name, path in COMPONENT_STATS.items():
+        component = TALK2BILL_PIPELINE
+        for attribute in path.split("."):
+            component = getattr(component, attribute, None)
+        report = getattr(component, "stats", None) or getattr(component, "metrics", None)
+        stats[name] = report() if report is not None else None
+    return stats
+
+
+async def run_worker():
+    """
+    Long-running worker mode: continuously claim and process jobs with bounded concurrency.
+    SIGTERM/SIGINT stop claiming new jobs and drain the ones already claimed before exiting.
+    """
+    global TALK2BILL_PIPELINE
+    if TALK2BILL_PIPELINE is None:
+        TALK2BILL_PIPELINE = await Talk2BillPipeline.get_instance()
+
+    pool = Talk2BillWorkerPool(
+        process_document,
+        concurrency=WORKER_CONCURRENCY,
+        poll_interval=WORKER_POLL_INTERVAL
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, pool.stop)
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers are unavailable outside the main thread / on Windows
+            pass
+
+    Logger.info({
+        "message": "Starting Invoice Generation worker",
+        "tag": "VyaparTalk2Bill",
+        "data": {
+            "thread_id": threading.get_ident(),
+            "concurrency": WORKER_CONCURRENCY,
+            "poll_interval": WORKER_POLL_INTERVAL
+        }
+    })
+    try:
+        await pool.run()
+    finally:
+        await TALK2BILL_PIPELINE.flush_job_updates()
+        instrumentation = get_instrumentation()
+        instrumentation.flush()
+        Logger.info({
+            "message": "Invoice Generation worker stopped",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "docs_claimed": pool.docs_claimed,
+                "docs_processed": pool.docs_processed,
+                "docs_failed": pool.docs_failed,
+                "latency": instrumentation.summary(),
+                **get_component_stats()
             }
         })
@@ -0,0 +1,198 @@
+"""Module to keep the conversation state of active talk2bill sessions in memory"""
+import copy
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from crons.talk2bill.vyapar.env import env_int
+from logger.logger import Logger
+
+SESSION_STATE_CACHE = None
+
+
+@dataclass
+class SessionState:
+    """
+    The history window and current invoice of a session
+    """
+    history: Deque[Dict[str, str]]
+    invoice: Dict[str, Any]
+    touched_at: float = field(default_factory=time.monotonic)
+
+
+def sort_chronologically(documents: List[Dict]) -> List[Dict]:
+    """
+    Order processed job documents oldest first by updatedAt, whatever order the query
+    returned them in; the query order is kept when a document has no comparable updatedAt
+
+    Args:
+        documents: The processed job documents of a session
+
+    Returns:
+        The documents, oldest first
+    """
+    if not all(isinstance(doc.get("updatedAt"), datetime) for doc in documents):
+        return list(documents)
+    try:
+        return sorted(documents, key=lambda doc: doc["updatedAt"])
+    except TypeError:
+        # Mixed naive/aware datetimes, keep the query order
+        return list(documents)
+
+
+def get_document_history(documents: List[Dict]) -> List[Dict[str, str]]:
+    """
+    Build the history entries of processed job documents, oldest first
+    """
+    return [
+        {"user": doc.get("transcription", ""), "model": doc.get("modelQuestion", "")}
+        for doc in sort_chronologically(documents)
+    ]
+
+
+def get_newest_invoice(documents: List[Dict]) -> Dict[str, Any]:
+    """
+    Get the invoice of the most recently updated processed job document
+
+    Args:
+        documents: The processed job documents of a session
+
+    Returns:
+        The invoice, or an empty dict when the session has none
+    """
+    if not documents:
+        return {}
+    return sort_chronologically(documents)[-1].get("invoice") or {}
+
+
+class SessionStateCache:
+    """
+    LRU of session states keyed by sessionId, with idle expiry
+
+    A turn that hits the cache needs no Mongo read: the state is updated in place once the
+    turn's `update_job` succeeded; a failed turn invalidates its session.
+
+    Nothing invalidates the cache across processes: a turn of the session handled by another
+    worker process leaves this one stale until the idle expiry. Only enable it
+    (VYAPAR_T2B_SESSION_CACHE_ENABLED) when every turn of a session is claimed by the same
+    process, e.g. a single scheduler process.
+    """
+    def __init__(self, history_limit: int = 5, max_sessions: int = 10000, idle_seconds: float = 1800):
+        self.history_limit = history_limit
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+        """
+        Get a copy of the cached history and invoice of a session
+
+        Args:
+            session_id: The session id
+
+        Returns:
+            The history and invoice, or None on a miss
+        """
+        state = self._sessions.get(session_id)
+        now = time.monotonic()
+        if state is not None and now - state.touched_at > self.idle_seconds:
+            del self._sessions[session_id]
+            self.evictions += 1
+            state = None
+        if state is None:
+            self.misses += 1
+            return None
+
+        state.touched_at = now
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return list(state.history), copy.deepcopy(state.invoice)
+
+    def put(self, session_id: str, history: List[Dict[str, str]], invoice: Dict[str, Any]):
+        """
+        Cache the state of a session loaded from Mongo
+
+        Args:
+            session_id: The session id
+            history: The history of the session, in chronological order
+            invoice: The latest invoice of the session
+        """
+        self._sessions[session_id] = SessionState(
+            history=deque(history, maxlen=self.history_limit),
+            invoice=copy.deepcopy(invoice or {})
+        )
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    def record_turn(self, session_id: str, user_query: str, question: str, invoice: Dict[str, Any]):
+        """
+        Apply a turn that was written to Mongo to the cached state of its session
+
+        Args:
+            session_id: The session id
+            user_query: The transcription of the turn
+            question: The question the model asked
+            invoice: The invoice written for the turn
+        """
+        state = self._sessions.get(session_id)
+        if state is None:
+            return
+        state.history.append({"user": user_query, "model": question})
+        state.invoice = copy.deepcopy(invoice)
+        state.touched_at = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def invalidate(self, session_id: str):
+        """
+        Drop the cached state of a session, so the next turn reloads it from Mongo
+        """
+        self._sessions.pop(session_id, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - state.touched_at <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the hit/miss counters of the cache
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "sessions": len(self._sessions)
+        }
+
+
+def get_session_state_cache() -> SessionStateCache:
+    """
+    Get the process-wide session state cache
+    """
+    global SESSION_STATE_CACHE
+    if SESSION_STATE_CACHE is None:
+        SESSION_STATE_CACHE = SessionStateCache(
+            max_sessions=env_int("VYAPAR_T2B_SESSION_CACHE_MAX_SESSIONS", 10000),
+            idle_seconds=env_int("VYAPAR_T2B_SESSION_CACHE_IDLE_SECONDS", 1800)
+        )
+        Logger.warn({
+            "message": "Session state cache enabled, turns of a session must all run in this process",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "max_sessions": SESSION_STATE_CACHE.max_sessions,
+                "idle_seconds": SESSION_STATE_CACHE.idle_seconds,
+                "pid": os.getpid()
+            }
+        })
+    return SESSION_STATE_CACHE
@@ -0,0 +1,81 @@
+"""Module to track the cost and benefit of speculative execution in the talk2bill pipeline"""
+from collections import OrderedDict
+from typing import Dict
+from logger.logger import Logger
+
+
+class SpeculationStats:
+    """
+    Latency saved and tokens wasted by running expense extraction alongside intent classification
+
+    Totals are kept per session (bounded to the most recent `max_sessions`) and overall, so
+    the trade-off can be compared before enabling the mode for all traffic.
+    """
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self.totals = self._empty()
+
+    @staticmethod
+    def _empty() -> Dict[str, float]:
+        return {
+            "turns": 0,
+            "hits": 0,
+            "misses": 0,
+            "latency_saved": 0.0,
+            "tokens_wasted": 0
+        }
+
+    def record(
+        self,
+        session_id: str,
+        hit: bool,
+        latency_saved: float = 0.0,
+        tokens_wasted: int = 0
+    ):
+        """
+        Record the outcome of one speculative turn
+
+        Args:
+            session_id: The session of the turn
+            hit: Whether the speculative extraction was used (intent was "expense")
+            latency_saved: Seconds saved compared to running the calls one after the other
+            tokens_wasted: Estimated tokens spent on a discarded extraction
+        """
+        session = self.sessions.pop(session_id, None) or self._empty()
+        self.sessions[session_id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+        for stats in (session, self.totals):
+            stats["turns"] += 1
+            stats["hits" if hit else "misses"] += 1
+            stats["latency_saved"] += latency_saved
+            stats["tokens_wasted"] += tokens_wasted
+
+        Logger.info({
+            "message": "Speculative extraction result",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "session_id": session_id,
+                "hit": hit,
+                "latency_saved": round(latency_saved, 3),
+                "tokens_wasted": tokens_wasted,
+                "session_latency_saved": round(session["latency_saved"], 3),
+                "session_tokens_wasted": session["tokens_wasted"]
+            }
+        })
+
+    def get_session(self, session_id: str) -> Dict[str, float]:
+        """
+        Get the totals of a session
+        """
+        return dict(self.sessions.get(session_id) or self._empty())
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Get the overall totals along with the hit rate
+        """
+        summary = dict(self.totals)
+        summary["hit_rate"] = summary["hits"] / summary["turns"] if summary["turns"] else 0.0
+        return summary
@@ -1,13 +1,30 @@
 """Module to run the talk2bill pipeline"""
 import traceback
+import time
 from datetime import datetime, timezone
+from enum import Enum
 import asyncio
-from typing import List, Dict
-from crons.talk2bill.vyapar.llm_service import LLMService
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from crons.talk2bill.vyapar.llm_service import LLMService, ExtractionMode
+from crons.talk2bill.vyapar.prompt_builder import Talk2BillPromptBuilder
+from crons.talk2bill.vyapar.speculation import SpeculationStats
+from crons.talk2bill.vyapar.tokens import estimate_tokens, estimate_json_tokens
+from crons.talk2bill.vyapar.fast_path import TrivialTurnResolver
+from crons.talk2bill.vyapar.session_cache import (
+    get_session_state_cache,
+    get_document_history,
+    get_newest_invoice
+)
+from crons.talk2bill.vyapar.job_writer import JobUpdateBuffer
+from crons.talk2bill.vyapar.instrumentation import get_instrumentation
+from crons.talk2bill.vyapar.hedging import turn_deadline
+from crons.talk2bill.vyapar.response_models import PipelineStreamChunk
+from crons.talk2bill.vyapar.env import env_str, env_bool, env_int, env_float
 from constants.talk2bill.vyapar.status import Talk2BillStatus
 from constants.talk2bill.vyapar.models import (
     PipelineResponse,
     ExpenseModel,
+    IntentClassificationResponse,
     ConversationStatus
 )
 from logger.logger import Logger
@@ -16,13 +33,51 @@ from models.talk2bill.vyapar import Talk2BillModel as VyaparTalk2BillModel
 
 TALK2BILL_PIPELINE_INSTANCE = None
 
+
+class PipelineMode(str, Enum):
+    """
+    How the LLM calls of a turn are scheduled
+    """
+    # identify_intent -> extract_expense -> ask_question, one after the other
+    CHAIN = "chain"
+    # extract_expense runs alongside identify_intent and is discarded for "other" turns
+    SPECULATIVE = "speculative"
+    # One structured call per turn that classifies, extracts and asks at once
+    UNIFIED = "unified"
+
+
 class Talk2BillPipeline:
     """
     Talk2BillPipeline class to run the talk2bill pipeline
     """
-    def __init__(self):
+    def __init__(self, mode: Optional[str] = None):
         self.llm_service = None
         self._initialized = False
+        self.mode = PipelineMode(mode or env_str("VYAPAR_T2B_PIPELINE_MODE", PipelineMode.CHAIN.value))
+        self.speculation_stats = SpeculationStats()
+        # Resolve trivial replies ("500", "cash", "no") locally before calling the LLM
+        self.fast_path = TrivialTurnResolver() if env_bool("VYAPAR_T2B_FAST_PATH_ENABLED") else None
+        # Keep history and latest invoice of active sessions in memory instead of re-reading Mongo
+        self.session_cache = (
+            get_session_state_cache() if env_bool("VYAPAR_T2B_SESSION_CACHE_ENABLED") else None
+        )
+        self.instrumentation = get_instrumentation()
+        # Seconds shared by the LLM calls of a turn, 0 to bound each call by its own deadline only
+        self.turn_budget = env_float("VYAPAR_T2B_TURN_BUDGET", 0.0)
+        # Batch the job write-backs into bulk writes instead of one update_job per document
+        self.job_writer = None
+        if env_bool("VYAPAR_T2B_JOB_WRITE_BUFFER_ENABLED") and not JobUpdateBuffer.is_supported():
+            Logger.warn({
+                "message": "Job write buffer needs Talk2BillRepository.bulk_update_jobs, writing jobs one by one",
+                "tag": "VyaparTalk2Bill",
+                "data": {}
+            })
+        elif env_bool("VYAPAR_T2B_JOB_WRITE_BUFFER_ENABLED"):
+            self.job_writer = JobUpdateBuffer(
+                max_batch=env_int("VYAPAR_T2B_JOB_WRITE_BATCH_SIZE", 50),
+                flush_interval=env_float("VYAPAR_T2B_JOB_WRITE_FLUSH_INTERVAL", 1.0),
+                on_write_failure=self._on_job_write_failure
+            )
 
     async def initialize(self):
         """
@@ -51,6 +106,42 @@ class Talk2BillPipeline:
             TALK2BILL_PIPELINE_INSTANCE = await cls.create()
         return TALK2BILL_PIPELINE_INSTANCE
 
+    async def write_job_update(self, talk2bill_job: VyaparTalk2BillModel, update: Dict[str, Any]):
+        """
+        Write an update of the job, through the write-behind buffer when it is enabled
+
+        Args:
+            talk2bill_job: The talk2bill job
+            update: The fields to set on the job
+
+        Returns:
+            The result of update_job, None when the update was buffered
+        """
+        if self.job_writer is None:
+            return await Talk2BillRepository.update_job(talk2bill_job, update)
+        await self.job_writer.submit(talk2bill_job, update)
+        return None
+
+    def _on_job_write_failure(self, batch: List[Tuple[VyaparTalk2BillModel, Dict[str, Any]]]):
+        """
+        Forget the cached state of the sessions whose updates could not be written
+        """
+        if self.session_cache is not None:
+            for job, _ in batch:
+                self.session_cache.invalidate(job.sessionId)
+
+    async def flush_job_updates(self):
+        """
+        Write every buffered job update, called before the worker exits
+        """
+        if self.job_writer is not None:
+            await self.job_writer.close()
+            Logger.info({
+                "message": "Flushed talk2bill job updates",
+                "tag": "VyaparTalk2Bill",
+                "data": self.job_writer.metrics()
+            })
+
     async def get_session_history(self, session_id: str, limit: int = 5) -> List[Dict]:
         """
         Get the session history from the mongo collection
@@ -66,85 +157,307 @@ class Talk2BillPipeline:
             session_id,
             limit
         )
-        history = []
+        return get_document_history(documents)
 
-        for doc in documents:
-            history.append({
-            "user": doc.get("transcription", ""),
-            "model": doc.get("modelQuestion", "")
-        })
+    async def get_session_state(self, session_id: str, limit: int = 5) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Get the history and latest invoice of the session
 
-        return history
+        With the session cache enabled, a cached session needs no query and a missing one is
+        loaded with a single query whose newest document provides the latest invoice.
 
+        Args:
+            session_id: The session id
+            limit: The number of history entries
 
-    async def pipeline(self, talk2bill_job: VyaparTalk2BillModel) -> PipelineResponse:
+        Returns:
+            The session history and the latest invoice
         """
-        Pipeline for the talk2bill job
+        if self.session_cache is None:
+            return await asyncio.gather(
+                self.get_session_history(session_id, limit),
+                Talk2BillRepository.find_latest_processed_invoice_by_session(session_id)
+            )
+
+        state = self.session_cache.get(session_id)
+        if state is not None:
+            return state
+        documents = await Talk2BillRepository.find_all_processed_invoices_by_session_with_limit(
+            session_id,
+            limit
+        )
+        history, latest_invoice = get_document_history(documents), get_newest_invoice(documents)
+        self.session_cache.put(session_id, history, latest_invoice)
+        return history, latest_invoice
+
+    async def identify_intent_speculatively(
+        self,
+        session_id: str,
+        user_query: str,
+        latest_history: List[Dict],
+        latest_invoice: Dict[str, Any]
+    ) -> Tuple[IntentClassificationResponse, Optional[ExpenseModel]]:
+        """
+        Identify the intent while extracting the expense at the same time
+
+        The extraction is only used when the intent comes back as "expense", otherwise it is
+        cancelled (or discarded if already done) and its tokens are counted as wasted.
 
         Args:
-            talk2bill_job: The talk2bill job
+            session_id: The session id
+            user_query: The user query
+            latest_history: The history of the conversation
+            latest_invoice: The latest invoice of the session
 
         Returns:
-            The pipeline response
+            The intent response and the extracted expense (None unless the intent is "expense")
         """
-        ref_id = None
+        async def timed_extraction():
+            started_at = time.monotonic()
+            invoice = await self.llm_service.extract_expense(
+                user_query,
+                latest_invoice,
+                latest_history
+            )
+            return invoice, time.monotonic() - started_at
+
+        start_time = time.monotonic()
+        extraction_task = asyncio.create_task(timed_extraction())
         try:
-            user_query = talk2bill_job.transcription
-            session_id = talk2bill_job.sessionId
-            ref_id = talk2bill_job.fileRefId
+            intent_response = await self.llm_service.identify_intent(user_query, latest_history)
+        except BaseException:
+            extraction_task.cancel()
+            raise
+        intent_duration = time.monotonic() - start_time
 
-            latest_history, latest_invoice = await asyncio.gather(
-                self.get_session_history(session_id, 5),
-                Talk2BillRepository.find_latest_processed_invoice_by_session(session_id)
+        if intent_response.intent == "expense":
+            invoice, extraction_duration = await extraction_task
+            elapsed = time.monotonic() - start_time
+            self.speculation_stats.record(
+                session_id,
+                hit=True,
+                latency_saved=max(0.0, intent_duration + extraction_duration - elapsed)
+            )
+            return intent_response, invoice
+
+        # The prompt has been sent either way, the output only if the extraction finished
+        if self.llm_service.extraction_mode == ExtractionMode.DELTA:
+            extraction_prompt = Talk2BillPromptBuilder.build_expense_delta_extraction_prompt(
+                user_query,
+                latest_invoice,
+                latest_history
+            )
+        else:
+            extraction_prompt = Talk2BillPromptBuilder.build_expense_extraction_prompt(
+                user_query,
+                latest_invoice,
+                latest_history,
+                local_category=self.llm_service.categorizer is not None
+            )
+        tokens_wasted = estimate_tokens(extraction_prompt)
+        if extraction_task.done():
+            if not extraction_task.cancelled() and extraction_task.exception() is None:
+                tokens_wasted += estimate_json_tokens(extraction_task.result()[0])
+        else:
+            extraction_task.cancel()
+        self.speculation_stats.record(session_id, hit=False, tokens_wasted=tokens_wasted)
+        return intent_response, None
+
+    @staticmethod
+    def normalize_invoice(invoice: ExpenseModel) -> ExpenseModel:
+        """
+        Convert the item amounts and quantities of the invoice to positive values
+
+        Args:
+            invoice: The extracted invoice
+
+        Returns:
+            The same invoice, updated in place
+        """
+        if invoice.items:
+            for item in invoice.items:
+                if item.item_amount is not None and item.item_amount < 0:
+                    item.item_amount = abs(item.item_amount)
+                if item.item_qty is not None and item.item_qty < 0:
+                    item.item_qty = abs(item.item_qty)
+        return invoice
+
+    async def resolve_intent_and_invoice(
+        self,
+        session_id: str,
+        user_query: str,
+        latest_history: List[Dict],
+        latest_invoice: Dict[str, Any]
+    ) -> Tuple[str, ExpenseModel]:
+        """
+        Identify the intent and, for expenses, extract the invoice (speculatively when enabled)
+
+        Args:
+            session_id: The session id
+            user_query: The user query
+            latest_history: The history of the conversation
+            latest_invoice: The latest invoice of the session
+
+        Returns:
+            The intent and the invoice of the turn
+        """
+        # Identify the intent of the user
+        speculative_invoice = None
+        if self.mode == PipelineMode.SPECULATIVE:
+            intent_response, speculative_invoice = await self.identify_intent_speculatively(
+                session_id,
+                user_query,
+                latest_history,
+                latest_invoice
             )
-            # Identify the intent of the user
+        else:
             intent_response = await self.llm_service.identify_intent(user_query, latest_history)
-            intent = intent_response.intent
-            invoice = ExpenseModel()
-            conversation_status = ConversationStatus.CONTINUE.value
+        intent = intent_response.intent
+        invoice = ExpenseModel()
 
-            if intent == "expense":
-                # Extract the expense from the user query
+        if intent == "expense":
+            # Extract the expense from the user query
+            if speculative_invoice is not None:
+                invoice = speculative_invoice
+            else:
                 invoice = await self.llm_service.extract_expense(
                     user_query,
                     latest_invoice,
                     latest_history
                 )
+            self.normalize_invoice(invoice)
+        return intent, invoice
 
-                # Convert the item amounts and quantities to positive values
-                if invoice.items:
-                    for item in invoice.items:
-                        if item.item_amount is not None and item.item_amount < 0:
-                            item.item_amount = abs(item.item_amount)
-                        if item.item_qty is not None and item.item_qty < 0:
-                            item.item_qty = abs(item.item_qty)
+    async def run_chain_turn(
+        self,
+        session_id: str,
+        user_query: str,
+        latest_history: List[Dict],
+        latest_invoice: Dict[str, Any]
+    ) -> Tuple[str, ExpenseModel, str, str]:
+        """
+        Run the intent -> extract -> ask chain for a turn (speculatively when enabled)
 
-                # Ask a question based on the intent and the invoice
-                question_response = await self.llm_service.ask_question(
-                    user_query,
-                    intent,
-                    invoice=invoice,
-                    history=latest_history
-                )
-                question = question_response.question
-                conversation_status = question_response.status.value
-            else:
-                # Ask a question based on the intent and the history
-                question_response = await self.llm_service.ask_question(
-                    user_query,
-                    intent,
-                    history=latest_history
-                )
-                question = question_response.question
-                conversation_status = question_response.status.value
+        Args:
+            session_id: The session id
+            user_query: The user query
+            latest_history: The history of the conversation
+            latest_invoice: The latest invoice of the session
 
-            if conversation_status == ConversationStatus.COMPLETE.value:
-                status = Talk2BillStatus.INVOICE_READY.value
-            else:
-                status = Talk2BillStatus.T2I_COMPLETED.value
+        Returns:
+            The intent, invoice, question and conversation status of the turn
+        """
+        intent, invoice = await self.resolve_intent_and_invoice(
+            session_id,
+            user_query,
+            latest_history,
+            latest_invoice
+        )
+        if intent == "expense":
+            # Ask a question based on the intent and the invoice
+            question_response = await self.llm_service.ask_question(
+                user_query,
+                intent,
+                invoice=invoice,
+                history=latest_history
+            )
+        else:
+            # Ask a question based on the intent and the history
+            question_response = await self.llm_service.ask_question(
+                user_query,
+                intent,
+                history=latest_history
+            )
+
+        return intent, invoice, question_response.question, question_response.status.value
+
+    async def run_unified_turn(
+        self,
+        user_query: str,
+        latest_history: List[Dict],
+        latest_invoice: Dict[str, Any]
+    ) -> Tuple[str, ExpenseModel, str, str]:
+        """
+        Run a turn with a single structured LLM call
+
+        Args:
+            user_query: The user query
+            latest_history: The history of the conversation
+            latest_invoice: The latest invoice of the session
+
+        Returns:
+            The intent, invoice, question and conversation status of the turn
+        """
+        response = await self.llm_service.process_turn_unified(
+            user_query,
+            latest_invoice,
+            latest_history
+        )
+        # Mirror the chain: "other" turns never carry an invoice
+        invoice = ExpenseModel()
+        if response.intent == "expense":
+            invoice = self.normalize_invoice(response.invoice)
+        return response.intent, invoice, response.question, response.status.value
+
+    async def run_turn(
+        self,
+        session_id: str,
+        user_query: str,
+        latest_history: List[Dict],
+        latest_invoice: Dict[str, Any]
+    ) -> Tuple[str, ExpenseModel, str, str]:
+        """
+        Run the LLM stage of a turn according to the pipeline mode, unless the fast path
+        resolves it locally
+
+        Returns:
+            The intent, invoice, question and conversation status of the turn
+        """
+        if self.fast_path is not None:
+            resolved = self.fast_path.resolve(user_query, latest_history, latest_invoice)
+            if resolved is not None:
+                return resolved.intent, resolved.invoice, resolved.question, resolved.conversation_status
+
+        start_time = time.monotonic()
+        if self.mode == PipelineMode.UNIFIED:
+            result = await self.run_unified_turn(user_query, latest_history, latest_invoice)
+        else:
+            result = await self.run_chain_turn(session_id, user_query, latest_history, latest_invoice)
+        if self.fast_path is not None:
+            self.fast_path.record_llm_turn(time.monotonic() - start_time)
+        return result
 
-            # Update the mongo collection with the invoice and the question
-            result = await Talk2BillRepository.update_job(talk2bill_job, {
+    async def complete_turn(
+        self,
+        talk2bill_job: VyaparTalk2BillModel,
+        intent: str,
+        invoice: ExpenseModel,
+        question: str,
+        conversation_status: str,
+        turn_start_time: float
+    ) -> PipelineResponse:
+        """
+        Write the outcome of a turn to the job and build the pipeline response
+
+        Args:
+            talk2bill_job: The talk2bill job
+            intent: The intent of the turn
+            invoice: The invoice of the turn
+            question: The question asked to the user
+            conversation_status: The conversation status of the turn
+            turn_start_time: The perf_counter value at the start of the turn
+
+        Returns:
+            The pipeline response
+        """
+        if conversation_status == ConversationStatus.COMPLETE.value:
+            status = Talk2BillStatus.INVOICE_READY.value
+        else:
+            status = Talk2BillStatus.T2I_COMPLETED.value
+
+        # Update the mongo collection with the invoice and the question
+        with self.instrumentation.span("update_job"):
+            await self.write_job_update(talk2bill_job, {
                 "status": status,
                 "invoice": invoice.model_dump(),
                 "modelQuestion": question,
@@ -152,26 +465,160 @@ class Talk2BillPipeline:
                 "intent": intent,
                 "updatedAt": datetime.now(timezone.utc)
             })
+        self.instrumentation.record_span("turn", time.perf_counter() - turn_start_time, {
+            "session_id": talk2bill_job.sessionId,
+            "intent": intent
+        })
+        if self.session_cache is not None:
+            self.session_cache.record_turn(
+                talk2bill_job.sessionId,
+                talk2bill_job.transcription,
+                question,
+                invoice.model_dump()
+            )
+        return PipelineResponse(question=question, invoice=invoice, status=conversation_status)
 
-            print("Result of updating job:", result)
-            # Return the pipeline response
-            return PipelineResponse(question=question, invoice=invoice, status=conversation_status)
+    async def fail_turn(self, talk2bill_job: VyaparTalk2BillModel, error: Exception):
+        """
+        Log a failed turn and mark its job as failed
 
-        except Exception as e:
-            Logger.warn({
-                "message": "Failed talk2bill-vyp pipeline",
-                "tag": "VyaparTalk2Bill",
-                "data": {
-                    "ref_id": ref_id,
-                    "session_id": session_id,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }
-            })
+        Args:
+            talk2bill_job: The talk2bill job
+            error: The error that failed the turn
+        """
+        session_id = getattr(talk2bill_job, "sessionId", None)
+        Logger.warn({
+            "message": "Failed talk2bill-vyp pipeline",
+            "tag": "VyaparTalk2Bill",
+            "data": {
+                "ref_id": getattr(talk2bill_job, "fileRefId", None),
+                "session_id": session_id,
+                "error": str(error),
+                "traceback": traceback.format_exc()
+            }
+        })
+        if self.session_cache is not None and session_id:
+            self.session_cache.invalidate(session_id)
 
-            await Talk2BillRepository.update_job(talk2bill_job, {
+        with self.instrumentation.span("update_job", failed=True):
+            await self.write_job_update(talk2bill_job, {
                 "status": Talk2BillStatus.FAILED.value,
                 "updatedAt": datetime.now(timezone.utc),
-                "errorReason": str(e)
+                "errorReason": str(error)
             })
+
+    async def pipeline(self, talk2bill_job: VyaparTalk2BillModel) -> PipelineResponse:
+        """
+        Pipeline for the talk2bill job
+
+        Args:
+            talk2bill_job: The talk2bill job
+
+        Returns:
+            The pipeline response
+        """
+        try:
+            user_query = talk2bill_job.transcription
+            session_id = talk2bill_job.sessionId
+
+            turn_start_time = time.perf_counter()
+            with self.instrumentation.span("mongo_fetch"):
+                latest_history, latest_invoice = await self.get_session_state(session_id, 5)
+            with self.instrumentation.span("llm_turn", mode=self.mode.value), turn_deadline(self.turn_budget):
+                intent, invoice, question, conversation_status = await self.run_turn(
+                    session_id,
+                    user_query,
+                    latest_history,
+                    latest_invoice
+                )
+
+            return await self.complete_turn(
+                talk2bill_job,
+                intent,
+                invoice,
+                question,
+                conversation_status,
+                turn_start_time
+            )
+
+        except Exception as e:
+            await self.fail_turn(talk2bill_job, e)
+            raise e
+
+    async def pipeline_stream(
+        self,
+        talk2bill_job: VyaparTalk2BillModel
+    ) -> AsyncIterator[PipelineStreamChunk]:
+        """
+        Pipeline for the talk2bill job that yields the question as it is generated, so the
+        voice client can start speaking before the turn is complete
+
+        Intent and extraction run as in `pipeline`; the question of chain/speculative turns is
+        streamed from the LLM. Fast-path and unified turns yield their question in one delta.
+        The job is updated before the final chunk, which carries the pipeline response.
+
+        Args:
+            talk2bill_job: The talk2bill job
+
+        Yields:
+            Question deltas, then the final chunk
+        """
+        try:
+            user_query = talk2bill_job.transcription
+            session_id = talk2bill_job.sessionId
+
+            turn_start_time = time.perf_counter()
+            with self.instrumentation.span("mongo_fetch"):
+                latest_history, latest_invoice = await self.get_session_state(session_id, 5)
+
+            resolved = None
+            if self.fast_path is not None:
+                resolved = self.fast_path.resolve(user_query, latest_history, latest_invoice)
+
+            if resolved is not None or self.mode == PipelineMode.UNIFIED:
+                if resolved is not None:
+                    intent, invoice = resolved.intent, resolved.invoice
+                    question, conversation_status = resolved.question, resolved.conversation_status
+                else:
+                    with turn_deadline(self.turn_budget):
+                        intent, invoice, question, conversation_status = await self.run_unified_turn(
+                            user_query,
+                            latest_history,
+                            latest_invoice
+                        )
+                if question:
+                    yield PipelineStreamChunk(delta=question)
+            else:
+                # The question is streamed outside the deadline: its first tokens are already late
+                with turn_deadline(self.turn_budget):
+                    intent, invoice = await self.resolve_intent_and_invoice(
+                        session_id,
+                        user_query,
+                        latest_history,
+                        latest_invoice
+                    )
+                async for chunk in self.llm_service.stream_question(
+                    user_query,
+                    intent,
+                    invoice=invoice if intent == "expense" else None,
+                    history=latest_history
+                ):
+                    if chunk.delta:
+                        yield PipelineStreamChunk(delta=chunk.delta)
+                    if chunk.final:
+                        question, conversation_status = chunk.question, chunk.status.value
+                if self.fast_path is not None:
+                    self.fast_path.record_llm_turn(time.perf_counter() - turn_start_time)
+
+            response = await self.complete_turn(
+                talk2bill_job,
+                intent,
+                invoice,
+                question,
+                conversation_status,
+                turn_start_time
+            )
+        except Exception as e:
+            await self.fail_turn(talk2bill_job, e)
             raise e
+        yield PipelineStreamChunk(final=True, response=response)
@@ -0,0 +1,36 @@
+"""Module to estimate token counts locally for the talk2bill pipeline"""
+import json
+from typing import Any
+
+# Gemini averages roughly four characters per token for our Hinglish/English prompts
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without calling the provider
+
+    Args:
+        text: The text to estimate
+
+    Returns:
+        The estimated number of tokens
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def estimate_json_tokens(value: Any) -> int:
+    """
+    Estimate the number of tokens of a value once serialized as JSON (e.g. a structured response)
+
+    Args:
+        value: A pydantic model, dict or list
+
+    Returns:
+        The estimated number of tokens
+    """
+    if hasattr(value, "model_dump_json"):
+        return estimate_tokens(value.model_dump_json())
+    return estimate_tokens(json.dumps(value, ensure_ascii=False, default=str))
@@ -0,0 +1,171 @@
+"""Module to run talk2bill jobs through a bounded pool of async workers"""
+import asyncio
+import time
+import traceback
+from typing import Awaitable, Callable, List
+from db.mongo.vyapar.talk2bill_repository import Talk2BillRepository
+from logger.logger import Logger
+from models.talk2bill.vyapar import Talk2BillModel
+
+
+class Talk2BillWorkerPool:
+    """
+    Bounded pool of async workers that claims talk2bill jobs and processes them
+
+    A single feeder claims batches with `Talk2BillRepository.get_batch_of_jobs` and
+    pushes them on a queue of size `concurrency`. When the workers are busy (for example
+    because the LLM is slow) the queue fills up and the feeder blocks, so no new jobs are
+    claimed until there is capacity for them.
+    """
+    def __init__(
+        self,
+        process_fn: Callable[[Talk2BillModel], Awaitable],
+        concurrency: int = 8,
+        poll_interval: float = 2.0
+    ):
+        self.process_fn = process_fn
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        self._stop_event = asyncio.Event()
+        self.results: List = []
+        self.docs_claimed = 0
+        self.docs_processed = 0
+        self.docs_failed = 0
+        self._keep_results = False
+
+    def stop(self):
+        """
+        Stop claiming new jobs; jobs already claimed are drained before the pool exits
+        """
+        if not self._stop_event.is_set():
+            Logger.info({
+                "message": "Stopping talk2bill worker pool, draining claimed jobs",
+                "tag": "VyaparTalk2Bill",
+                "data": {
+                    "queued": self._queue.qsize(),
+                    "docs_claimed": self.docs_claimed
+                }
+            })
+        self._stop_event.set()
+
+    async def _wait_for_stop(self, timeout: float) -> bool:
+        """
+        Sleep for `timeout` seconds or until the pool is stopped
+
+        Returns:
+            True if the pool was stopped while waiting
+        """
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _feed(self, once: bool):
+        """
+        Claim batches of jobs and push them on the queue until stopped
+
+        Args:
+            once: Claim a single batch and stop
+        """
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    docs = await Talk2BillRepository.get_batch_of_jobs()
+                except Exception as e:
+                    if once:
+                        raise
+                    Logger.warn({
+                        "message": "Failed to claim batch of talk2bill jobs",
+                        "tag": "VyaparTalk2Bill",
+                        "data": {
+                            "error": str(e),
+                            "traceback": traceback.format_exc()
+                        }
+                    })
+                    docs = []
+
+                for document in docs:
+                    # Blocks while all workers are busy and the queue is full
+                    await self._queue.put(document)
+                    self.docs_claimed += 1
+
+                if once:
+                    break
+                if not docs and await self._wait_for_stop(self.poll_interval):
+                    break
+        finally:
+            for _ in range(self.concurrency):
+                await self._queue.put(None)
+
+    async def _work(self, worker_id: int):
+        """
+        Process jobs from the queue until the feeder signals the end of the stream
+
+        Args:
+            worker_id: The index of the worker, used for logging
+        """
+        while True:
+            document = await self._queue.get()
+            try:
+                if document is None:
+                    return
+                start_time = time.monotonic()
+                result = await self.process_fn(document)
+                self.docs_processed += 1
+                if self._keep_results:
+                    self.results.append(result)
+                Logger.info({
+                    "message": "Worker finished document",
+                    "tag": "VyaparTalk2Bill",
+                    "data": {
+                        "worker_id": worker_id,
+                        "session_id": document.sessionId,
+                        "ref_id": document.fileRefId,
+                        "duration": round(time.monotonic() - start_time, 3)
+                    }
+                })
+            except Exception as e:
+                # The pipeline has already marked the job as failed, keep the worker alive
+                self.docs_failed += 1
+                Logger.warn({
+                    "message": "Worker failed to process document",
+                    "tag": "VyaparTalk2Bill",
+                    "data": {
+                        "worker_id": worker_id,
+                        "session_id": document.sessionId,
+                        "ref_id": document.fileRefId,
+                        "error": str(e),
+                        "traceback": traceback.format_exc()
+                    }
+                })
+            finally:
+                self._queue.task_done()
+
+    async def run(self, once: bool = False) -> List:
+        """
+        Run the pool until stopped (or until a single batch is done when `once` is set)
+
+        Args:
+            once: Process a single batch and exit, as the cron path does
+
+        Returns:
+            The results of the successfully processed documents (only kept when `once` is set,
+            a long-running pool would otherwise grow without bound)
+        """
+        self._keep_results = once
+        workers = [
+            asyncio.create_task(self._work(worker_id))
+            for worker_id in range(self.concurrency)
+        ]
+        feeder = asyncio.create_task(self._feed(once))
+        try:
+            await asyncio.gather(feeder, *workers)
+        except asyncio.CancelledError:
+            feeder.cancel()
+            for worker in workers:
+                worker.cancel()
+            raise
+        return self.results
+